@@ -1,7 +1,7 @@
 
 
-from .interactions import compute_interactions
+from .interactions import compute_interactions, replay_interactions
 
 
-__all__ = ['compute_interactions']
+__all__ = ['compute_interactions', 'replay_interactions']
 
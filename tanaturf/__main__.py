@@ -23,15 +23,23 @@
 # Imports
 import argparse
 from twitter.TwitterConnector import TwitterConnector
+from twitter.ProfileCache import ProfileCache
+from twitter.TweetArchive import TweetArchive
+from twitter.ArchiveConnector import ArchiveConnector
+from twitter.DepthController import DepthController
 from neo4j.Neo4jConnector import Neo4jConnector
+from storage.SQLiteConnector import SQLiteConnector
+from storage.SnapshotStore import SnapshotStore
+from storage.CrawlFrontier import CrawlFrontier
+from storage.CrawlPrioritizer import CrawlPrioritizer
 import tools
 import time
 import tweepy.error
 from tld import get_tld
 from random import shuffle
 import neo4jrestclient.exceptions
-from tanaturf import compute_interactions
-from following import compute_following
+from tanaturf import compute_interactions, replay_interactions
+from following import compute_following, compute_following_ids
 
 
 
@@ -55,10 +63,33 @@ if __name__ == "__main__":
     parser.add_argument("--auth-token2", type=str, help="Token d'authentification 2 Twitter", required=True)
     parser.add_argument("--access-token1", type=str, help="Token d'accès 1 Twitter", required=True)
     parser.add_argument("--access-token2", type=str, help="Token d'accès 2 Twitter", required=True)
+    parser.add_argument("--credentials", type=str,
+                        help="Fichier d'autres jeux de tokens Twitter, quatre tokens par ligne", default="")
+    parser.add_argument("--profile-cache", type=str, help="Fichier du cache des profils Twitter (aucun par défaut)",
+                        default="")
+    parser.add_argument("--profile-ttl", type=float, help="Durée de validité d'un profil en cache (heures)",
+                        default=168.0)
+    parser.add_argument("--profile-cache-size", type=int, help="Nombre de profils gardés en mémoire", default=10000)
+    parser.add_argument("--tweet-archive", type=str,
+                        help="Dossier d'archive des pages de tweets brutes (vide pour désactiver)", default="")
+    parser.add_argument("--archive-segment-size", type=int, help="Taille d'un segment de l'archive (Mo)", default=32)
+    parser.add_argument("--workers", type=int, help="Nombre de threads de lecture des timelines et des followers",
+                        default=4)
+    parser.add_argument("--queue-size", type=int,
+                        help="Nombre de pages lues en attente d'écriture avant que les threads de lecture attendent",
+                        default=16)
 
-    # Information Neo4j
-    parser.add_argument("--neo4j-user", type=str, help="Utilisateur de la base Neo4j", required=True)
-    parser.add_argument("--neo4j-password", type=str, help="Password de la base Neo4j", required=True)
+    # Information base de données
+    parser.add_argument("--backend", type=str, choices=["neo4j", "sqlite"], help="Stockage du graphe",
+                        default="neo4j")
+    parser.add_argument("--neo4j-user", type=str, help="Utilisateur de la base Neo4j", default="")
+    parser.add_argument("--neo4j-password", type=str, help="Password de la base Neo4j", default="")
+    parser.add_argument("--sqlite-db", type=str, help="Fichier de la base SQLite", default="tanaturf.db")
+    parser.add_argument("--page-size", type=int, help="Nombre de noeuds chargés par page", default=1000)
+    parser.add_argument("--flush-size", type=int, help="Nombre de liens en attente avant écriture dans la base",
+                        default=1000)
+    parser.add_argument("--flush-delay", type=float, help="Délai maximum entre deux écritures dans la base (secondes)",
+                        default=30.0)
 
     # Options
     parser.add_argument("--root-users", type=str, help="Les comptes Twitter d'entrée", required=False, default="")
@@ -69,9 +100,18 @@ if __name__ == "__main__":
     parser.add_argument("--lang", type=str, help="Lang (fr,en,etc)", default='fr')
     parser.add_argument("--min-followers", type=int, help="Minimum number of followers", default=100)
     parser.add_argument("--min-tweets", type=int, help="Minimum number of tweets", default=1000)
-    parser.add_argument("--max-twitter-users", type=int, help="Minimum number of tweets", default=10000)
+    parser.add_argument("--max-twitter-users", type=int, help="Nombre maximum d'utilisateurs Twitter parcourus",
+                        default=10000)
     parser.add_argument("--only-root", action='store_true', help="Mettre à jour seulement les utilisateurs contenus dans le fichier root", default=False)
     parser.add_argument("--depth", type=int, help="Combien de page analyser par utilisateur", default=1)
+    parser.add_argument("--adaptive-depth", action='store_true',
+                        help="Lire la page suivante d'une timeline seulement si la précédente a apporté assez de liens "
+                             "nouveaux (--depth reste le maximum)",
+                        default=False)
+    parser.add_argument("--min-yield", type=float,
+                        help="Nombre minimum de liens nouveaux par tweet pour lire la page suivante", default=0.05)
+    parser.add_argument("--page-budget", type=int, help="Nombre maximum de pages de timeline lues (-1 sans limite)",
+                        default=-1)
     parser.add_argument("--classe", type=str, help="Classe des nouveaux noeuds", default='')
     parser.add_argument("--min-user-inputs", type=int, help="Nombre minimum de liens entrants par utilisateurs",
                         default=2)
@@ -79,32 +119,125 @@ if __name__ == "__main__":
                         default=2)
     parser.add_argument("--min-hashtag-inputs", type=int, help="Nombre minimum de liens entrants par hashtag",
                         default=2)
+    parser.add_argument("--keep-classified", action='store_true',
+                        help="Ne jamais effacer les utilisateurs ayant une classe", default=False)
+    parser.add_argument("--dry-run", action='store_true',
+                        help="Calculer les statistiques des poids ou les noeuds à effacer sans écrire",
+                        default=False)
+    parser.add_argument("--all-weights", action='store_true',
+                        help="Recalculer tous les poids, pas seulement ceux des noeuds modifiés", default=False)
+    parser.add_argument("--weights-batch-size", type=int, help="Nombre de noeuds par requête de calcul des poids",
+                        default=10000)
+    parser.add_argument("--clean-batch-size", type=int, help="Nombre de noeuds effacés ou fusionnés par transaction",
+                        default=1000)
 
     # Action
     parser.add_argument("--add-users", action='store_true', help="Ajouter des utilisateurs Twitter", default=False)
     parser.add_argument("--add-hashtags", action='store_true', help="Ajouter des hashtags et les utilisateurs liés", default=False)
     parser.add_argument("--clean", action='store_true', help="Effacer les liens et noeuds inutiles", default=False)
     parser.add_argument("--followers", action='store_true', help="Mettre à jour les liens \"following\"", default=False)
+    parser.add_argument("--following-mode", type=str, choices=["list", "followers-ids", "friends-ids"],
+                        help="Liste des followers, ou identifiants des followers/amis croisés avec les comptes connus",
+                        default="list")
+    parser.add_argument("--hydrate-strangers", action='store_true',
+                        help="Ajouter les comptes inconnus trouvés par identifiant", default=False)
+    parser.add_argument("--follower-snapshots", type=str,
+                        help="Dossier des identifiants de la dernière exécution, seules les différences sont écrites "
+                             "(aucun par défaut, tout est écrit)",
+                        default="")
     parser.add_argument("--retweets", action='store_true', help="Mettre à jour les liens \"retweet\"", default=False)
+    parser.add_argument("--retweet-budget", type=int,
+                        help="Nombre maximum de tweets par utilisateur dont on cherche les retweeteurs (-1 pour tous)",
+                        default=10)
     parser.add_argument("--tweets", action='store_true', help="Mettre à jour les liens \"tweets\"", default=False)
     parser.add_argument("--quotes", action='store_true', help="Mettre à jour les liens \"quoted\"", default=False)
     parser.add_argument("--hashtags", action='store_true', help="Mettre à jour les liens \"hashtaged\"", default=False)
     parser.add_argument("--compute-weights", action='store_true', help="",
                         default=False)
+    parser.add_argument("--frontier", type=str,
+                        help="Fichier de l'état du parcours des utilisateurs (aucun par défaut)",
+                        default="")
+    parser.add_argument("--resume", action='store_true',
+                        help="Reprendre le parcours là où la dernière exécution s'est arrêtée", default=False)
+    parser.add_argument("--crawl-order", type=str, choices=["priority", "random"],
+                        help="Utilisateurs les plus liés au graphe d'abord (charge tous les utilisateurs et relations "
+                             "au démarrage), ou ordre aléatoire sur tous les utilisateurs", default="priority")
+    parser.add_argument("--max-api-calls", type=int,
+                        help="Nombre d'appels à l'API après lequel plus aucun utilisateur n'est parcouru (-1 sans limite)",
+                        default=-1)
+    parser.add_argument("--worker", type=str,
+                        help="Nom du processus, pour parcourir le fichier d'état avec d'autres processus "
+                             "(chacun avec ses propres tokens)",
+                        default="")
+    parser.add_argument("--lease", type=float,
+                        help="Délai après lequel les utilisateurs d'un processus arrêté sont repris (secondes)",
+                        default=600.0)
+    parser.add_argument("--max-retries", type=int, help="Nombre d'échecs avant d'abandonner un utilisateur",
+                        default=3)
+    parser.add_argument("--replay", action='store_true',
+                        help="Rejouer les interactions de l'archive des tweets sans appeler Twitter, seulement les "
+                             "tweets postérieurs au dernier tweet lu de chaque utilisateur", default=False)
+    parser.add_argument("--replay-from-scratch", action='store_true',
+                        help="Rejouer tous les tweets de l'archive, dans une base où aucune timeline n'a été lue "
+                             "(par exemple avec d'autres seuils ou --hashtags)", default=False)
+    parser.add_argument("--replay-workers", type=int,
+                        help="Nombre de processus de lecture de l'archive (0 pour le nombre de CPU)", default=0)
 
     # Parse
     args = parser.parse_args()
+    args.replay = args.replay or args.replay_from_scratch
+
+    # Workers share the crawl through the frontier
+    if args.worker != "" and args.frontier == "":
+        parser.error(u"--worker a besoin de --frontier")
+    # end if
+
+    # Archive of raw timeline pages
+    if args.tweet_archive != "":
+        tweet_archive = TweetArchive(
+            args.tweet_archive,
+            segment_size=args.archive_segment_size * 1024 * 1024,
+            name=args.worker if args.worker != "" else None
+        )
+    else:
+        tweet_archive = None
+    # end if
 
     # Connection to Twitter
     twitter_connector = TwitterConnector(
         auth_token1=args.auth_token1,
         auth_token2=args.auth_token2,
         access_token1=args.access_token1,
-        access_token2=args.access_token2
+        access_token2=args.access_token2,
+        profile_cache=args.profile_cache if args.profile_cache != "" else None,
+        profile_ttl=args.profile_ttl * 3600.0,
+        profile_cache_size=args.profile_cache_size,
+        credentials=tools.credentials_file(args.credentials) if args.credentials != "" else None,
+        archive=tweet_archive if not args.replay else None
     )
 
-    # Connection to Neo4J
-    neo4j_connector = Neo4jConnector(user=args.neo4j_user, password=args.neo4j_password)
+    # Connection to the graph storage
+    if args.backend == "sqlite":
+        neo4j_connector = SQLiteConnector(args.sqlite_db, page_size=args.page_size)
+    else:
+        neo4j_connector = Neo4jConnector(
+            user=args.neo4j_user,
+            password=args.neo4j_password,
+            flush_size=args.flush_size,
+            flush_delay=args.flush_delay,
+            page_size=args.page_size
+        )
+    # end if
+
+    # Unique keys and indexes, one worker at a time when several share the crawl frontier, so that only the first
+    # one merges duplicates and creates the constraints
+    if args.worker != "":
+        schema_lock = CrawlFrontier(args.frontier)
+        schema_lock.exclusively(neo4j_connector.ensure_schema, batch_size=args.clean_batch_size)
+        schema_lock.close()
+    else:
+        neo4j_connector.ensure_schema(batch_size=args.clean_batch_size)
+    # end if
 
     # Load roots
     root_user_nodes = None
@@ -127,6 +260,7 @@ if __name__ == "__main__":
                     statuses_count=root_tweets,
                     url=root_url,
                     localisation=author_localisation,
+                    user_id=user.id,
                     classe=args.classe,
                 )
                 root_user_nodes.append(user_node)
@@ -136,44 +270,142 @@ if __name__ == "__main__":
         # end for
     # end if
 
-    # Add users
-    if args.add_users:
-        exit()
-    # Clean
-    elif args.clean:
-        # Clean lone wolf
-        neo4j_connector.clean_lone_wolves(args.min_user_inputs, args.min_website_inputs, args.min_hashtag_inputs)
-    # Compute weights
-    elif args.compute_weights:
+    # Write relationships of root users
+    neo4j_connector.flush()
+
+    # Last archive segment closed even if the run is interrupted
+    try:
+        # Add users
+        if args.add_users:
+            exit()
+        # Clean
+        elif args.clean:
+            # Clean lone wolf
+            neo4j_connector.clean_lone_wolves(
+                args.min_user_inputs,
+                args.min_website_inputs,
+                args.min_hashtag_inputs,
+                batch_size=args.clean_batch_size,
+                dry_run=args.dry_run,
+                keep_classified=args.keep_classified
+            )
         # Compute weights
-        neo4j_connector.compute_weights()
-    else:
-        # Interactions
-        compute_interactions(
-            neo4j_connector,
-            twitter_connector,
-            args.min_followers,
-            args.min_tweets,
-            args.depth,
-            args.retweets,
-            args.tweets,
-            args.quotes,
-            args.hashtags,
-            root_user_nodes if root_user_nodes is not None else None
-        )
+        elif args.compute_weights:
+            # Compute weights
+            weight_statistics = neo4j_connector.compute_weights(
+                dry_run=args.dry_run,
+                batch_size=args.weights_batch_size,
+                incremental=not args.all_weights
+            )
+
+            # Show statistics
+            for relation_type, statistics in sorted(weight_statistics.items()):
+                print(u"{} : {} relationships, min {}, max {}, mean {}".format(
+                    relation_type,
+                    statistics['count'],
+                    statistics['min'],
+                    statistics['max'],
+                    statistics['mean']
+                ))
+            # end for
+        # Replay archived interactions
+        elif args.replay:
+            # Archive needed
+            if tweet_archive is None:
+                print(u"No tweet archive to replay")
+                exit()
+            # end if
 
-        # Following
-        if args.followers:
-            compute_following(
+            # Users from the profile cache only
+            replay_connector = ArchiveConnector(
+                tweet_archive,
+                profile_cache=ProfileCache(
+                    args.profile_cache,
+                    ttl=args.profile_ttl * 3600.0,
+                    size=args.profile_cache_size,
+                    parse=lambda data: tweepy.models.User.parse(None, data)
+                ) if args.profile_cache != "" else None,
+                workers=args.replay_workers if args.replay_workers > 0 else None
+            )
+
+            # Replay
+            replay_interactions(
+                neo4j_connector,
+                replay_connector,
+                args.min_followers,
+                args.min_tweets,
+                args.retweets,
+                args.tweets,
+                args.quotes,
+                args.hashtags,
+                from_scratch=args.replay_from_scratch
+            )
+        else:
+            # Interactions
+            compute_interactions(
                 neo4j_connector,
                 twitter_connector,
                 args.min_followers,
                 args.min_tweets,
-                args.max_twitter_users
+                args.depth,
+                args.retweets,
+                args.tweets,
+                args.quotes,
+                args.hashtags,
+                root_user_nodes if root_user_nodes is not None else None,
+                retweet_budget=args.retweet_budget,
+                workers=args.workers,
+                queue_size=args.queue_size,
+                frontier=CrawlFrontier(args.frontier, max_retries=args.max_retries) if args.frontier != "" else None,
+                resume=args.resume,
+                prioritizer=CrawlPrioritizer() if args.crawl_order == "priority" else None,
+                max_users=args.max_twitter_users,
+                api_budget=args.max_api_calls,
+                worker=args.worker if args.worker != "" else None,
+                lease=args.lease,
+                depth_controller=DepthController(
+                    min_yield=args.min_yield,
+                    max_pages=args.depth + 1 if args.depth != -1 else -1,
+                    page_budget=args.page_budget
+                ) if args.adaptive_depth else None
             )
+
+            # Following
+            if args.followers and args.following_mode == "list":
+                compute_following(
+                    neo4j_connector,
+                    twitter_connector,
+                    args.min_followers,
+                    args.min_tweets,
+                    args.max_twitter_users
+                )
+            elif args.followers:
+                compute_following_ids(
+                    neo4j_connector,
+                    twitter_connector,
+                    args.min_followers,
+                    args.min_tweets,
+                    friends=args.following_mode == "friends-ids",
+                    hydrate_strangers=args.hydrate_strangers,
+                    snapshots=SnapshotStore(args.follower_snapshots) if args.follower_snapshots != "" else None,
+                    workers=args.workers,
+                    queue_size=args.queue_size
+                )
+            # end if
+
+            # Load
+            print(u"End with {} users and {} web sites".format(
+                neo4j_connector.n_user_node,
+                neo4j_connector.n_website_node
+            ))
         # end if
+    finally:
+        # Close the last archive segment
+        if tweet_archive is not None:
+            tweet_archive.close()
+        # end if
+    # end try
 
-        # Load
-        print(u"End with {} users and {} web sites".format(neo4j_connector.n_user_node, neo4j_connector.n_website_node))
-    # end if
+    # Statement statistics
+    neo4j_connector.print_query_statistics()
 # end if
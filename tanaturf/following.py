@@ -21,15 +21,74 @@
 #
 
 # Imports
+import functools
 import tools
 import time
 import tweepy.error
+from storage.SnapshotStore import diff_sorted
+from twitter.PageFetcher import PageFetcher
 from tld import get_tld
 from random import shuffle
 import neo4jrestclient.exceptions
 import tweepy.error
 
 
+# Add the followers of a user
+def add_followers(neo4j_connector, twitter_connector, min_followers, min_tweets, user, twitter_user):
+    """
+    Add the followers of a user, once its profile is resolved
+    :param neo4j_connector:
+    :param twitter_connector:
+    :param min_followers:
+    :param min_tweets:
+    :param user: User node
+    :param twitter_user: Twitter user object, None if not found
+    :return:
+    """
+    # Unknown user
+    if twitter_user is None:
+        print(u"Unknown user {}".format(user.screen_name))
+        return
+    # end if
+
+    # Try
+    try:
+        # Each follower
+        for page in twitter_connector.get_followers(twitter_user):
+            for follower in page:
+                # Properties
+                author_name, n_followers, n_tweets, author_url, author_country = tools.get_user_info(
+                    follower)
+
+                # Add if not exists
+                if n_followers >= min_followers and n_tweets >= min_tweets:
+                    follower_node = neo4j_connector.add_user_node(
+                        screen_name=author_name,
+                        followers_count=n_followers,
+                        statuses_count=n_tweets,
+                        url=author_url,
+                        localisation=author_country,
+                        user_id=follower.id
+                    )
+
+                    # Relationship
+                    neo4j_connector.follow_relationship(user, follower_node)
+                # end if
+            # end for
+        # end for
+    except tweepy.error.TweepError as e:
+        print(e)
+        pass
+    # end try
+
+    # Write buffered relationships
+    neo4j_connector.flush()
+
+    # Log
+    print(u"Done with {}".format(user.screen_name))
+# end add_followers
+
+
 # Compute following
 def compute_following(neo4j_connector, twitter_connector, min_followers, min_tweets, max_twitter_users):
     """
@@ -41,48 +100,251 @@ def compute_following(neo4j_connector, twitter_connector, min_followers, min_twe
     :param max_twitter_users:
     :return:
     """
-    # Current list of users
-    current_nodes = list(neo4j_connector.users)
-    shuffle(current_nodes)
+    # Current users, streamed page by page
+    current_nodes = tools.shuffled_stream(neo4j_connector.iter_node_pages("TwitterUser"))
 
-    # For each root user
+    # For each root user, profiles are looked up by batch
     for index, user in enumerate(current_nodes):
         # Log
-        print(u"On {}".format(user.get('screen_name')))
+        print(u"On {}".format(user.screen_name))
 
         # Try
         try:
-            # Get twitter user
-            twitter_user = twitter_connector.get_user(user.get('screen_name'))
-
-            # Each follower
-            for page in twitter_connector.get_followers(twitter_user):
-                for follower in page:
-                    # Properties
-                    author_name, n_followers, n_tweets, author_url, author_country = tools.get_user_info(
-                        follower)
-
-                    # Add if not exists
-                    if n_followers >= min_followers and n_tweets >= min_tweets:
-                        follower_node = neo4j_connector.add_user_node(
-                            screen_name=author_name,
-                            followers_count=n_followers,
-                            statuses_count=n_tweets,
-                            url=author_url,
-                            localisation=author_country
-                        )
-
-                        # Relationship
-                        neo4j_connector.follow_relationship(user, follower_node)
+            twitter_connector.hydrate_user(
+                functools.partial(add_followers, neo4j_connector, twitter_connector, min_followers, min_tweets, user),
+                screen_name=user.screen_name
+            )
+        except tweepy.error.TweepError as e:
+            print(e)
+            pass
+        # end try
+    # end for
+
+    # Users left
+    try:
+        twitter_connector.flush_hydration()
+    except tweepy.error.TweepError as e:
+        print(e)
+        pass
+    # end try
+
+    # Write what is left after an error
+    neo4j_connector.flush()
+# end compute_following
+
+
+# Add a stranger following or followed by a known user
+def add_stranger(neo4j_connector, user_index, min_followers, min_tweets, user, follower, twitter_user):
+    """
+    Add a stranger and its FOLLOW relationship, once its profile is resolved
+    :param neo4j_connector:
+    :param user_index: Dictionary (Twitter user id -> user node)
+    :param min_followers:
+    :param min_tweets:
+    :param user: Known user node, followed user if follower is True
+    :param follower: Is the stranger the follower?
+    :param twitter_user: Twitter user object of the stranger, None if not found
+    :return:
+    """
+    # Unknown user
+    if twitter_user is None:
+        return
+    # end if
+
+    # Properties
+    author_name, n_followers, n_tweets, author_url, author_country = tools.get_user_info(twitter_user)
+
+    # Add if not exists
+    if n_followers >= min_followers and n_tweets >= min_tweets:
+        stranger_node = neo4j_connector.add_user_node(
+            screen_name=author_name,
+            followers_count=n_followers,
+            statuses_count=n_tweets,
+            url=author_url,
+            localisation=author_country,
+            user_id=twitter_user.id
+        )
+
+        # Relationship
+        if stranger_node is not None:
+            user_index[twitter_user.id] = stranger_node
+            if follower:
+                neo4j_connector.follow_relationship(user, stranger_node)
+            else:
+                neo4j_connector.follow_relationship(stranger_node, user)
+            # end if
+        # end if
+    # end if
+# end add_stranger
+
+
+# Remember the Twitter user id of a user node
+def set_user_id(neo4j_connector, user_index, user, twitter_user):
+    """
+    Remember the Twitter user id of a user node, once its profile is resolved
+    :param neo4j_connector:
+    :param user_index: Dictionary (Twitter user id -> user node)
+    :param user: User node
+    :param twitter_user: Twitter user object, None if not found
+    :return:
+    """
+    if twitter_user is not None:
+        neo4j_connector.set_node_properties(user, user_id=twitter_user.id)
+        user_index[twitter_user.id] = user
+    # end if
+# end set_user_id
+
+
+# Compute following with the ids endpoints
+def compute_following_ids(neo4j_connector, twitter_connector, min_followers, min_tweets, friends=False,
+                          hydrate_strangers=False, snapshots=None, workers=1, queue_size=16):
+    """
+    Compute FOLLOW relationships among known users, paging follower (or friend) ids
+    5000 at a time and keeping those found in the local Twitter user id index
+    :param neo4j_connector:
+    :param twitter_connector:
+    :param min_followers: Minimum number of followers of added strangers
+    :param min_tweets: Minimum number of tweets of added strangers
+    :param friends: Page friend ids instead of follower ids
+    :param hydrate_strangers: Look strangers up by batch and add those above the thresholds
+    :param snapshots: SnapshotStore of the ids of the last run, only the differences are written (None for all)
+    :param workers: Number of fetcher threads
+    :param queue_size: Number of fetched pages waiting for the writer above which fetchers wait
+    :return:
+    """
+    # Snapshot prefix
+    prefix = u"friends" if friends else u"followers"
+
+    # Local index
+    user_index, missing = neo4j_connector.user_id_index()
+    print(u"{} users with Twitter id, {} to look up".format(len(user_index), len(missing)))
+
+    # Look up missing ids by batch
+    for user in missing:
+        twitter_connector.hydrate_user(
+            functools.partial(set_user_id, neo4j_connector, user_index, user),
+            screen_name=user.screen_name
+        )
+    # end for
+    twitter_connector.flush_hydration()
+
+    # Known users
+    known_users = list(user_index.items())
+
+    # Users known since the last run, their edges are not in the snapshots yet
+    if snapshots is not None:
+        known_ids = sorted(user_index.keys())
+        newly_known = set(diff_sorted(snapshots.load(u"{}-known".format(prefix)), known_ids)[0])
+        print(u"{} users known since the last run".format(len(newly_known)))
+    else:
+        newly_known = set()
+    # end if
+
+    # Pages of ids, fetched by worker threads
+    fetcher = PageFetcher(workers=workers, queue_size=queue_size)
+    if friends:
+        request = lambda known_user: twitter_connector.get_friend_ids(user_id=known_user[0])
+    else:
+        request = lambda known_user: twitter_connector.get_follower_ids(user_id=known_user[0])
+    # end if
+    pages = fetcher.stream(known_users, request)
+
+    # Ids of the users being fetched
+    fetched_ids = dict()
+
+    # For each fetched page
+    index = 0
+    for (user_id, user), page, error in pages:
+        # All ids
+        ids = fetched_ids.setdefault(user_id, set())
+        if page is not None:
+            ids.update(page)
+            continue
+        # end if
+        del fetched_ids[user_id]
+
+        # Log
+        index += 1
+        print(u"On {} ({}/{})".format(user.screen_name, index, len(known_users)))
+
+        # Try
+        try:
+            # Failed
+            if error is not None:
+                raise error
+            # end if
+            ids.discard(user_id)
+
+            # Differences with the last run
+            if snapshots is not None:
+                snapshot_name = u"{}-{}".format(prefix, user_id)
+                added, removed, kept = diff_sorted(snapshots.load(snapshot_name), sorted(ids))
+                added.extend([other_id for other_id in kept if other_id in newly_known])
+                print(u"{} added, {} removed".format(len(added), len(removed)))
+            else:
+                added, removed = list(ids), list()
+            # end if
+
+            # Removed edges
+            for other_id in removed:
+                other_node = user_index.get(other_id)
+                if other_node is not None and friends:
+                    neo4j_connector.remove_follow_relationship(other_node, user)
+                elif other_node is not None:
+                    neo4j_connector.remove_follow_relationship(user, other_node)
+                # end if
+            # end for
+
+            # New edges
+            for other_id in added:
+                # Known user
+                other_node = user_index.get(other_id)
+                if other_node is not None:
+                    if friends:
+                        neo4j_connector.follow_relationship(other_node, user)
+                    else:
+                        neo4j_connector.follow_relationship(user, other_node)
                     # end if
-                # end for
+                elif hydrate_strangers:
+                    twitter_connector.hydrate_user(
+                        functools.partial(
+                            add_stranger,
+                            neo4j_connector,
+                            user_index,
+                            min_followers,
+                            min_tweets,
+                            user,
+                            not friends
+                        ),
+                        user_id=other_id
+                    )
+                # end if
             # end for
+
+            # Strangers left
+            twitter_connector.flush_hydration()
+
+            # Write buffered relationships
+            neo4j_connector.flush()
+
+            # Remember ids once written
+            if snapshots is not None:
+                snapshots.save(snapshot_name, ids)
+            # end if
         except tweepy.error.TweepError as e:
             print(e)
             pass
         # end try
 
-        # Log
-        print(u"Done with {}".format(user.get('screen_name')))
+        # Write what is left after an error
+        neo4j_connector.flush()
     # end for
-# end compute_following
+
+    # Stop fetchers
+    fetcher.close()
+
+    # Remember users known at the start of this run
+    if snapshots is not None:
+        snapshots.save(u"{}-known".format(prefix), known_ids)
+    # end if
+# end compute_following_ids
@@ -21,18 +21,623 @@
 #
 
 # Imports
+import functools
+import itertools
 import tools
 import time
 import tweepy.error
 from tld import get_tld
 from random import shuffle
 import neo4jrestclient.exceptions
+from twitter.PageFetcher import PageFetcher
+
+
+# Add a quoted user
+def add_quoted_user(neo4j_connector, author_node, min_followers, min_tweets, quoted_twitter_user):
+    """
+    Add a quoted user and its QUOTED relationship, once its profile is resolved
+    :param neo4j_connector:
+    :param author_node:
+    :param min_followers:
+    :param min_tweets:
+    :param quoted_twitter_user: Twitter user object, None if not found
+    :return:
+    """
+    # Unknown user
+    if quoted_twitter_user is None:
+        return
+    # end if
+
+    # Properties
+    author_name, n_followers, n_tweets, author_url, author_country = tools.get_user_info(quoted_twitter_user)
+
+    # Add if not exists
+    if n_followers >= min_followers and n_tweets >= min_tweets and author_name != author_node.screen_name:
+        quoted_user_node = neo4j_connector.add_user_node(
+            screen_name=author_name,
+            followers_count=n_followers,
+            statuses_count=n_tweets,
+            url=author_url,
+            localisation=author_country,
+            user_id=quoted_twitter_user.id
+        )
+
+        # Relationship
+        if quoted_user_node is not None:
+            neo4j_connector.quoted_relationship(author_node, quoted_user_node)
+        # end if
+    # end if
+# end add_quoted_user
+
+
+# Add a retweeted user
+def add_retweeted_user(neo4j_connector, author_node, min_followers, min_tweets, target_twitter_user):
+    """
+    Add a retweeted user and its RETWEETED relationship
+    :param neo4j_connector:
+    :param author_node:
+    :param min_followers:
+    :param min_tweets:
+    :param target_twitter_user: Twitter user object, None if not found
+    :return:
+    """
+    # Unknown user
+    if target_twitter_user is None:
+        return
+    # end if
+
+    # Properties
+    author_name, n_followers, n_tweets, author_url, author_country = tools.get_user_info(target_twitter_user)
+
+    # Add if not exists
+    if n_followers >= min_followers and n_tweets >= min_tweets and author_name != author_node.screen_name:
+        target_user = neo4j_connector.add_user_node(
+            screen_name=author_name,
+            followers_count=n_followers,
+            statuses_count=n_tweets,
+            url=author_url,
+            localisation=author_country,
+            user_id=target_twitter_user.id
+        )
+
+        # Relationship
+        if target_user is not None:
+            neo4j_connector.retweet_relationship(author_node, target_user)
+        # end if
+    # end if
+# end add_retweeted_user
+
+
+# Add a retweeter
+def add_retweeter(neo4j_connector, author_node, min_followers, min_tweets, retweeter_twitter_user):
+    """
+    Add a retweeter and its RETWEETED relationship
+    :param neo4j_connector:
+    :param author_node:
+    :param min_followers:
+    :param min_tweets:
+    :param retweeter_twitter_user: Twitter user object, None if not found
+    :return:
+    """
+    # Unknown user
+    if retweeter_twitter_user is None:
+        return
+    # end if
+
+    # Properties
+    author_name, n_followers, n_tweets, author_url, author_country = tools.get_user_info(retweeter_twitter_user)
+
+    # Add if not exists
+    if n_followers >= min_followers and n_tweets >= min_tweets and author_name != author_node.screen_name:
+        target_user = neo4j_connector.add_user_node(
+            screen_name=author_name,
+            followers_count=n_followers,
+            statuses_count=n_tweets,
+            url=author_url,
+            localisation=author_country,
+            user_id=retweeter_twitter_user.id
+        )
+
+        # Relationship
+        if target_user is not None:
+            neo4j_connector.retweet_relationship(target_user, author_node)
+        # end if
+    # end if
+# end add_retweeter
+
+
+# Add retweeter ids
+def add_retweeter_ids(neo4j_connector, twitter_connector, author_node, min_followers, min_tweets, retweeter_ids):
+    """
+    Look the retweeters of a tweet up by batch, once their ids are fetched
+    :param neo4j_connector:
+    :param twitter_connector:
+    :param author_node:
+    :param min_followers:
+    :param min_tweets:
+    :param retweeter_ids: List of user ids
+    :return:
+    """
+    for retweeter_id in retweeter_ids:
+        twitter_connector.hydrate_user(
+            functools.partial(
+                add_retweeter,
+                neo4j_connector,
+                author_node,
+                min_followers,
+                min_tweets
+            ),
+            user_id=retweeter_id
+        )
+    # end for
+# end add_retweeter_ids
+
+
+# Harvest retweeters
+def harvest_retweeters(neo4j_connector, twitter_connector, author_node, candidates, min_followers, min_tweets,
+                       budget=10):
+    """
+    Request the retweeter ids of the most retweeted tweets of a user
+    :param neo4j_connector:
+    :param twitter_connector:
+    :param author_node:
+    :param candidates: Original tweets with at least one retweet
+    :param min_followers:
+    :param min_tweets:
+    :param budget: Maximum number of tweets whose retweeters are requested (-1 for all)
+    :return: Number of requested tweets
+    """
+    # Most retweeted first
+    candidates = sorted(candidates, key=lambda t: t.retweet_count, reverse=True)
+    if budget != -1:
+        candidates = candidates[:budget]
+    # end if
+
+    # Retweeter ids, fetched when statuses/retweeters/ids has budget
+    for tweet in candidates:
+        twitter_connector.request_retweeter_ids(
+            tweet,
+            functools.partial(
+                add_retweeter_ids,
+                neo4j_connector,
+                twitter_connector,
+                author_node,
+                min_followers,
+                min_tweets
+            )
+        )
+    # end for
+
+    return len(candidates)
+# end harvest_retweeters
+
+
+# Keep users with new statuses
+def with_new_statuses(twitter_connector, user_pages):
+    """
+    Keep the users whose latest status is more recent than their last computed tweet,
+    looking their profiles up by batch of 100
+    :param twitter_connector:
+    :param user_pages: Iterator of lists of user nodes
+    :return: Iterator of lists of user nodes
+    """
+    for page in user_pages:
+        # Latest statuses
+        try:
+            latest = twitter_connector.get_latest_status_ids([user.screen_name for user in page])
+        except tweepy.error.TweepError as e:
+            print(u"Tweepy error {}".format(e))
+            yield page
+            continue
+        # end try
+
+        # Users with new statuses
+        new_users = [
+            user for user in page
+            if latest.get(user.screen_name.lower()) is not None and
+            latest[user.screen_name.lower()] > user.last_tweet_id
+        ]
+        print(u"{} of {} users with new statuses".format(len(new_users), len(page)))
+
+        yield new_users
+    # end for
+# end with_new_statuses
+
+
+# Process a tweet
+def process_tweet(neo4j_connector, twitter_connector, author_node, tweet, min_followers, min_tweets, retweets=False,
+                  tweets=False, quotes=False, hashtags=False):
+    """
+    Add the interactions of a tweet to the graph, retweeters are harvested separately
+    :param neo4j_connector:
+    :param twitter_connector:
+    :param author_node: User node of the author
+    :param tweet: Tweet
+    :param min_followers:
+    :param min_tweets:
+    :param retweets:
+    :param tweets:
+    :param quotes:
+    :param hashtags:
+    :return:
+    """
+    # Only retweet
+    if hasattr(tweet, 'retweeted_status') and retweets:
+        # Target user, looked up by batch if trimmed
+        target_twitter_user = tweet.retweeted_status.author
+        if hasattr(target_twitter_user, 'screen_name'):
+            add_retweeted_user(neo4j_connector, author_node, min_followers, min_tweets, target_twitter_user)
+        else:
+            twitter_connector.hydrate_user(
+                functools.partial(
+                    add_retweeted_user,
+                    neo4j_connector,
+                    author_node,
+                    min_followers,
+                    min_tweets
+                ),
+                user_id=target_twitter_user.id
+            )
+        # end if
+    else:
+        # For each quoted URL
+        if tweets:
+            for url in tweet.entities['urls']:
+                # Add web site
+                website_node = neo4j_connector.add_web_site(url['expanded_url'])
+
+                # Add TWEETED relationship
+                if website_node is not None:
+                    neo4j_connector.tweeted_relationship(author_node, website_node)
+                # end if
+            # end for
+        # end if
+
+        # For each quoted users, profiles are looked up by batch
+        if quotes:
+            for quoted_user_info in tweet.entities['user_mentions']:
+                twitter_connector.hydrate_user(
+                    functools.partial(
+                        add_quoted_user,
+                        neo4j_connector,
+                        author_node,
+                        min_followers,
+                        min_tweets
+                    ),
+                    user_id=quoted_user_info['id']
+                )
+            # end for
+        # end if
+
+        # For each quoted hashtags
+        if hashtags:
+            for quoted_hashtag_info in tweet.entities['hashtags']:
+                # Hashtag text
+                hashtag_text = '#' + quoted_hashtag_info['text']
+
+                # Add if not exists
+                quoted_hashtag_node = neo4j_connector.add_hashtag_node(
+                    hashtag_text=hashtag_text
+                )
+
+                # Relationship
+                neo4j_connector.hashtaged_relationship(author_node, quoted_hashtag_node)
+            # end for
+
+            # Links between hashtags
+            for hashtag1_info in tweet.entities['hashtags']:
+                # Other hashtag text
+                hashtag1_text = '#' + hashtag1_info['text']
+
+                # Add if not exists
+                hashtag1_node = neo4j_connector.add_hashtag_node(
+                    hashtag_text=hashtag1_text
+                )
+
+                # Other hashtag
+                for hashtag2_info in tweet.entities['hashtags']:
+                    # Other hashtag text
+                    hashtag2_text = '#' + hashtag2_info['text']
+
+                    # Add if not exists
+                    hashtag2_node = neo4j_connector.add_hashtag_node(
+                        hashtag_text=hashtag2_text
+                    )
+
+                    # Different
+                    if hashtag1_text != hashtag2_text:
+                        # Linked
+                        neo4j_connector.linked_relationship(hashtag1_node, hashtag2_node)
+                    # end if
+                # end for
+            # end for
+        # end if
+    # end if
+# end process_tweet
+
+
+# Best users first
+def prioritized_users(neo4j_connector, users, prioritizer):
+    """
+    Sort users best-first for the crawl, all users and the adjacency of the graph are loaded on the first user
+    :param neo4j_connector:
+    :param users: Iterable of user nodes
+    :param prioritizer: CrawlPrioritizer
+    :return: Iterator of user nodes, users are only listed once iterated
+    """
+    users = list(users)
+    scores = neo4j_connector.crawl_priorities(users, prioritizer)
+    users.sort(key=lambda user: scores.get(user.id, 0.0), reverse=True)
+    for user in users:
+        yield user
+    # end for
+# end prioritized_users
+
+
+# Users within the API budget
+def budgeted_users(twitter_connector, users, api_budget=-1):
+    """
+    Stop handing users over once the API budget is spent
+    :param twitter_connector:
+    :param users: Iterable of user nodes
+    :param api_budget: Maximum number of API calls (-1 for no limit)
+    :return: Iterator of user nodes
+    """
+    for user in users:
+        if api_budget != -1 and twitter_connector.n_calls >= api_budget:
+            print(u"API budget of {} calls spent".format(api_budget))
+            break
+        # end if
+        yield user
+    # end for
+# end budgeted_users
+
+
+# Users of a crawl frontier
+def frontier_users(neo4j_connector, frontier, batch_size=10, worker=None, lease=None, cursors=None):
+    """
+    Claim the pending users of a crawl frontier, in crawl order
+    :param neo4j_connector:
+    :param frontier: CrawlFrontier
+    :param batch_size: Number of users claimed at once
+    :param worker: Worker name, when several processes share the frontier
+    :param lease: Lease duration of claimed users (seconds)
+    :param cursors: Dictionary filled with the timeline cursor of each claimed user (screen name -> (max id, last
+                    tweet id)), None to ignore cursors
+    :return: Iterator of user nodes, None while the users of this process are fetched and nothing is left to claim
+    """
+    while True:
+        # Next users
+        screen_names = frontier.claim(batch_size, worker=worker, lease=lease)
+
+        # Nothing pending, own users first, they may fail and be put back
+        if len(screen_names) == 0 and frontier.held(worker) > 0:
+            yield None
+            continue
+        # end if
+
+        # Nothing pending, wait for the users of other workers in case one stopped
+        if len(screen_names) == 0 and worker is not None:
+            expiry = frontier.next_expiry(worker)
+            if expiry is not None:
+                time.sleep(min(max(expiry - time.time(), 0) + 1, lease))
+                continue
+            # end if
+        # end if
+
+        # Done
+        if len(screen_names) == 0:
+            break
+        # end if
+
+        # Nodes
+        for screen_name in screen_names:
+            user = neo4j_connector.get_user_node(screen_name)
+            if user is None:
+                frontier.failed(screen_name, u"No node", worker=worker)
+                continue
+            # end if
+
+            # Last tweet id stored by the worker that held it before, the record may be older
+            if worker is not None:
+                neo4j_connector.advance_last_tweet_id(user)
+            # end if
+
+            # Tweets left unread by a failed crawl
+            if cursors is not None:
+                cursors[screen_name] = frontier.cursor(screen_name)
+            # end if
+            yield user
+        # end for
+    # end while
+# end frontier_users
+
+
+# Request a timeline
+def request_timeline(twitter_connector, depth, depth_controller, cursors, user):
+    """
+    Pages of the timeline of a user, called in a fetcher thread
+    :param twitter_connector:
+    :param depth:
+    :param depth_controller: DepthController deciding whether each next page is fetched, None to read depth pages
+    :param cursors: Dictionary of timeline cursors (screen name -> (max id, last tweet id))
+    :param user:
+    :return: Page iterator
+    """
+    # Log
+    print(u"On {}".format(user.screen_name))
+
+    # Only tweets after the last one computed, and before the ones read by a failed crawl, filtered by the server
+    pages = twitter_connector.get_user_timeline(
+        screen_name=user.screen_name,
+        n_pages=depth + 1 if depth != -1 else -1,
+        since_id=user.last_tweet_id if user.last_tweet_id > 0 else None,
+        max_id=cursors.get(user.screen_name, (None, None))[0]
+    )
+
+    # Next pages only if worth it
+    if depth_controller is not None:
+        return depth_controller.pages_of(user.screen_name, pages)
+    # end if
+
+    return pages
+# end request_timeline
+
+
+# Interactions of a tweet
+def interaction_keys(tweet, retweets=False, tweets=False, quotes=False, hashtags=False):
+    """
+    Keys of the interactions a tweet may add to the graph, to measure the yield of a page
+    :param tweet:
+    :param retweets:
+    :param tweets:
+    :param quotes:
+    :param hashtags:
+    :return: Set of (type, target) keys
+    """
+    # Retweet
+    if hasattr(tweet, 'retweeted_status'):
+        return set([(u"RETWEETED", tweet.retweeted_status.author.id)]) if retweets else set()
+    # end if
+
+    # Web sites, mentions and hashtags
+    keys = set()
+    if tweets:
+        keys.update([(u"TWEETED", url['expanded_url']) for url in tweet.entities['urls']])
+    # end if
+    if quotes:
+        keys.update([(u"QUOTED", mention['id']) for mention in tweet.entities['user_mentions']])
+    # end if
+    if hashtags:
+        keys.update([(u"HASHTAGED", hashtag['text'].lower()) for hashtag in tweet.entities['hashtags']])
+    # end if
+    return keys
+# end interaction_keys
+
+
+# Tweet rate of a page
+def tweets_per_day(page):
+    """
+    Tweet rate over a page of tweets
+    :param page: List of tweets, newest first
+    :return: Tweets per day
+    """
+    if len(page) < 2:
+        return 0.0
+    # end if
+    span = (page[0].created_at - page[-1].created_at).total_seconds() / 86400.0
+    return len(page) / max(span, 1.0 / 24.0)
+# end tweets_per_day
+
+
+# Record a failed user
+def failed(frontier, user, error, worker=None, oldest_tweet_id=0, last_tweet_id=0):
+    """
+    Record a failed user in the crawl frontier, if any, with the cursor of its timeline
+    :param frontier: CrawlFrontier, or None
+    :param user:
+    :param error:
+    :param worker: Worker name
+    :param oldest_tweet_id: Oldest tweet id read, 0 if none
+    :param last_tweet_id: Most recent tweet id read, 0 if none
+    :return: True if the user will be retried, False if given up or without frontier, None if handed to another
+             worker
+    """
+    # No frontier
+    if frontier is None:
+        return False
+    # end if
+
+    # Retried, given up, or handed to another worker
+    retry = frontier.failed(
+        user.screen_name,
+        error,
+        worker=worker,
+        max_id=oldest_tweet_id - 1 if oldest_tweet_id != 0 else None,
+        last_tweet_id=last_tweet_id if last_tweet_id != 0 else None
+    )
+    if retry is None:
+        print(u"Lease on {} lost".format(user.screen_name))
+    elif not retry:
+        print(u"Giving up {}".format(user.screen_name))
+    # end if
+    return retry
+# end failed
+
+
+# Remember the last tweet id of a user
+def remember_limit(neo4j_connector, user, last_tweet_id):
+    """
+    Write the last tweet id of a user, never moved back by a worker that lost the user to another one
+    :param neo4j_connector:
+    :param user:
+    :param last_tweet_id: Most recent tweet id read, 0 if none
+    :return: True if written
+    """
+    try:
+        if last_tweet_id != 0:
+            neo4j_connector.advance_last_tweet_id(user, last_tweet_id)
+            neo4j_connector.flush()
+        # end if
+    except neo4jrestclient.exceptions.NotFoundError as e:
+        print(u"Neo4j error {}".format(e))
+        return False
+    # end try
+    return True
+# end remember_limit
+
+
+# Finish a user
+def finish_user(neo4j_connector, frontier, user, last_tweet_id, error=None, worker=None, oldest_tweet_id=0):
+    """
+    Write the interactions counted for a user with its last tweet id, then mark it done, or failed if its crawl
+    failed. The limit of a user that will be retried is not moved, the frontier keeps the cursor of its timeline so
+    that the retry reads the older tweets left unread and not the ones already counted.
+    :param neo4j_connector:
+    :param frontier: CrawlFrontier, or None
+    :param user:
+    :param last_tweet_id: Most recent tweet id read, 0 if none
+    :param error: Error the crawl of the user failed with, None if it succeeded
+    :param worker: Worker name
+    :param oldest_tweet_id: Oldest tweet id read, 0 if none
+    :return:
+    """
+    try:
+        # Write buffered relationships
+        neo4j_connector.flush()
+    except neo4jrestclient.exceptions.NotFoundError as e:
+        print(u"Neo4j error {}".format(e))
+        error = error if error is not None else e
+    # end try
+
+    # Failed, the limit is only moved if it will not be retried
+    if error is not None:
+        if failed(frontier, user, error, worker, oldest_tweet_id, last_tweet_id) is False:
+            remember_limit(neo4j_connector, user, last_tweet_id)
+        # end if
+        return
+    # end if
+
+    # Remember limit
+    if not remember_limit(neo4j_connector, user, last_tweet_id):
+        failed(frontier, user, u"Limit not written", worker, oldest_tweet_id, last_tweet_id)
+        return
+    # end if
+
+    # Log
+    print(u"Done with {}".format(user.screen_name))
+
+    # Done, unless the lease was lost and the user handed to another worker
+    if frontier is not None and not frontier.done(user.screen_name, worker=worker):
+        print(u"Lease on {} lost".format(user.screen_name))
+    # end if
+# end finish_user
 
 
 # Compute interactions
-def compute_interactions(neo4j_connector, twitter_connector, min_followers, min_tweets, depth=-1, retweets=False, tweets=False, quotes=False, hashtags=False, root_users=None):
+def compute_interactions(neo4j_connector, twitter_connector, min_followers, min_tweets, depth=-1, retweets=False, tweets=False, quotes=False, hashtags=False, root_users=None, retweet_budget=10, workers=1, queue_size=16, frontier=None, resume=False, prioritizer=None, max_users=-1, api_budget=-1, worker=None, lease=600.0, depth_controller=None):
     """
-    Compute interactions
+    Compute interactions, timelines are fetched by worker threads while pages are written to the graph
     :param neo4j_connector:
     :param twitter_connector:
     :param min_followers:
@@ -43,221 +648,307 @@ def compute_interactions(neo4j_connector, twitter_connector, min_followers, min_
     :param quotes:
     :param hashtags:
     :param root_users:
+    :param retweet_budget: Maximum number of tweets per user whose retweeters are requested (-1 for all)
+    :param workers: Number of fetcher threads
+    :param queue_size: Number of fetched pages waiting for the writer above which fetchers wait
+    :param frontier: CrawlFrontier recording the state of each user, None to keep none
+    :param resume: Continue the crawl of the frontier instead of starting a new one, workers start a new one when the
+                   frontier is finished unless resumed
+    :param prioritizer: CrawlPrioritizer to crawl the best users first, None for a random order of all the users
+    :param max_users: Maximum number of users to crawl (-1 for all)
+    :param api_budget: Maximum number of API calls after which no new user is crawled (-1 for no limit)
+    :param worker: Worker name, to crawl the frontier along with other processes (None to crawl it alone)
+    :param lease: Time after which users claimed by a worker that stopped renewing its lease are freed (seconds)
+    :param depth_controller: DepthController deciding page after page how deep each timeline is read, None to read
+                             depth pages of every user
     :return:
     """
-    # Current list of users
+    # Current users, streamed page by page
     if root_users is None:
-        current_nodes = list(neo4j_connector.users)
-        shuffle(current_nodes)
+        user_pages = neo4j_connector.iter_node_pages("TwitterUser")
     else:
-        current_nodes = root_users
+        user_pages = [root_users]
     # end if
 
-    # For each user
-    for index, user in enumerate(current_nodes):
-        try:
-            # Log
-            print(u"On {}".format(user.get('screen_name')))
-
-            # Last tweet id
-            last_tweet_id = 0
-
-            # Author node
-            author_node = neo4j_connector.get_user_node(user.get('screen_name'))
-
-            # For each page
-            for page_index, page in enumerate(twitter_connector.get_user_timeline(screen_name=user.get('screen_name'))):
-                stop = False
-                # For each tweet
-                for tweet in page:
-                    # Stop if already computed
-                    if tweet.id <= user.get('last_tweet_id'):
-                        stop = True
-                        break
-                    # end if
+    # Only users with new statuses, best first, or in random order over the whole graph so that the node budget
+    # samples every user and not only the first pages, statuses are then looked up as users are crawled
+    if prioritizer is not None:
+        current_nodes = prioritized_users(
+            neo4j_connector,
+            tools.shuffled_stream(with_new_statuses(twitter_connector, user_pages)),
+            prioritizer
+        )
+    else:
+        current_nodes = itertools.chain.from_iterable(
+            with_new_statuses(twitter_connector, tools.shuffled_pages(user_pages))
+        )
+    # end if
 
-                    # Only retweet
-                    if hasattr(tweet, 'retweeted_status') and retweets:
-                        # Target user
-                        target_twitter_user = tweet.retweeted_status.author
-
-                        # Properties
-                        author_name, n_followers, n_tweets, author_url, author_country = tools.get_user_info(
-                            target_twitter_user)
-
-                        # Add if not exists
-                        if n_followers >= min_followers and n_tweets >= min_tweets and author_name != user.get(
-                                'screen_name'):
-                            target_user = neo4j_connector.add_user_node(
-                                screen_name=author_name,
-                                followers_count=n_followers,
-                                statuses_count=n_tweets,
-                                url=author_url,
-                                localisation=author_country
-                            )
-
-                            # Relationship
-                            if target_user is not None:
-                                neo4j_connector.retweet_relationship(author_node, target_user)
-                            # end if
-                        # end if
-                    else:
-                        # For each retweets
-                        if retweets:
-                            # Get retweets
-                            tweet_retweets = twitter_connector.get_retweets(tweet)
-
-                            # If there is retweets
-                            if len(tweet_retweets) > 0:
-                                # For each retweets
-                                for retweet in tweet_retweets:
-                                    # Target user
-                                    target_twitter_user = retweet.author
-
-                                    # Properties
-                                    author_name, n_followers, n_tweets, author_url, author_country = tools.get_user_info(
-                                        target_twitter_user)
-
-                                    # Add if not exists
-                                    if n_followers >= min_followers and n_tweets >= min_tweets and author_name != user.get(
-                                            'screen_name'):
-                                        target_user = neo4j_connector.add_user_node(
-                                            screen_name=author_name,
-                                            followers_count=n_followers,
-                                            statuses_count=n_tweets,
-                                            url=author_url,
-                                            localisation=author_country
-                                        )
-
-                                        # Relationship
-                                        if target_user is not None:
-                                            neo4j_connector.retweet_relationship(target_user, author_node)
-                                        # end if
-                                    # end if
-                                # end for
-                            # end if
-                        # end if
+    # Node budget
+    if max_users != -1:
+        current_nodes = itertools.islice(current_nodes, max_users)
+    # end if
 
-                        # For each quoted URL
-                        if tweets:
-                            for url in tweet.entities['urls']:
-                                # Add web site
-                                website_node = neo4j_connector.add_web_site(url['expanded_url'])
-
-                                # Add TWEETED relationship
-                                if website_node is not None:
-                                    neo4j_connector.tweeted_relationship(author_node, website_node)
-                                # end if
-                            # end for
-                        # end if
+    # Crawl order recorded in the frontier, with the timeline cursors of failed users
+    heartbeats = None
+    cursors = dict()
+    if frontier is not None:
+        if worker is not None:
+            # Shared crawl, filled by the first worker, filled again once finished unless resumed
+            if frontier.size == 0 or (not resume and frontier.remaining == 0):
+                frontier.reset((user.screen_name for user in current_nodes), only_if_finished=True)
+            # end if
+            heartbeats = frontier.keep_leases(worker, lease)
+            print(u"Worker {} joining the crawl, {} users of its last run put back".format(
+                worker,
+                frontier.release(worker)
+            ))
+        elif resume and frontier.size > 0:
+            print(u"Resuming crawl, {} users put back".format(frontier.resume()))
+        else:
+            print(u"{} users to crawl".format(frontier.reset(user.screen_name for user in current_nodes)))
+        # end if
+        print(u"Frontier : {}".format(frontier.counts()))
+        current_nodes = frontier_users(
+            neo4j_connector,
+            frontier,
+            batch_size=workers,
+            worker=worker,
+            lease=lease,
+            cursors=cursors
+        )
+    # end if
 
-                        # For each quoted users
-                        if quotes:
-                            for quoted_user_info in tweet.entities['user_mentions']:
-                                # Twitter user
-                                quoted_twitter_user = twitter_connector.get_user(quoted_user_info['screen_name'])
-
-                                # Properties
-                                author_name, n_followers, n_tweets, author_url, author_country = tools.get_user_info(
-                                    quoted_twitter_user)
-
-                                # Add if not exists
-                                if n_followers >= min_followers and n_tweets >= min_tweets and author_name != user.get(
-                                        'screen_name'):
-                                    quoted_user_node = neo4j_connector.add_user_node(
-                                        screen_name=author_name,
-                                        followers_count=n_followers,
-                                        statuses_count=n_tweets,
-                                        url=author_url,
-                                        localisation=author_country
-                                    )
-
-                                    # Relationship
-                                    if quoted_user_node is not None:
-                                        neo4j_connector.quoted_relationship(author_node, quoted_user_node)
-                                    # end if
-                                # end if
-                            # end for
+    # API budget
+    current_nodes = budgeted_users(twitter_connector, current_nodes, api_budget)
+
+    # Fetcher threads
+    fetcher = PageFetcher(workers=workers, queue_size=queue_size)
+    pages = fetcher.stream(
+        current_nodes,
+        functools.partial(request_timeline, twitter_connector, depth, depth_controller, cursors)
+    )
+
+    # Users being fetched (screen name -> [last tweet id, original tweets with retweets, interactions seen, error,
+    # oldest tweet id]), the last tweet id read by failed crawls first
+    in_flight = dict()
+
+    # For each fetched page
+    for user, page, error in pages:
+        if user.screen_name not in in_flight:
+            in_flight[user.screen_name] = [cursors.get(user.screen_name, (None, None))[1] or 0, list(), set(), None, 0]
+        # end if
+        crawl = in_flight[user.screen_name]
+        retweet_candidates, seen = crawl[1:3]
+
+        # Page, the next pages of a user that failed are skipped
+        if page is not None:
+            n_new = 0
+            try:
+                if crawl[3] is None:
+                    # For each tweet
+                    for tweet in page:
+                        # Interactions
+                        process_tweet(
+                            neo4j_connector,
+                            twitter_connector,
+                            user,
+                            tweet,
+                            min_followers,
+                            min_tweets,
+                            retweets,
+                            tweets,
+                            quotes,
+                            hashtags
+                        )
+
+                        # Retweeted by others
+                        if retweets and not hasattr(tweet, 'retweeted_status') and tweet.retweet_count > 0:
+                            retweet_candidates.append(tweet)
                         # end if
 
-                        # For each quoted hashtags
-                        if hashtags:
-                            for quoted_hashtag_info in tweet.entities['hashtags']:
-                                # Hashtag text
-                                hashtag_text = '#' + quoted_hashtag_info['text']
-
-                                # Add if not exists
-                                quoted_hashtag_node = neo4j_connector.add_hashtag_node(
-                                    hashtag_text=hashtag_text
-                                )
-
-                                # Relationship
-                                neo4j_connector.hashtaged_relationship(author_node, quoted_hashtag_node)
-                            # end for
-
-                            # Links between hashtags
-                            for hashtag1_info in tweet.entities['hashtags']:
-                                # Other hashtag text
-                                hashtag1_text = '#' + hashtag1_info['text']
-
-                                # Add if not exists
-                                hashtag1_node = neo4j_connector.add_hashtag_node(
-                                    hashtag_text=hashtag1_text
-                                )
-
-                                # Other hashtag
-                                for hashtag2_info in tweet.entities['hashtags']:
-                                    # Other hashtag text
-                                    hashtag2_text = '#' + hashtag2_info['text']
-
-                                    # Add if not exists
-                                    hashtag2_node = neo4j_connector.add_hashtag_node(
-                                        hashtag_text=hashtag2_text
-                                    )
-
-                                    # Different
-                                    if hashtag1_text != hashtag2_text:
-                                        # Linked
-                                        neo4j_connector.linked_relationship(hashtag1_node, hashtag2_node)
-                                    # end if
-                                # end for
-                            # end for
+                        # Remember limits
+                        if tweet.id > crawl[0]:
+                            crawl[0] = tweet.id
+                        # end if
+                        if crawl[4] == 0 or tweet.id < crawl[4]:
+                            crawl[4] = tweet.id
                         # end if
+                    # end for
+
+                    # New interactions of the page
+                    if depth_controller is not None:
+                        n_seen = len(seen)
+                        for tweet in page:
+                            seen.update(interaction_keys(tweet, retweets, tweets, quotes, hashtags))
+                        # end for
+                        n_new = len(seen) - n_seen
                     # end if
 
-                    # Remember limit
-                    if tweet.id > last_tweet_id:
-                        last_tweet_id = tweet.id
-                    # end if
-                # end for
-
-                # Depth
-                if depth != -1 and page_index >= depth:
-                    stop = True
+                    # Deferred calls with budget
+                    twitter_connector.dispatch()
                 # end if
-
-                # Stop?
-                if stop:
-                    break
+            except tweepy.error.TweepError as e:
+                print(u"Tweepy error {}".format(e))
+                crawl[3] = e
+            except neo4jrestclient.exceptions.NotFoundError as e:
+                print(u"Neo4j error {}".format(e))
+                crawl[3] = e
+            finally:
+                # Yield of every page, nothing new for a skipped or failed one, the fetcher waits for it to
+                # decide on the next one
+                if depth_controller is not None:
+                    depth_controller.record(user.screen_name, len(page), n_new, tweets_per_day(page))
                 # end if
-            # end for
+            # end try
+            continue
+        # end if
+
+        # Timeline done
+        del in_flight[user.screen_name]
+        cursors.pop(user.screen_name, None)
+        if depth_controller is not None:
+            depth_controller.forget(user.screen_name)
+        # end if
+
+        # Fetch failed
+        if error is not None and crawl[3] is None:
+            print(u"{} error {}".format(u"Tweepy" if isinstance(error, tweepy.error.TweepError) else u"Fetch", error))
+            crawl[3] = error
+        # end if
+
+        # Retweeters of the most retweeted tweets and mentioned users
+        if crawl[3] is None:
+            try:
+                if retweets:
+                    harvest_retweeters(
+                        neo4j_connector,
+                        twitter_connector,
+                        user,
+                        retweet_candidates,
+                        min_followers,
+                        min_tweets,
+                        retweet_budget
+                    )
+                    twitter_connector.dispatch()
+                # end if
+
+                # Resolve mentioned users
+                twitter_connector.flush_hydration()
+            except tweepy.error.TweepError as e:
+                print(u"Tweepy error {}".format(e))
+                crawl[3] = e
+            except neo4jrestclient.exceptions.NotFoundError as e:
+                print(u"Neo4j error {}".format(e))
+                crawl[3] = e
+            # end try
+        # end if
+
+        # Write its interactions and its limit, then mark it done or failed
+        finish_user(neo4j_connector, frontier, user, crawl[0], crawl[3], worker=worker, oldest_tweet_id=crawl[4])
+    # end for
+
+    # Stop fetchers
+    fetcher.close()
+
+    # Stop heartbeats
+    if heartbeats is not None:
+        heartbeats.set()
+    # end if
 
-            # Log
-            print(u"Done with {}".format(user.get('screen_name')))
+    # Deferred calls left
+    twitter_connector.drain()
 
-            # Remember limit
-            if last_tweet_id != 0:
-                user.set('last_tweet_id', last_tweet_id)
+    # Resolve users found by the last calls
+    twitter_connector.flush_hydration()
+
+    # Write what is left after an error
+    neo4j_connector.flush()
+# end compute_interactions
+
+
+# Replay archived interactions
+def replay_interactions(neo4j_connector, archive_connector, min_followers, min_tweets, retweets=False, tweets=False,
+                        quotes=False, hashtags=False, from_scratch=False):
+    """
+    Add the interactions of archived timeline pages to the graph, without calling Twitter. Only the tweets after the
+    last tweet id of their author are added to a crawled graph, all of them to build a graph from scratch.
+    :param neo4j_connector:
+    :param archive_connector: ArchiveConnector
+    :param min_followers:
+    :param min_tweets:
+    :param retweets:
+    :param tweets:
+    :param quotes:
+    :param hashtags:
+    :param from_scratch: Add every archived tweet, in a graph where no timeline was read yet
+    :return:
+    """
+    # Counted twice if timelines were already read
+    if from_scratch and any(user.last_tweet_id > 0 for user in neo4j_connector.users):
+        print(u"Timelines already read in this graph, replaying from scratch needs a new one")
+        return
+    # end if
+
+    # Last tweet id of each replayed user
+    last_tweet_ids = dict()
+
+    # For each archived page
+    for screen_name, max_id, page in archive_connector.pages():
+        # Author node
+        author_node = neo4j_connector.get_user_node(screen_name)
+
+        # Unknown author, added from its cached profile
+        if author_node is None:
+            author = archive_connector.get_user(screen_name=screen_name)
+            if author is None:
+                print(u"Unknown user {}, page skipped".format(screen_name))
+                continue
             # end if
-        except tweepy.error.TweepError as e:
-            print(u"Tweepy error {}".format(e))
-            pass
-        except neo4jrestclient.exceptions as e:
-            print(u"Neo4j error {}".format(e))
-            pass
-        except neo4jrestclient.exceptions.NotFoundError as e:
-            print(u"Neo4j error {}".format(e))
-            pass
-        # end try
+            author_name, n_followers, n_tweets, author_url, author_country = tools.get_user_info(author)
+            author_node = neo4j_connector.add_user_node(
+                screen_name=author_name,
+                followers_count=n_followers,
+                statuses_count=n_tweets,
+                url=author_url,
+                localisation=author_country,
+                user_id=author.id
+            )
+        # end if
+
+        # For each tweet not already in the graph, as the live crawl only reads tweets after the last one
+        for tweet in page:
+            if not from_scratch and tweet.id <= author_node.last_tweet_id:
+                continue
+            # end if
+            process_tweet(
+                neo4j_connector,
+                archive_connector,
+                author_node,
+                tweet,
+                min_followers,
+                min_tweets,
+                retweets,
+                tweets,
+                quotes,
+                hashtags
+            )
+        # end for
+
+        # Remember limit
+        if max_id > last_tweet_ids.get(screen_name, (0, None))[0]:
+            last_tweet_ids[screen_name] = (max_id, author_node)
+        # end if
     # end for
-# end compute_interactions
+
+    # Write buffered relationships
+    neo4j_connector.flush()
+
+    # Remember limits, only forward
+    for screen_name, (last_tweet_id, author_node) in last_tweet_ids.items():
+        if last_tweet_id > author_node.last_tweet_id:
+            neo4j_connector.set_node_properties(author_node, last_tweet_id=last_tweet_id)
+        # end if
+    # end for
+    neo4j_connector.flush()
+# end replay_interactions
@@ -1,8 +1,8 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 #
-# File : twitter.TweetBotConnector.py
-# Description : Main class to connect with Twitter API.
+# File : neo4j.Neo4jConnector.py
+# Description : Neo4j graph storage.
 # Date : 21.05.2018 14:43:00
 #
 # This file is part of the Tanaturf.
@@ -21,544 +21,134 @@
 #
 
 # Imports
-import tld.exceptions
-from tld import get_tld
-from urlparse import urlparse
-import neo4jrestclient.exceptions
-from neo4jrestclient.client import GraphDatabase, Relationship, Node
+from neo4jrestclient.client import GraphDatabase, Relationship
 import tanaturf.tools.settings
+from tanaturf.storage.GraphStorage import GraphStorage
+from tanaturf.storage.NodeRecord import RECORDS
+from .QueryRegistry import QueryRegistry
+from .RelationshipBuffer import RelationshipBuffer
+from .SchemaManager import SchemaManager
+from .WeightEngine import WeightEngine
 
 
 # Neo4j connector
-class Neo4jConnector(object):
+class Neo4jConnector(GraphStorage):
     """
     Neo4j connector
     """
 
     # Constructor
-    def __init__(self, user, password, uri="http://localhost:7474"):
+    def __init__(self, user, password, uri="http://localhost:7474", flush_size=1000, flush_delay=30.0,
+                 page_size=1000):
         """
         Constructor
         :param uri:
         :param user:
         :param password:
+        :param flush_size: Number of pending relationships triggering a flush
+        :param flush_delay: Maximum time between two flushes (seconds)
+        :param page_size: Number of nodes per page when streaming node lists
         """
+        # Identity maps
+        super(Neo4jConnector, self).__init__(page_size=page_size)
+
         # DB
         self.db = GraphDatabase(uri, username=user, password=password)
 
-        # Create labels
-        self.twitter_users = self.db.labels.create("TwitterUser")
-        self.web_sites = self.db.labels.create("Website")
-        self.hashtag_nodes = self.db.labels.create("Hashtag")
-
-        # List
-        self.users = list()
-        self.sites = list()
-        self.hashtags = list()
+        # Statements
+        self._registry = QueryRegistry(self.db)
 
-        # Load users and web sites
-        self.load_user_nodes()
-        self.load_website_nodes()
+        # Relationship counters buffer
+        self._relationship_buffer = RelationshipBuffer(self._registry, max_size=flush_size, max_delay=flush_delay)
     # end __init__
 
-    #################################
-    # PROPERTIES
-    #################################
-
-    # Number of twitter users
-    @property
-    def n_user_node(self):
-        """
-        Number of twitter users
-        :return:
-        """
-        return len(self.users)
-    # end n_twitter_user
-
-    # Number of website nodes
-    @property
-    def n_website_node(self):
-        """
-        Number of website nodes
-        :return:
-        """
-        return len(self.sites)
-    # end n_website_node
-
     #################################
     # PUBLIC
     #################################
 
     # Compute weights
-    def compute_weights(self):
-        """
-        Compute weights
-        :return:
-        """
-        # Query
-        results = self.db.query(q="MATCH (n)-[r]->(m) RETURN n, r, m", returns=(Node, Relationship, Node))
-
-        # Divider
-        divider = {"RETWEETED": "retweet_out", "TWEETED": "tweeted_out", "FOLLOW": "followers_count", "QUOTED": "quoted_out", "HASHTAGED": "hashtaged_out", "LINKED": "linked_out"}
-
-        # For each relationship
-        for (node1, relationship, node2) in results:
-            # Set weight
-            if relationship.type == "FOLLOW":
-                relationship.set("weight", 1.0 / float(node1.get(divider[relationship.type])))
-            else:
-                relationship.set("weight", float(relationship.get("count")) / float(node1.get(divider[relationship.type])))
-            # end if
-        # end for
-    # end compute_weights
-
-    # Load user nodes
-    def load_user_nodes(self):
-        """
-        Load Twitter users
-        :return:
-        """
-        # Query
-        result = self.db.query(q="MATCH (n:TwitterUser) RETURN n", returns=(Node))
-
-        # For each user
-        for user in result:
-            self.users.append(user[0])
-        # end for
-    # end load_user_nodes
-
-    # Reload Twitter user
-    def reload_user_nodes(self):
-        """
-        Reload Twitter user
-        :return:
-        """
-        self.users = list()
-        self.load_user_nodes()
-    # end reload_user_nodes
-
-    # Load website nodes
-    def load_website_nodes(self):
-        """
-        Load website nodes
-        :return:
-        """
-        # Query
-        result = self.db.query(q="MATCH (n:Website) RETURN n", returns=(Node))
-
-        # For each user
-        for user in result:
-            self.sites.append(user[0])
-        # end for
-    # end load_website_nodes
-
-    # Reload website nodes
-    def reload_website_nodes(self):
-        """
-        Reload website nodes
-        :return:
-        """
-        self.sites = list()
-        self.load_website_nodes()
-    # end reload_website_nodes
-
-    # Add user node
-    def add_user_node(self, screen_name, followers_count, statuses_count, url, localisation, last_tweet_id=-1, classe=""):
-        """
-        Add Twitter user
-        :param screen_name:
-        :param followers_count:
-        :param statuses_count:
-        :param url:
-        :return:
-        """
-        # Banned
-        if screen_name in tanaturf.tools.settings.forbidden_nodes:
-            return None
-        # end if
-
-        # Get user node
-        user_node = self.get_user_node(screen_name=screen_name)
-
-        # Create if does not exists
-        if user_node is None:
-            print(u"New user node for {}".format(screen_name))
-            # Create user
-            user_node = self.db.nodes.create(
-                screen_name=screen_name,
-                Label=screen_name,
-                followers_count=followers_count,
-                statuses_count=statuses_count,
-                url=url,
-                localisation=localisation,
-                retweeted_in=0,
-                retweeted_out=0,
-                quoted_in=0,
-                quoted_out=0,
-                hashtaged_out=0,
-                followed=0,
-                following=0,
-                tweeted_out=0,
-                last_tweet_id=last_tweet_id,
-                classe=classe
-            )
-
-            # Add to list and DB
-            self.twitter_users.add(user_node)
-            self.users.append(user_node)
-
-            # Add website
-            website_node = self.add_web_site(url)
-
-            # Link user and website
-            if website_node is not None:
-                self.tweeted_relationship(user_node, website_node)
-            # end if
-        # end if
-
-        return user_node
-    # end add_user_node
-
-    # Get user node
-    def get_user_node(self, screen_name):
-        """
-        Get a twitter user
-        :param screen_name:
-        :return:
-        """
-        # Query
-        results = self.twitter_users.get(screen_name=screen_name)
-
-        # Found
-        if len(results) == 0:
-            return None
-        else:
-            return results[0]
-        # end if
-    # end get_twitter_user
-
-    # Add web site
-    def add_web_site(self, url):
-        """
-        Add web site
-        :param domain_name:
-        :param country:
-        :return:
+    def compute_weights(self, dry_run=False, batch_size=10000, incremental=True):
         """
-        # Try to get the domain name and suffix
-        try:
-            domain_name = unicode(get_tld(url, as_object=True))
-            tld_code = get_tld(url, as_object=True).suffix
-        except tld.exceptions.TldBadUrl as e:
-            return
-        except tld.exceptions.TldDomainNotFound as e:
-            return
-        except AttributeError as e:
-            return
-        # end try
-
-        # Not banned
-        if domain_name not in tanaturf.tools.settings.forbidden_nodes:
-            # Get website node
-            website_node = self.get_website_node(domain_name=domain_name)
-
-            # Add if does not exists
-            if website_node is None:
-                print(u"New web site node {}/{}".format(domain_name, tld_code))
-                website_node = self.db.nodes.create(
-                    domain_name=domain_name,
-                    Label=domain_name,
-                    tld_code=tld_code,
-                    tweeted_in=0
-                )
-                self.web_sites.add(website_node)
-            # end if
-
-            return website_node
-        else:
-            print(u"Website {} is banned".format(domain_name))
-        # end if
-    # end add_web_site
-
-    # Get a web site
-    def get_website_node(self, domain_name):
-        """
-        Get a twitter user
-        :param domain_name:
-        :return:
+        Compute weights (count / out degree) inside the database
+        :param dry_run: Only return weight statistics, do not write
+        :param batch_size: Number of source nodes per statement
+        :param incremental: Only recompute the outgoing relationships of nodes whose counters changed
+        :return: Dictionary of statistics per relationship type
         """
-        # Query
-        results = self.web_sites.get(domain_name=domain_name)
+        # Write pending counters first
+        self.flush()
 
-        # Found
-        if len(results) == 0:
-            return None
-        else:
-            return results[0]
-        # end if
-    # end get_website
+        # Engine
+        weight_engine = WeightEngine(self._registry, batch_size=batch_size)
 
-    # Add hashtag node
-    def add_hashtag_node(self, hashtag_text, last_tweet_id=-1):
-        """
-        Add a hashtag node
-        :param hashtag:
-        :param last_tweet_id:
-        :return:
-        """
-        # Get hashtag node
-        hashtag_node = self.get_hashtag_node(hashtag_text=hashtag_text)
-
-        # Create if does not exists
-        if hashtag_node is None:
-            print(u"New hashtag node for {}".format(hashtag_text))
-            # Create user
-            hashtag_node = self.db.nodes.create(
-                hashtag_text=hashtag_text,
-                Label=hashtag_text,
-                hashtaged_in=0,
-                linked_in=0,
-                linked_out=0,
-                last_tweet_id=last_tweet_id
-            )
-
-            # Add to list and DB
-            self.hashtag_nodes.add(hashtag_node)
-            self.hashtags.append(hashtag_node)
+        # Only stale nodes
+        if incremental:
+            return weight_engine.compute_dirty(dry_run=dry_run)
         # end if
 
-        return hashtag_node
-    # end add_user_node
-
-    # Get hashtag node
-    def get_hashtag_node(self, hashtag_text):
-        """
-        Get a hashtag user
-        :param hashtag:
-        :return:
-        """
-        # Query
-        results = self.hashtag_nodes.get(hashtag_text=hashtag_text)
+        # Whole graph
+        statistics = weight_engine.compute(dry_run=dry_run)
 
-        # Found
-        if len(results) == 0:
-            return None
-        else:
-            return results[0]
+        # Everything is up to date
+        if not dry_run:
+            weight_engine.clear_dirty()
         # end if
-    # end get_hashtag_node
-
-    # Clean lone wolves
-    def clean_lone_wolves(self, min_inputs=2, min_website_inputs=1, min_hashtag_inputs=1):
-        """
-        Clean love wolves
-        :return:
-        """
-        # Remove lone Twitter users
-        self._execute_query(
-            "MATCH p=(m:TwitterUser)-[r]->(n:TwitterUser) WHERE size(()-[]->(n)) < {} AND size((n)-[]->()) = 0 DETACH DELETE n".format(min_inputs)
-        )
-
-        # Remove lone web site with links
-        self._execute_query(
-            "MATCH p=(m:TwitterUser)-[r]->(n:Website) WHERE size(()-[]->(n)) < {} DETACH DELETE n".format(min_website_inputs)
-        )
-
-        # Remove lone hashtag
-        self._execute_query("MATCH p=()-[r]->(n:Hashtag) WHERE size(()-[]->(n)) < {} DETACH DELETE n".format(min_hashtag_inputs))
 
-        # Reload user nodes
-        self.reload_user_nodes()
-    # end clean_lone_wolves
+        return statistics
+    # end compute_weights
 
-    # Add a retweet relationship
-    def retweet_relationship(self, user1, user2):
+    # Create and verify the schema
+    def ensure_schema(self, batch_size=1000):
         """
-        Add a retweet relationship
-        :param screen_name1:
-        :param screen_name2:
-        :return:
+        Create and verify the unique constraints of the node keys, merging existing duplicate nodes
+        :param batch_size: Number of duplicate groups merged per statement
+        :return: Dictionary of number of merged duplicate nodes per label
         """
-        # Get already existing relationship
-        rel = self.get_retweeted_relationship(user1, user2)
-
-        # Incremente out
-        try:
-            user1.set("retweet_out", user1.get("retweet_out") + 1)
-        except neo4jrestclient.exceptions.NotFoundError:
-            user1.set("retweet_out", 1)
-        # end try
-
-        # Incremente in
-        try:
-            user2.set("retweeted_in", user2.get("retweeted_in") + 1)
-        except neo4jrestclient.exceptions.NotFoundError:
-            user2.set("retweeted_in", 1)
-        # end try
-
-        # Not exist
-        if rel is None:
-            print(u"New RETWEETED relationship between {} and {}".format(user1.get('screen_name'), user2.get('screen_name')))
-            rel = user1.relationships.create("RETWEETED", user2)
-            rel.set("count", 1)
-        else:
-            rel.set("count", rel.get("count") + 1)
-        # end if
+        return SchemaManager(self._registry, batch_size=batch_size).ensure()
+    # end ensure_schema
 
-        return rel
-    # end retweet_relationship
-
-    # Add a tweeted relationship
-    def tweeted_relationship(self, user1, site):
+    # Flush buffered relationships
+    def flush(self):
         """
-        Add a retweet relationship
-        :param user1:
-        :param site:
-        :return:
+        Write buffered relationship counters to the database
+        :return: Number of relationships written
         """
-        # Get already existing relationship
-        rel = self.get_tweeted_relationship(user1, site)
-
-        # Incremente out
-        try:
-            user1.set("tweeted_out", user1.get("tweeted_out") + 1)
-        except neo4jrestclient.exceptions.NotFoundError:
-            user1.set("tweeted_out", 1)
-        # end try
-
-        # Incremente in
-        try:
-            site.set("tweeted_in", site.get("tweeted_in") + 1)
-        except neo4jrestclient.exceptions.NotFoundError:
-            site.set("tweeted_in", 1)
-        # end try
-
-        # Not exist
-        if rel is None:
-            print(u"New TWEETED relationship between {} and {}".format(user1.get('screen_name'),
-                                                                         site.get('domain_name')))
-            rel = user1.relationships.create("TWEETED", site)
-            rel.set("count", 1)
-        else:
-            rel.set("count", rel.get("count") + 1)
-        # end if
-
-        return rel
-    # end retweet_relationship
+        return self._relationship_buffer.flush()
+    # end flush
 
-    # Add a quoted relationship
-    def quoted_relationship(self, user1, user2):
+    # Print statement statistics
+    def print_query_statistics(self):
         """
-        Add a quoted relationship
-        :param user1:
-        :param site:
+        Print call counts and latency of each statement
         :return:
         """
-        # Get already existing relationship
-        rel = self.get_quoted_relationship(user1, user2)
-
-        # Incremente out
-        try:
-            user1.set("quoted_out", user1.get("quoted_out") + 1)
-        except neo4jrestclient.exceptions.NotFoundError:
-            user1.set("quoted_out", 1)
-        # end try
-
-        # Incremente in
-        try:
-            user2.set("quoted_in", user2.get("quoted_in") + 1)
-        except neo4jrestclient.exceptions.NotFoundError:
-            user2.set("quoted_in", 1)
-        # end try
-
-        # Not exist
-        if rel is None:
-            print(u"New QUOTED relationship between {} and {}".format(user1.get('Label'),
-                                                                      user2.get('Label')))
-            rel = user1.relationships.create("QUOTED", user2)
-            rel.set("count", 1)
-        else:
-            rel.set("count", rel.get("count") + 1)
-        # end if
+        self._registry.print_statistics()
+    # end print_query_statistics
 
-        return rel
-    # end quoted_relationship
-
-    # Add a hashtaged relationship
-    def hashtaged_relationship(self, user, hashtag):
+    # Set node properties
+    def set_node_properties(self, node, **properties):
         """
-        Add a quoted relationship
-        :param user1:
-        :param site:
+        Set node properties
+        :param node: Node record
+        :param properties: Properties to set
         :return:
         """
-        # Get already existing relationship
-        rel = self.get_hashtaged_relationship(user, hashtag)
-
-        # Incremente out
-        try:
-            user.set("hashtaged_out", user.get("hashtaged_out") + 1)
-        except neo4jrestclient.exceptions.NotFoundError:
-            user.set("hashtaged_out", 1)
-        # end try
-
-        # Incremente in
-        try:
-            hashtag.set("hashtaged_in", hashtag.get("hashtaged_in") + 1)
-        except neo4jrestclient.exceptions.NotFoundError:
-            hashtag.set("hashtaged_in", 1)
-        # end try
-
-        # Not exist
-        if rel is None:
-            print(u"New HASHTAGED relationship between {} and {}".format(user.get('Label'),
-                                                                         hashtag.get('Label')))
-            rel = user.relationships.create("HASHTAGED", hashtag)
-            rel.set("count", 1)
-        else:
-            rel.set("count", rel.get("count") + 1)
-        # end if
-
-        return rel
-    # end hahstaged_relationship
+        self._registry.query(u"node.set", params={'id': node.id, 'properties': properties})
+        node.update(properties)
+    # end set_node_properties
 
-    # Add a linked relationship
-    def linked_relationship(self, hashtag1, hashtag2):
+    # Move the last tweet id of a user forward
+    def advance_last_tweet_id(self, user, last_tweet_id=-1):
         """
-        Add a quoted relationship
-        :param user1:
-        :param site:
-        :return:
+        Set the last tweet id of a user unless a more recent one is stored, the record gets the stored id
+        :param user: User record
+        :param last_tweet_id: Most recent tweet id read, -1 to only read it
+        :return: Stored last tweet id
         """
-        # Get already existing relationship
-        rel = self.get_linked_relationship(hashtag1, hashtag2)
-
-        # Incremente out
-        try:
-            hashtag1.set("linked_out", hashtag1.get("linked_out") + 1)
-        except neo4jrestclient.exceptions.NotFoundError:
-            hashtag1.set("linked_out", 1)
-        # end try
-
-        # Incremente in
-        try:
-            hashtag2.set("linked_in", hashtag2.get("linked_in") + 1)
-        except neo4jrestclient.exceptions.NotFoundError:
-            hashtag2.set("linked_in", 1)
-        # end try
-
-        # Not exist
-        if rel is None:
-            print(u"New LINKED relationship between {} and {}".format(hashtag1.get('Label'),
-                                                                      hashtag2.get('Label')))
-            rel = hashtag1.relationships.create("LINKED", hashtag2)
-            rel.set("count", 1)
-        else:
-            rel.set("count", rel.get("count") + 1)
-        # end if
-
-        return rel
-    # end linked_relationship
+        stored = self._registry.query(u"TwitterUser.advance", params={'id': user.id, 'last_tweet_id': last_tweet_id})
+        user.last_tweet_id = stored[0][0] if len(stored) > 0 and stored[0][0] is not None else -1
+        return user.last_tweet_id
+    # end advance_last_tweet_id
 
     # Get a RETWEETED relationship
     def get_retweeted_relationship(self, user1, user2):
@@ -568,23 +158,7 @@ class Neo4jConnector(object):
         :param user2:
         :return:
         """
-        # Query
-        q = u"MATCH (m:TwitterUser)-[r:RETWEETED]->(n:TwitterUser) WHERE m.screen_name=\"{}\" and n.screen_name=\"{}\" RETURN r".format(
-            user1.get('screen_name'), user2.get('screen_name')
-        )
-
-        # Get relationship
-        result = self.db.query(
-            q=q,
-            returns=(Relationship)
-        )
-
-        # Check if found
-        if len(result) > 0:
-            return result[0][0]
-        else:
-            return None
-        # end if
+        return self._get_single(u"RETWEETED.get", {'source': user1.id, 'target': user2.id}, Relationship)
     # end get_retweeted_relationship
 
     # Get a TWEETED relationship
@@ -595,23 +169,7 @@ class Neo4jConnector(object):
         :param site:
         :return:
         """
-        # Query
-        q = u"MATCH (m:TwitterUser)-[r:TWEETED]->(n:Website) WHERE m.screen_name=\"{}\" and n.domain_name=\"{}\" RETURN r".format(
-            user1.get('screen_name'), site.get('domain_name')
-        )
-
-        # Get relationship
-        result = self.db.query(
-            q=q,
-            returns=(Relationship)
-        )
-
-        # Check if found
-        if len(result) > 0:
-            return result[0][0]
-        else:
-            return None
-        # end if
+        return self._get_single(u"TWEETED.get", {'source': user1.id, 'target': site.id}, Relationship)
     # end get_tweeted_relationship
 
     # Get a QUOTED relationship
@@ -622,23 +180,7 @@ class Neo4jConnector(object):
         :param user2:
         :return:
         """
-        # Query
-        q = u"MATCH (m:TwitterUser)-[r:QUOTED]->(n:TwitterUser) WHERE m.screen_name=\"{}\" and n.screen_name=\"{}\" RETURN r".format(
-            user1.get('screen_name'), user2.get('screen_name')
-        )
-
-        # Get relationship
-        result = self.db.query(
-            q=q,
-            returns=(Relationship)
-        )
-
-        # Check if found
-        if len(result) > 0:
-            return result[0][0]
-        else:
-            return None
-        # end if
+        return self._get_single(u"QUOTED.get", {'source': user1.id, 'target': user2.id}, Relationship)
     # end get_retweeted_relationship
 
     # Get a HASHTAGED relationship
@@ -649,23 +191,7 @@ class Neo4jConnector(object):
         :param hashtag:
         :return:
         """
-        # Query
-        q = u"MATCH (m:TwitterUser)-[r:HASHTAGED]->(n:Hashtag) WHERE m.screen_name=\"{}\" and n.hashtag_text=\"{}\" RETURN r".format(
-            user.get('screen_name'), hashtag.get('hashtag_text')
-        )
-
-        # Get relationship
-        result = self.db.query(
-            q=q,
-            returns=(Relationship)
-        )
-
-        # Check if found
-        if len(result) > 0:
-            return result[0][0]
-        else:
-            return None
-        # end if
+        return self._get_single(u"HASHTAGED.get", {'source': user.id, 'target': hashtag.id}, Relationship)
     # end get_hashtaged_relationship
 
     # Get a LINKED relationship
@@ -676,23 +202,7 @@ class Neo4jConnector(object):
         :param hashtag2:
         :return:
         """
-        # Query
-        q = u"MATCH (m:Hashtag)-[r:LINKED]->(n:Hashtag) WHERE m.hashtag_text=\"{}\" and n.hashtag_text=\"{}\" RETURN r".format(
-            hashtag1.get('hashtag_text'), hashtag2.get('hashtag_text')
-        )
-
-        # Get relationship
-        result = self.db.query(
-            q=q,
-            returns=(Relationship)
-        )
-
-        # Check if found
-        if len(result) > 0:
-            return result[0][0]
-        else:
-            return None
-        # end if
+        return self._get_single(u"LINKED.get", {'source': hashtag1.id, 'target': hashtag2.id}, Relationship)
     # end get_linked_relationship
 
     # Add a follow relationship
@@ -708,14 +218,30 @@ class Neo4jConnector(object):
 
         # Not exist
         if rel is None:
-            print(u"New FOLLOW relationship between {} and {}".format(user1.get('screen_name'),
-                                                                         user2.get('screen_name')))
-            rel = user1.relationships.create("FOLLOW", user2)
+            print(u"New FOLLOW relationship between {} and {}".format(user1.screen_name, user2.screen_name))
+            rel = self._get_single(u"FOLLOW.create", {'source': user1.id, 'target': user2.id}, Relationship)
         # end if
 
         return rel
     # end retweet_relationship
 
+    # Remove a follow relationship
+    def remove_follow_relationship(self, user1, user2):
+        """
+        Remove a follow relationship
+        :param user1:
+        :param user2:
+        :return:
+        """
+        # Delete if exists
+        removed = self._registry.query(u"FOLLOW.delete", params={'source': user1.id, 'target': user2.id})[0][0]
+
+        # Log
+        if removed > 0:
+            print(u"Removed FOLLOW relationship between {} and {}".format(user1.screen_name, user2.screen_name))
+        # end if
+    # end remove_follow_relationship
+
     # Get a FOLLOW relationship
     def get_follow_relationship(self, user1, user2):
         """
@@ -724,23 +250,7 @@ class Neo4jConnector(object):
         :param user2:
         :return:
         """
-        # Query
-        q = u"MATCH (m:TwitterUser)-[r:FOLLOW]->(n:TwitterUser) WHERE m.screen_name=\"{}\" and n.screen_name=\"{}\" RETURN r".format(
-            user1.get('screen_name'), user2.get('screen_name')
-        )
-
-        # Get relationship
-        result = self.db.query(
-            q=q,
-            returns=(Relationship)
-        )
-
-        # Check if found
-        if len(result) > 0:
-            return result[0][0]
-        else:
-            return None
-        # end if
+        return self._get_single(u"FOLLOW.get", {'source': user1.id, 'target': user2.id}, Relationship)
     # end get_follow_relationship
 
     # Update relation weights
@@ -750,50 +260,11 @@ class Neo4jConnector(object):
         :param relation_type:
         :return:
         """
-        # Types
-        if relation_type == "RETWEETED":
-            type_1 = u"TwitterUser"
-            type_2 = u"TwitterUser"
-            user_property = "retweeted_out"
-        elif relation_type == "FOLLOW":
-            type_1 = u"TwitterUser"
-            type_2 = u"TwitterUser"
-            user_property = "follow_out"
-        elif relation_type == "QUOTED":
-            type_1 = u"TwitterUser"
-            type_2 = u"TwitterUser"
-            user_property = "quoted_out"
-        elif relation_type == "LINKED":
-            type_1 = u"Hashtag"
-            type_2 = u"Hashtag"
-            user_property = "linked_out"
-        elif relation_type == "HASHTAGED":
-            type_1 = u"TwitterUser"
-            type_2 = u"Hashtag"
-            user_property = "hashtaged_out"
-        else:
-            type_1 = u"TwitterUser"
-            type_2 = u"Website"
-            user_property = "tweeted_out"
-        # end if
+        # Write pending counters first
+        self.flush()
 
-        # Query
-        q = u"MATCH (m:{})-[r:{}]->(n:{}) RETURN m, r, n".format(type_1, relation_type, type_2)
-
-        # Get relationship
-        results = self.db.query(
-            q=q,
-            returns=(Node, Relationship, Node)
-        )
-
-        # For each relation
-        for (user_from, relation, user_to) in results:
-            # Divider
-            divider = user_from.get(user_property)
-
-            # Update weight
-            relation.set("weight", float(relation.get("count")) / float(divider))
-        # end for
+        # Compute
+        return WeightEngine(self._registry).compute_relation(relation_type)
     # end update_relation_weights
 
     # Update edge weights
@@ -802,27 +273,192 @@ class Neo4jConnector(object):
         Update edge weights
         :return:
         """
-        # For each relation
-        for relation_type in ["RETWEETED", "FOLLOW", "QUOTED", "TWEETED", "HASHTAGED", "LINKED"]:
-            self.update_relation_weights(relation_type)
-        # end for
+        return self.compute_weights()
     # end update_weights
 
     #################################
     # PRIVATE
     #################################
 
-    # Execute query
-    def _execute_query(self, q):
+    # Load a page of nodes
+    def _load_page(self, label, after, limit):
+        """
+        Load a page of nodes
+        :param label: Node label
+        :param after: Only nodes with an id greater than this one
+        :param limit: Maximum number of nodes
+        :return: List of node records, ordered by id
+        """
+        return [
+            RECORDS[label](node_id, **properties) for node_id, properties in
+            self._registry.query(u"{}.page".format(label), params={'after': after, 'limit': limit})
+        ]
+    # end _load_page
+
+    # Highest node id of a label
+    def _max_node_id(self, label):
+        """
+        Highest node id of a label
+        :param label: Node label
+        :return: Node id, None if there is no node
+        """
+        return self._registry.query(u"{}.bounds".format(label))[0][1]
+    # end _max_node_id
+
+    # Count nodes of a label
+    def _count_nodes(self, label):
+        """
+        Count nodes of a label
+        :param label: Node label
+        :return: Number of nodes
+        """
+        return self._registry.query(u"{}.count".format(label))[0][0]
+    # end _count_nodes
+
+    # Find a node by key
+    def _find_node(self, label, key):
+        """
+        Find a node by key
+        :param label: Node label
+        :param key: Node key
+        :return: The node record, None if not found
+        """
+        return self._get_record(label, u"{}.get".format(label), {'key': key})
+    # end _find_node
+
+    # Load the adjacency of the graph
+    def _load_adjacency(self):
+        """
+        Load the adjacency of the graph, page by page
+        :return: Dictionary of node labels (node id -> label), list of (source id, target id)
+        """
+        # Node ids of each label
+        labels = dict()
+        for label in tanaturf.tools.settings.node_keys:
+            for page in self._iter_rows(u"{}.ids".format(label)):
+                for row in page:
+                    labels[row[0]] = label
+                # end for
+            # end for
+        # end for
+
+        # Relationships
+        edges = list()
+        for page in self._iter_rows(u"relationships.page"):
+            edges.extend([(row[1], row[2]) for row in page])
+        # end for
+
+        return labels, edges
+    # end _load_adjacency
+
+    # Load user classes
+    def _load_classes(self):
+        """
+        Load the class of classified users, page by page
+        :return: Dictionary (node id -> classe)
         """
-        Execute query
-        :param q:
+        classes = dict()
+        for page in self._iter_rows(u"TwitterUser.classes"):
+            classes.update([(row[0], row[1]) for row in page])
+        # end for
+        return classes
+    # end _load_classes
+
+    # Iterate over the pages of a statement with an id cursor
+    def _iter_rows(self, name):
+        """
+        Iterate over the pages of a statement returning rows ordered by id
+        :param name: Statement name, with $after and $limit parameters
+        :return: Iterator of pages of rows
+        """
+        after = -1
+        while True:
+            page = self._registry.query(name, params={'after': after, 'limit': self._page_size})
+            if len(page) == 0:
+                break
+            # end if
+            after = page[-1][0]
+            yield page
+        # end while
+    # end _iter_rows
+
+    # Delete nodes
+    def _delete_nodes(self, node_ids):
+        """
+        Delete nodes and their relationships in one transaction
+        :param node_ids: List of node ids
+        :return:
+        """
+        self._registry.query(u"nodes.delete", params={'ids': list(node_ids)})
+    # end _delete_nodes
+
+    # Add a counted relationship event
+    def _add_relationship(self, relation_type, source, target):
+        """
+        Add a counted relationship event
+        :param relation_type: Relationship type
+        :param source: Source node
+        :param target: Target node
         :return:
         """
-        # Remove lone Twitter users
-        return self.db.query(
-            q=q
+        # Buffer the event, counters are written on flush
+        self._relationship_buffer.add(relation_type, source, target)
+    # end _add_relationship
+
+    # Create a node
+    def _create_node(self, label, **properties):
+        """
+        Create a node
+        :param label: Node label
+        :param properties: Node properties
+        :return: The new node record
+        """
+        return self._get_record(
+            label,
+            u"{}.create".format(label),
+            {'key': properties[tanaturf.tools.settings.node_keys[label]], 'properties': properties}
         )
-    # end _execute_query
+    # end _create_node
+
+    # Run a statement returning at most one node record
+    def _get_record(self, label, name, params):
+        """
+        Run a statement returning at most one node record
+        :param label: Node label
+        :param name: Statement name
+        :param params: Parameters
+        :return: The node record, None if not found
+        """
+        # Query
+        result = self._registry.query(name, params=params)
+
+        # Check if found
+        if len(result) > 0:
+            node_id, properties = result[0]
+            return RECORDS[label](node_id, **properties)
+        else:
+            return None
+        # end if
+    # end _get_record
+
+    # Run a statement returning at most one element
+    def _get_single(self, name, params, returns):
+        """
+        Run a statement returning at most one element
+        :param name: Statement name
+        :param params: Parameters
+        :param returns: Return type
+        :return: The element, None if not found
+        """
+        # Query
+        result = self._registry.query(name, params=params, returns=(returns))
+
+        # Check if found
+        if len(result) > 0:
+            return result[0][0]
+        else:
+            return None
+        # end if
+    # end _get_single
 
 # end Neo4jConnector
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : neo4j.QueryRegistry.py
+# Description : Registry of named Cypher statements with call statistics.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Imports
+import time
+from .statements import STATEMENTS
+
+
+# Query registry
+class QueryRegistry(object):
+    """
+    Runs named, parameterized statements so that the server can reuse
+    query plans, and keeps per-statement call counts and latency.
+    """
+
+    # Constructor
+    def __init__(self, db, statements=None):
+        """
+        Constructor
+        :param db: GraphDatabase
+        :param statements: Dictionary of statements (name -> Cypher), default to all statements
+        """
+        # Properties
+        self._db = db
+        self._statements = dict(STATEMENTS if statements is None else statements)
+
+        # Statistics (name -> [calls, total time, max time])
+        self._statistics = dict()
+    # end __init__
+
+    #################################
+    # PUBLIC
+    #################################
+
+    # Register a statement
+    def register(self, name, q):
+        """
+        Register a statement
+        :param name: Statement name
+        :param q: Cypher statement
+        :return:
+        """
+        self._statements[name] = q
+    # end register
+
+    # Run a statement
+    def query(self, name, params=None, returns=None):
+        """
+        Run a statement
+        :param name: Statement name
+        :param params: Parameters
+        :param returns: Return types (raw values by default)
+        :return: Query results
+        """
+        # Statement
+        q = self._statements[name]
+
+        # Run
+        start_time = time.time()
+        if returns is None:
+            results = self._db.query(q=q, params=params)
+        else:
+            results = self._db.query(q=q, params=params, returns=returns)
+        # end if
+        duration = time.time() - start_time
+
+        # Statistics
+        statistics = self._statistics.setdefault(name, [0, 0.0, 0.0])
+        statistics[0] += 1
+        statistics[1] += duration
+        statistics[2] = max(statistics[2], duration)
+
+        return results
+    # end query
+
+    # Statement statistics
+    def statistics(self):
+        """
+        Statement statistics sorted by total time
+        :return: List of (name, calls, total time, mean time, max time)
+        """
+        return sorted(
+            [(name, calls, total, total / calls, maximum)
+             for name, (calls, total, maximum) in self._statistics.items()],
+            key=lambda s: s[2],
+            reverse=True
+        )
+    # end statistics
+
+    # Print statement statistics
+    def print_statistics(self):
+        """
+        Print statement statistics
+        :return:
+        """
+        for name, calls, total, mean, maximum in self.statistics():
+            print(u"{} : {} calls, {:.3f}s total, {:.4f}s mean, {:.4f}s max".format(name, calls, total, mean, maximum))
+        # end for
+    # end print_statistics
+
+# end QueryRegistry
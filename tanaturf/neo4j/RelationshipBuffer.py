@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : neo4j.RelationshipBuffer.py
+# Description : Write-behind buffer for relationship counters.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Imports
+import time
+
+
+# Relationship buffer
+class RelationshipBuffer(object):
+    """
+    Collects (type, source, target) -> count deltas in memory and writes
+    them with one batched statement per relationship type. Source nodes
+    are labelled as having stale weights.
+    """
+
+    # Constructor
+    def __init__(self, registry, max_size=1000, max_delay=30.0):
+        """
+        Constructor
+        :param registry: QueryRegistry
+        :param max_size: Flush when that many edges are pending
+        :param max_delay: Flush when the last flush is older than that (seconds)
+        """
+        # Properties
+        self._registry = registry
+        self._max_size = max_size
+        self._max_delay = max_delay
+
+        # Pending deltas (type -> (source id, target id) -> count)
+        self._edges = dict()
+        self._size = 0
+        self._last_flush = time.time()
+    # end __init__
+
+    #################################
+    # PROPERTIES
+    #################################
+
+    # Number of pending edges
+    @property
+    def size(self):
+        """
+        Number of pending edges
+        :return:
+        """
+        return self._size
+    # end size
+
+    #################################
+    # PUBLIC
+    #################################
+
+    # Add a relationship event
+    def add(self, relation_type, source, target, count=1):
+        """
+        Add a relationship event
+        :param relation_type: Relationship type (RETWEETED, TWEETED, ...)
+        :param source: Source node
+        :param target: Target node
+        :param count: Count delta
+        :return:
+        """
+        # Edges of this type
+        edges = self._edges.setdefault(relation_type, dict())
+
+        # Key
+        key = (source.id, target.id)
+
+        # New edge
+        if key not in edges:
+            edges[key] = 0
+            self._size += 1
+        # end if
+
+        # Add delta
+        edges[key] += count
+
+        # Thresholds
+        if self._size >= self._max_size or time.time() - self._last_flush >= self._max_delay:
+            self.flush()
+        # end if
+    # end add
+
+    # Flush pending deltas
+    def flush(self):
+        """
+        Flush pending deltas
+        :return: Number of edges written
+        """
+        # Total
+        total = 0
+
+        # For each relationship type, dropped once written so that a failed type does not replay the others
+        for relation_type in list(self._edges.keys()):
+            edges = self._edges[relation_type]
+            if len(edges) > 0:
+                self._flush_type(relation_type, edges)
+                total += len(edges)
+            # end if
+            del self._edges[relation_type]
+            self._size -= len(edges)
+        # end for
+
+        # Reset
+        self._last_flush = time.time()
+
+        return total
+    # end flush
+
+    #################################
+    # PRIVATE
+    #################################
+
+    # Flush one relationship type
+    def _flush_type(self, relation_type, edges):
+        """
+        Flush one relationship type
+        :param relation_type:
+        :param edges:
+        :return:
+        """
+        # Edge rows and per-node deltas
+        edge_rows = list()
+        sources = dict()
+        targets = dict()
+        for (source_id, target_id), count in edges.items():
+            edge_rows.append({'source': source_id, 'target': target_id, 'count': count})
+            sources[source_id] = sources.get(source_id, 0) + count
+            targets[target_id] = targets.get(target_id, 0) + count
+        # end for
+
+        # Execute
+        self._registry.query(
+            u"{}.flush".format(relation_type),
+            params={
+                'edges': edge_rows,
+                'sources': [{'id': node_id, 'count': count} for node_id, count in sources.items()],
+                'targets': [{'id': node_id, 'count': count} for node_id, count in targets.items()]
+            }
+        )
+
+        # Log
+        print(u"Flushed {} {} relationship(s)".format(len(edge_rows), relation_type))
+    # end _flush_type
+
+# end RelationshipBuffer
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : neo4j.SchemaManager.py
+# Description : Creates and verifies the unique constraints of the node keys.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Imports
+from .statements import NODE_KEYS, WEIGHTED_RELATIONSHIPS
+
+
+# Schema manager
+class SchemaManager(object):
+    """
+    Makes sure each node key is backed by a unique constraint, and so by
+    an index. Duplicate nodes left by earlier check-then-create runs are
+    merged first, as the constraint cannot be created while they exist.
+    """
+
+    # Constructor
+    def __init__(self, registry, batch_size=1000, timeout=300):
+        """
+        Constructor
+        :param registry: QueryRegistry
+        :param batch_size: Number of duplicate groups merged per statement
+        :param timeout: Maximum time to wait for the indexes to be online (seconds)
+        """
+        self._registry = registry
+        self._batch_size = batch_size
+        self._timeout = timeout
+    # end __init__
+
+    #################################
+    # PUBLIC
+    #################################
+
+    # Create missing constraints
+    def ensure(self):
+        """
+        Merge duplicates and create the constraint of each label without one, then verify
+        :return: Dictionary of number of merged duplicate nodes per label
+        """
+        # Merged nodes
+        merged = dict()
+
+        # For each label without constraint
+        for label in self.missing():
+            # Duplicates
+            merged[label] = self.merge_duplicates(label)
+
+            # Constraint
+            print(u"Creating unique constraint on {}.{}".format(label, NODE_KEYS[label]))
+            self._registry.query(u"{}.constraint".format(label))
+        # end for
+
+        # Wait for the backing indexes
+        self._registry.query(u"schema.await", params={'timeout': self._timeout})
+
+        # Verify
+        missing = self.missing()
+        if len(missing) > 0:
+            raise RuntimeError(u"Missing unique constraints on {}".format(u", ".join(missing)))
+        # end if
+
+        return merged
+    # end ensure
+
+    # Labels without constraint
+    def missing(self):
+        """
+        Labels whose key has no unique constraint
+        :return: List of labels
+        """
+        # Existing constraints
+        descriptions = [row[0] for row in self._registry.query(u"schema.constraints")]
+
+        return [
+            label for label, key in sorted(NODE_KEYS.items())
+            if not any([self._constrains(description, label, key) for description in descriptions])
+        ]
+    # end missing
+
+    # Merge duplicate nodes of a label
+    def merge_duplicates(self, label):
+        """
+        Merge nodes sharing the same key into the one with the lowest id
+        :param label: Node label
+        :return: Number of removed duplicate nodes
+        """
+        # Groups
+        groups = list()
+        for key, ids in self._registry.query(u"{}.duplicates".format(label)):
+            ids = sorted(ids)
+            groups.append({'keep': ids[0], 'duplicates': ids[1:]})
+        # end for
+
+        # Merge statements, relationships first
+        names = [
+            u"{}.merge.{}.{}".format(label, relation_type, direction)
+            for relation_type, (source_label, target_label, _) in sorted(WEIGHTED_RELATIONSHIPS.items())
+            for direction, endpoint_label in [(u"out", source_label), (u"in", target_label)]
+            if endpoint_label == label
+        ] + [u"{}.merge.delete".format(label)]
+
+        # For each batch of groups
+        n_duplicates = 0
+        for start in range(0, len(groups), self._batch_size):
+            batch = groups[start:start + self._batch_size]
+            for name in names:
+                self._registry.query(name, params={'groups': batch})
+            # end for
+            n_duplicates += sum([len(group['duplicates']) for group in batch])
+            print(u"Merged {} duplicate {} nodes".format(n_duplicates, label))
+        # end for
+
+        return n_duplicates
+    # end merge_duplicates
+
+    #################################
+    # PRIVATE
+    #################################
+
+    # Constraint description matches a label key
+    def _constrains(self, description, label, key):
+        """
+        Constraint description matches a label key
+        :param description: Description as returned by db.constraints()
+        :param label: Node label
+        :param key: Key property
+        :return: True if the description is the unique constraint of the key
+        """
+        return u":{} )".format(label) in description and u".{} IS UNIQUE".format(key) in description
+    # end _constrains
+
+# end SchemaManager
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : neo4j.WeightEngine.py
+# Description : Server-side computation of relationship weights.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Imports
+from .statements import WEIGHTED_RELATIONSHIPS
+
+
+# Weight engine
+class WeightEngine(object):
+    """
+    Computes count / out-degree weights inside the database, one batch
+    of source nodes at a time, either for the whole graph or only for
+    the nodes whose counters changed since the last pass.
+    """
+
+    # Constructor
+    def __init__(self, registry, batch_size=10000):
+        """
+        Constructor
+        :param registry: QueryRegistry
+        :param batch_size: Number of source node ids per statement
+        """
+        self._registry = registry
+        self._batch_size = batch_size
+    # end __init__
+
+    #################################
+    # PUBLIC
+    #################################
+
+    # Compute weights of all relationship types
+    def compute(self, relation_types=None, dry_run=False):
+        """
+        Compute weights of all relationship types
+        :param relation_types: Types to compute (all by default)
+        :param dry_run: Only compute statistics, do not write weights
+        :return: Dictionary of statistics per relationship type
+        """
+        # All types
+        if relation_types is None:
+            relation_types = sorted(WEIGHTED_RELATIONSHIPS.keys())
+        # end if
+
+        # Statistics
+        statistics = dict()
+
+        # For each type
+        for relation_type in relation_types:
+            statistics[relation_type] = self.compute_relation(relation_type, dry_run)
+        # end for
+
+        return statistics
+    # end compute
+
+    # Compute weights of one relationship type
+    def compute_relation(self, relation_type, dry_run=False):
+        """
+        Compute weights of one relationship type
+        :param relation_type:
+        :param dry_run: Only compute statistics, do not write weights
+        :return: Statistics (count, min, max, mean)
+        """
+        # Source label
+        source_label = WEIGHTED_RELATIONSHIPS[relation_type][0]
+
+        # Statement
+        name = self._weight_statement(relation_type, u"window", dry_run)
+
+        # Statistics
+        statistics = WeightStatistics()
+
+        # Id bounds
+        low, high = self._bounds(source_label)
+
+        # For each batch
+        if low is not None:
+            for batch_low in range(low, high + 1, self._batch_size):
+                # Batch
+                batch_high = min(batch_low + self._batch_size - 1, high)
+                result = self._registry.query(name, params={'low': batch_low, 'high': batch_high})
+                statistics.add(*result[0])
+
+                # Progress
+                print(u"{} weights : {:.1f}% ({} relationships)".format(
+                    relation_type,
+                    100.0 * float(batch_high - low + 1) / float(high - low + 1),
+                    statistics.count
+                ))
+            # end for
+        # end if
+
+        return statistics.to_dict()
+    # end compute_relation
+
+    # Compute weights of the nodes with stale weights only
+    def compute_dirty(self, dry_run=False):
+        """
+        Compute weights of the nodes with stale weights only
+        :param dry_run: Only compute statistics, do not write weights nor clear the dirty set
+        :return: Dictionary of statistics per relationship type
+        """
+        # Statistics
+        statistics = dict([(relation_type, WeightStatistics()) for relation_type in WEIGHTED_RELATIONSHIPS])
+
+        # Statements
+        names = dict(
+            [(relation_type, self._weight_statement(relation_type, u"ids", dry_run))
+             for relation_type in WEIGHTED_RELATIONSHIPS]
+        )
+
+        # Cursor
+        after = -1
+        n_nodes = 0
+
+        # For each page of dirty nodes
+        while True:
+            # Page
+            result = self._registry.query(u"dirty.page", params={'after': after, 'limit': self._batch_size})
+            ids = [row[0] for row in result]
+
+            # Done
+            if len(ids) == 0:
+                break
+            # end if
+
+            # For each type
+            for relation_type, name in names.items():
+                result = self._registry.query(name, params={'ids': ids})
+                statistics[relation_type].add(*result[0])
+            # end for
+
+            # Clear dirty set
+            if not dry_run:
+                self._registry.query(u"dirty.clear", params={'ids': ids})
+            # end if
+
+            # Next page
+            after = ids[-1]
+            n_nodes += len(ids)
+
+            # Progress
+            print(u"Weights : {} dirty nodes done".format(n_nodes))
+        # end while
+
+        return dict([(relation_type, statistics[relation_type].to_dict()) for relation_type in statistics])
+    # end compute_dirty
+
+    # Clear the dirty set
+    def clear_dirty(self):
+        """
+        Clear the dirty set
+        :return:
+        """
+        # Cursor
+        after = -1
+
+        # For each page
+        while True:
+            result = self._registry.query(u"dirty.page", params={'after': after, 'limit': self._batch_size})
+            ids = [row[0] for row in result]
+            if len(ids) == 0:
+                break
+            # end if
+            self._registry.query(u"dirty.clear", params={'ids': ids})
+            after = ids[-1]
+        # end while
+    # end clear_dirty
+
+    #################################
+    # PRIVATE
+    #################################
+
+    # Weight statement of a relationship type
+    def _weight_statement(self, relation_type, selection, dry_run):
+        """
+        Weight statement of a relationship type
+        :param relation_type:
+        :param selection: Source selection (window or ids)
+        :param dry_run:
+        :return: Statement name
+        """
+        return u"{}.weights.{}{}".format(relation_type, selection, u".dry" if dry_run else u"")
+    # end _weight_statement
+
+    # Id bounds of a label
+    def _bounds(self, source_label):
+        """
+        Id bounds of a label
+        :param source_label:
+        :return: (min id, max id), (None, None) if empty
+        """
+        result = self._registry.query(u"{}.bounds".format(source_label))
+        return result[0][0], result[0][1]
+    # end _bounds
+
+# end WeightEngine
+
+
+# Weight statistics
+class WeightStatistics(object):
+    """
+    Running weight statistics
+    """
+
+    # Constructor
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.sum = 0.0
+    # end __init__
+
+    # Add a batch
+    def add(self, count, batch_min, batch_max, batch_sum):
+        """
+        Add a batch
+        :param count:
+        :param batch_min:
+        :param batch_max:
+        :param batch_sum:
+        :return:
+        """
+        if count > 0:
+            self.count += count
+            self.sum += batch_sum
+            self.min = batch_min if self.min is None else min(self.min, batch_min)
+            self.max = batch_max if self.max is None else max(self.max, batch_max)
+        # end if
+    # end add
+
+    # To dictionary
+    def to_dict(self):
+        """
+        To dictionary
+        :return:
+        """
+        return {
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.sum / self.count if self.count > 0 else None
+        }
+    # end to_dict
+
+# end WeightStatistics
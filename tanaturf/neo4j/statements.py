@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : neo4j.statements.py
+# Description : Named, parameterized Cypher statements.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Imports
+import tanaturf.tools.settings
+from tanaturf.storage.NodeRecord import RECORDS
+
+
+# Node labels and key property
+NODE_KEYS = tanaturf.tools.settings.node_keys
+
+# Weighted relationships (type -> source label, target label, divider property)
+WEIGHTED_RELATIONSHIPS = tanaturf.tools.settings.weighted_relationships
+
+# Dirty label
+DIRTY_LABEL = tanaturf.tools.settings.weights_dirty_label
+
+# Statements
+STATEMENTS = dict()
+
+#################################
+# NODES
+#################################
+
+# For each label
+for label, key in NODE_KEYS.items():
+    # Node id and hot properties
+    projection = u"id(n), n {{{}}}".format(u", ".join([u"." + name for name, _ in RECORDS[label].fields]))
+
+    # Load a page of nodes
+    STATEMENTS[u"{}.page".format(label)] = (
+        u"MATCH (n:{}) WHERE id(n) > $after RETURN {} ORDER BY id(n) LIMIT $limit".format(label, projection)
+    )
+
+    # Count nodes
+    STATEMENTS[u"{}.count".format(label)] = u"MATCH (n:{}) RETURN count(n)".format(label)
+
+    # Get a node by key
+    STATEMENTS[u"{}.get".format(label)] = (
+        u"MATCH (n:{}) WHERE n.{} = $key RETURN {} LIMIT 1".format(label, key, projection)
+    )
+
+    # Create a node, or get it if another run created it meanwhile
+    STATEMENTS[u"{}.create".format(label)] = (
+        u"MERGE (n:{0} {{{1}: $key}}) ON CREATE SET n = $properties RETURN {2}".format(label, key, projection)
+    )
+# end for
+
+# Set a node property
+STATEMENTS[u"node.set"] = u"MATCH (n) WHERE id(n) = $id SET n += $properties"
+
+# Move the last tweet id of a user forward, unless another process stored a more recent one
+STATEMENTS[u"TwitterUser.advance"] = (
+    u"MATCH (n:TwitterUser) WHERE id(n) = $id "
+    u"SET n.last_tweet_id = CASE WHEN coalesce(n.last_tweet_id, -1) < $last_tweet_id "
+    u"THEN $last_tweet_id ELSE n.last_tweet_id END "
+    u"RETURN n.last_tweet_id"
+)
+
+#################################
+# RELATIONSHIPS
+#################################
+
+# For each type
+for relation_type in WEIGHTED_RELATIONSHIPS:
+    # Get a relationship between two nodes
+    STATEMENTS[u"{}.get".format(relation_type)] = (
+        u"MATCH (m)-[r:{}]->(n) WHERE id(m) = $source AND id(n) = $target RETURN r LIMIT 1".format(relation_type)
+    )
+# end for
+
+# Create a FOLLOW relationship, or get it if another worker created it meanwhile, weights of the follower are stale
+STATEMENTS[u"FOLLOW.create"] = u"""MATCH (m) WHERE id(m) = $source
+MATCH (n) WHERE id(n) = $target
+MERGE (m)-[r:FOLLOW]->(n)
+ON CREATE SET m:{}
+RETURN r""".format(DIRTY_LABEL)
+
+# Remove a FOLLOW relationship
+STATEMENTS[u"FOLLOW.delete"] = (
+    u"OPTIONAL MATCH (m)-[r:FOLLOW]->(n) WHERE id(m) = $source AND id(n) = $target DELETE r RETURN count(r)"
+)
+
+# Flush buffered counters of one relationship type, optional matches keep a row per source and target so that
+# a missing node does not skip the counters after it
+FLUSH_STATEMENT = u"""UNWIND $edges AS row
+MATCH (m) WHERE id(m) = row.source
+MATCH (n) WHERE id(n) = row.target
+MERGE (m)-[r:{relation_type}]->(n)
+ON CREATE SET r.count = row.count
+ON MATCH SET r.count = coalesce(r.count, 0) + row.count
+WITH count(r) AS edges
+UNWIND $sources AS row
+OPTIONAL MATCH (m) WHERE id(m) = row.id
+SET m.{out_property} = coalesce(m.{out_property}, 0) + row.count, m:{dirty_label}
+WITH edges, count(m) AS sources
+UNWIND $targets AS row
+OPTIONAL MATCH (n) WHERE id(n) = row.id
+SET n.{in_property} = coalesce(n.{in_property}, 0) + row.count
+RETURN edges, sources, count(n) AS targets"""
+
+# For each counted type
+for relation_type, (_, _, out_property, in_property) in tanaturf.tools.settings.counted_relationships.items():
+    STATEMENTS[u"{}.flush".format(relation_type)] = FLUSH_STATEMENT.format(
+        relation_type=relation_type,
+        out_property=out_property,
+        in_property=in_property,
+        dirty_label=DIRTY_LABEL
+    )
+# end for
+
+#################################
+# WEIGHTS
+#################################
+
+# Weights of the relationships going out of a set of source ids
+WEIGHT_STATEMENT = u"""MATCH (m:{source_label}) WHERE id(m) IN {selection}
+MATCH (m)-[r:{relation_type}]->(:{target_label})
+WHERE m.{divider} > 0
+WITH r, toFloat(coalesce(r.count, 1)) / toFloat(m.{divider}) AS weight
+{action}RETURN count(r), min(weight), max(weight), sum(weight)"""
+
+# Id bounds of each label
+for label in NODE_KEYS:
+    STATEMENTS[u"{}.bounds".format(label)] = u"MATCH (m:{}) RETURN min(id(m)), max(id(m))".format(label)
+# end for
+
+# For each type
+for relation_type, (source_label, target_label, divider) in WEIGHTED_RELATIONSHIPS.items():
+    # For window and id list selections
+    for selection_name, selection in [(u"window", u"range($low, $high)"), (u"ids", u"$ids")]:
+        # Write and dry run
+        for suffix, action in [(u"", u"SET r.weight = weight\n"), (u".dry", u"")]:
+            STATEMENTS[u"{}.weights.{}{}".format(relation_type, selection_name, suffix)] = WEIGHT_STATEMENT.format(
+                source_label=source_label,
+                selection=selection,
+                relation_type=relation_type,
+                target_label=target_label,
+                divider=divider,
+                action=action
+            )
+        # end for
+    # end for
+# end for
+
+# Next page of nodes with stale weights
+STATEMENTS[u"dirty.page"] = (
+    u"MATCH (m:{0}) WHERE id(m) > $after RETURN id(m) ORDER BY id(m) LIMIT $limit".format(DIRTY_LABEL)
+)
+
+# Mark nodes as having up-to-date weights
+STATEMENTS[u"dirty.clear"] = u"MATCH (m:{0}) WHERE id(m) IN $ids REMOVE m:{0}".format(DIRTY_LABEL)
+
+#################################
+# CLEANING
+#################################
+
+# Node ids of each label
+for label in NODE_KEYS:
+    STATEMENTS[u"{}.ids".format(label)] = (
+        u"MATCH (n:{}) WHERE id(n) > $after RETURN id(n) ORDER BY id(n) LIMIT $limit".format(label)
+    )
+# end for
+
+# Page of user classes
+STATEMENTS[u"TwitterUser.classes"] = (
+    u"MATCH (n:TwitterUser) WHERE id(n) > $after AND n.classe <> '' RETURN id(n), n.classe ORDER BY id(n) "
+    u"LIMIT $limit"
+)
+
+# Page of relationships
+STATEMENTS[u"relationships.page"] = (
+    u"MATCH (m)-[r]->(n) WHERE id(r) > $after RETURN id(r), id(m), id(n) ORDER BY id(r) LIMIT $limit"
+)
+
+# Delete nodes and their relationships
+STATEMENTS[u"nodes.delete"] = u"MATCH (n) WHERE id(n) IN $ids DETACH DELETE n"
+
+#################################
+# SCHEMA
+#################################
+
+# Existing constraints
+STATEMENTS[u"schema.constraints"] = u"CALL db.constraints() YIELD description RETURN description"
+
+# Wait for indexes to be online
+STATEMENTS[u"schema.await"] = u"CALL db.awaitIndexes($timeout)"
+
+# Node counters to add up when merging duplicates (label -> properties)
+MERGED_COUNTERS = dict([(label, set()) for label in NODE_KEYS])
+for source_label, target_label, out_property, in_property in tanaturf.tools.settings.counted_relationships.values():
+    MERGED_COUNTERS[source_label].add(out_property)
+    MERGED_COUNTERS[target_label].add(in_property)
+# end for
+
+# Move the relationships of duplicates to the kept node
+MERGE_STATEMENT = u"""UNWIND $groups AS g
+MATCH (keep) WHERE id(keep) = g.keep
+MATCH {pattern}
+WHERE id(dup) IN g.duplicates AND id(n) <> g.keep AND NOT id(n) IN g.duplicates
+MERGE {merged}
+ON CREATE SET k = properties(r)
+ON MATCH SET k.count = CASE WHEN r.count IS NULL THEN k.count ELSE coalesce(k.count, 0) + r.count END
+RETURN count(k)"""
+
+# For each label
+for label, key in NODE_KEYS.items():
+    # Unique constraint, which also indexes the key
+    STATEMENTS[u"{}.constraint".format(label)] = u"CREATE CONSTRAINT ON (n:{}) ASSERT n.{} IS UNIQUE".format(label, key)
+
+    # Groups of nodes sharing a key
+    STATEMENTS[u"{}.duplicates".format(label)] = (
+        u"MATCH (n:{}) WITH n.{} AS key, collect(id(n)) AS ids WHERE size(ids) > 1 RETURN key, ids".format(label, key)
+    )
+
+    # For each type touching the label
+    for relation_type in WEIGHTED_RELATIONSHIPS:
+        source_label, target_label = WEIGHTED_RELATIONSHIPS[relation_type][:2]
+        if source_label == label:
+            STATEMENTS[u"{}.merge.{}.out".format(label, relation_type)] = MERGE_STATEMENT.format(
+                pattern=u"(dup)-[r:{}]->(n)".format(relation_type),
+                merged=u"(keep)-[k:{}]->(n)".format(relation_type)
+            )
+        # end if
+        if target_label == label:
+            STATEMENTS[u"{}.merge.{}.in".format(label, relation_type)] = MERGE_STATEMENT.format(
+                pattern=u"(n)-[r:{}]->(dup)".format(relation_type),
+                merged=u"(n)-[k:{}]->(keep)".format(relation_type)
+            )
+        # end if
+    # end for
+
+    # Add up counters and delete the duplicates, weights of the kept node are stale
+    STATEMENTS[u"{}.merge.delete".format(label)] = u"""UNWIND $groups AS g
+MATCH (keep) WHERE id(keep) = g.keep
+MATCH (dup) WHERE id(dup) IN g.duplicates
+WITH keep, collect(dup) AS dups
+SET {counters}keep:{dirty_label}
+FOREACH (dup IN dups | DETACH DELETE dup)
+RETURN count(keep)""".format(
+        counters=u"".join([
+            u"keep.{0} = coalesce(keep.{0}, 0) + reduce(s = 0, dup IN dups | s + coalesce(dup.{0}, 0)), ".format(name)
+            for name in sorted(MERGED_COUNTERS[label])
+        ]) + (
+            u"keep.last_tweet_id = reduce(m = coalesce(keep.last_tweet_id, -1), dup IN dups | "
+            u"CASE WHEN coalesce(dup.last_tweet_id, -1) > m THEN dup.last_tweet_id ELSE m END), "
+            if u"last_tweet_id" in dict(RECORDS[label].fields) else u""
+        ),
+        dirty_label=DIRTY_LABEL
+    )
+# end for
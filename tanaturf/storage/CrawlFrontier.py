@@ -0,0 +1,487 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : storage.CrawlFrontier.py
+# Description : Persistent crawl frontier with per-user state.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Imports
+import sqlite3
+import threading
+import time
+
+
+# States
+PENDING = u"pending"
+IN_PROGRESS = u"in_progress"
+DONE = u"done"
+FAILED = u"failed"
+
+
+# Schema
+SCHEMA = u"""
+CREATE TABLE IF NOT EXISTS frontier (
+    screen_name TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    retries INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    worker TEXT,
+    lease_expires REAL,
+    max_id INTEGER,
+    last_tweet_id INTEGER,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS frontier_state_position ON frontier (state, position);
+"""
+
+
+# Crawl frontier
+class CrawlFrontier(object):
+    """
+    Users of a crawl in a SQLite file, in crawl order, each pending, in
+    progress, done or failed. Every change is committed at once, so that an
+    interrupted crawl can be resumed where it stopped. Several processes
+    can share the file: claimed users are leased to a worker, and a lease
+    not renewed by heartbeats expires and frees its users. Heartbeats only
+    renew the users claimed by this process, so that the users left by an
+    earlier run of the same worker expire or are released. A failed user
+    keeps the cursor of its timeline, so that a retry only reads the tweets
+    left unread.
+    """
+
+    # Constructor
+    def __init__(self, path, max_retries=3):
+        """
+        Constructor
+        :param path: Path to the database file
+        :param max_retries: Number of failures after which a user is given up
+        """
+        # Properties
+        self._path = path
+        self._max_retries = max_retries
+
+        # Users claimed by this process, read by the heartbeat thread
+        self._claimed = set()
+        self._claimed_lock = threading.Lock()
+
+        # DB, transactions are explicit
+        self.db = sqlite3.connect(path, isolation_level=None, timeout=60.0)
+        self.db.executescript(SCHEMA)
+
+        # Lease and cursor columns of older files
+        columns = [row[1] for row in self.db.execute(u"PRAGMA table_info(frontier)")]
+        for column, column_type in ((u"worker", u"TEXT"), (u"lease_expires", u"REAL"), (u"max_id", u"INTEGER"),
+                                    (u"last_tweet_id", u"INTEGER")):
+            if column not in columns:
+                self.db.execute(u"ALTER TABLE frontier ADD COLUMN {} {}".format(column, column_type))
+            # end if
+        # end for
+    # end __init__
+
+    #################################
+    # PROPERTIES
+    #################################
+
+    # Number of users
+    @property
+    def size(self):
+        """
+        Number of users in the frontier
+        :return:
+        """
+        return self.db.execute(u"SELECT COUNT(*) FROM frontier").fetchone()[0]
+    # end size
+
+    # Number of users left
+    @property
+    def remaining(self):
+        """
+        Number of users pending or in progress
+        :return:
+        """
+        return self.db.execute(
+            u"SELECT COUNT(*) FROM frontier WHERE state IN (?, ?)",
+            (PENDING, IN_PROGRESS)
+        ).fetchone()[0]
+    # end remaining
+
+    #################################
+    # PUBLIC
+    #################################
+
+    # Start a new crawl
+    def reset(self, screen_names, only_if_finished=False):
+        """
+        Replace the frontier with new users, in crawl order, in one transaction
+        :param screen_names: Iterable of screen names
+        :param only_if_finished: Leave the frontier as it is if it still has users to crawl, another process already
+                                 filled it
+        :return: Number of users
+        """
+        # Listed before locking the file, other workers keep claiming meanwhile
+        if only_if_finished:
+            screen_names = list(screen_names)
+        # end if
+
+        now = time.time()
+        self.db.execute(u"BEGIN IMMEDIATE")
+        try:
+            # Already filled
+            if only_if_finished and self.remaining > 0:
+                self.db.execute(u"ROLLBACK")
+                return self.size
+            # end if
+
+            self.db.execute(u"DELETE FROM frontier")
+            self.db.executemany(
+                u"INSERT OR IGNORE INTO frontier (screen_name, position, state, updated_at) VALUES (?, ?, ?, ?)",
+                ((screen_name, position, PENDING, now) for position, screen_name in enumerate(screen_names))
+            )
+            self.db.execute(u"COMMIT")
+        except Exception:
+            self.db.execute(u"ROLLBACK")
+            raise
+        # end try
+        return self.size
+    # end reset
+
+    # Resume a crawl
+    def resume(self):
+        """
+        Put back the users left in progress by an interrupted crawl, except those leased to a live worker
+        :return: Number of users put back
+        """
+        now = time.time()
+        return self.db.execute(
+            u"UPDATE frontier SET state = ?, worker = NULL, lease_expires = NULL, updated_at = ? "
+            u"WHERE state = ? AND (lease_expires IS NULL OR lease_expires < ?)",
+            (PENDING, now, IN_PROGRESS, now)
+        ).rowcount
+    # end resume
+
+    # Claim users
+    def claim(self, n, worker=None, lease=None):
+        """
+        Take the next pending users, or users whose lease expired, in crawl order, and mark them in progress
+        :param n: Maximum number of users
+        :param worker: Name of the claiming worker
+        :param lease: Time after which the users are freed if the worker does not renew its lease (seconds)
+        :return: List of screen names
+        """
+        now = time.time()
+        self.db.execute(u"BEGIN IMMEDIATE")
+        try:
+            screen_names = [row[0] for row in self.db.execute(
+                u"SELECT screen_name FROM frontier WHERE state = ? OR (state = ? AND lease_expires < ?) "
+                u"ORDER BY position LIMIT ?",
+                (PENDING, IN_PROGRESS, now, n)
+            )]
+            self.db.executemany(
+                u"UPDATE frontier SET state = ?, worker = ?, lease_expires = ?, updated_at = ? WHERE screen_name = ?",
+                [
+                    (IN_PROGRESS, worker, now + lease if lease is not None else None, now, screen_name)
+                    for screen_name in screen_names
+                ]
+            )
+            self.db.execute(u"COMMIT")
+        except Exception:
+            self.db.execute(u"ROLLBACK")
+            raise
+        # end try
+
+        # Own users
+        with self._claimed_lock:
+            self._claimed.update(screen_names)
+        # end with
+        return screen_names
+    # end claim
+
+    # Release the users of an earlier run
+    def release(self, worker):
+        """
+        Put back the users a worker left in progress when it stopped, before it claims new ones under the same name
+        :param worker: Worker name
+        :return: Number of users put back
+        """
+        with self._claimed_lock:
+            claimed = set(self._claimed)
+        # end with
+
+        # Left in progress, not claimed by this process
+        self.db.execute(u"BEGIN IMMEDIATE")
+        try:
+            screen_names = [
+                row[0] for row in self.db.execute(
+                    u"SELECT screen_name FROM frontier WHERE state = ? AND worker = ?",
+                    (IN_PROGRESS, worker)
+                )
+                if row[0] not in claimed
+            ]
+            self.db.executemany(
+                u"UPDATE frontier SET state = ?, worker = NULL, lease_expires = NULL, updated_at = ? "
+                u"WHERE screen_name = ?",
+                [(PENDING, time.time(), screen_name) for screen_name in screen_names]
+            )
+            self.db.execute(u"COMMIT")
+        except Exception:
+            self.db.execute(u"ROLLBACK")
+            raise
+        # end try
+        return len(screen_names)
+    # end release
+
+    # Number of users held by a worker
+    def held(self, worker=None):
+        """
+        Number of users a worker has in progress
+        :param worker: Worker name, None for the users claimed without worker
+        :return:
+        """
+        return self.db.execute(
+            u"SELECT COUNT(*) FROM frontier WHERE state = ? AND worker IS ?",
+            (IN_PROGRESS, worker)
+        ).fetchone()[0]
+    # end held
+
+    # Next lease expiry
+    def next_expiry(self, worker=None):
+        """
+        Time at which the first lease of the other workers expires
+        :param worker: Worker name, its own leases are ignored
+        :return: Time, None if no other worker holds a lease
+        """
+        return self.db.execute(
+            u"SELECT MIN(lease_expires) FROM frontier "
+            u"WHERE state = ? AND worker IS NOT ? AND lease_expires IS NOT NULL",
+            (IN_PROGRESS, worker)
+        ).fetchone()[0]
+    # end next_expiry
+
+    # Renew leases
+    def heartbeat(self, worker, lease, screen_names=None):
+        """
+        Renew the leases of the users a worker has in progress
+        :param worker: Worker name
+        :param lease: New lease duration (seconds)
+        :param screen_names: Users to renew, all the users of the worker if None
+        :return: Number of renewed leases
+        """
+        # All users
+        if screen_names is None:
+            return self.db.execute(
+                u"UPDATE frontier SET lease_expires = ? WHERE state = ? AND worker = ?",
+                (time.time() + lease, IN_PROGRESS, worker)
+            ).rowcount
+        # end if
+
+        # Given users, still held by the worker
+        expires = time.time() + lease
+        self.db.execute(u"BEGIN IMMEDIATE")
+        try:
+            renewed = sum([
+                self.db.execute(
+                    u"UPDATE frontier SET lease_expires = ? WHERE state = ? AND worker = ? AND screen_name = ?",
+                    (expires, IN_PROGRESS, worker, screen_name)
+                ).rowcount
+                for screen_name in screen_names
+            ])
+            self.db.execute(u"COMMIT")
+        except Exception:
+            self.db.execute(u"ROLLBACK")
+            raise
+        # end try
+        return renewed
+    # end heartbeat
+
+    # Renew leases in the background
+    def keep_leases(self, worker, lease, interval=None):
+        """
+        Renew the leases of the users claimed by this process from a thread with its own connection, until the
+        returned event is set
+        :param worker: Worker name
+        :param lease: Lease duration (seconds)
+        :param interval: Time between heartbeats (seconds), a third of the lease by default
+        :return: threading.Event stopping the heartbeats
+        """
+        # Stop event
+        stop = threading.Event()
+
+        # Heartbeats
+        def beat():
+            frontier = CrawlFrontier(self._path, max_retries=self._max_retries)
+            while not stop.wait(interval if interval is not None else lease / 3.0):
+                with self._claimed_lock:
+                    claimed = list(self._claimed)
+                # end with
+                frontier.heartbeat(worker, lease, claimed)
+            # end while
+            frontier.close()
+        # end beat
+
+        # Start
+        heart = threading.Thread(target=beat)
+        heart.daemon = True
+        heart.start()
+
+        return stop
+    # end keep_leases
+
+    # Timeline cursor
+    def cursor(self, screen_name):
+        """
+        Cursor of the timeline of a user left by its failed crawls
+        :param screen_name: Screen name
+        :return: (max id of the tweets left unread, most recent tweet id read), None for each if not read yet
+        """
+        row = self.db.execute(
+            u"SELECT max_id, last_tweet_id FROM frontier WHERE screen_name = ?",
+            (screen_name,)
+        ).fetchone()
+        return (row[0], row[1]) if row is not None else (None, None)
+    # end cursor
+
+    # User done
+    def done(self, screen_name, worker=None):
+        """
+        Mark a user done
+        :param screen_name: Screen name
+        :param worker: Worker name, the user is only marked if the worker still holds it
+        :return: True if marked
+        """
+        # No longer renewed
+        with self._claimed_lock:
+            self._claimed.discard(screen_name)
+        # end with
+
+        if worker is not None:
+            return self.db.execute(
+                u"UPDATE frontier SET state = ?, error = NULL, lease_expires = NULL, max_id = NULL, "
+                u"last_tweet_id = NULL, updated_at = ? WHERE screen_name = ? AND worker = ?",
+                (DONE, time.time(), screen_name, worker)
+            ).rowcount > 0
+        # end if
+        return self.db.execute(
+            u"UPDATE frontier SET state = ?, error = NULL, lease_expires = NULL, max_id = NULL, last_tweet_id = NULL, "
+            u"updated_at = ? WHERE screen_name = ?",
+            (DONE, time.time(), screen_name)
+        ).rowcount > 0
+    # end done
+
+    # User failed
+    def failed(self, screen_name, error, worker=None, max_id=None, last_tweet_id=None):
+        """
+        Count a failure, the user goes back to the end of the frontier until it failed too many times
+        :param screen_name: Screen name
+        :param error: Error message
+        :param worker: Worker name, the failure is only counted if the worker still holds the user
+        :param max_id: Max id of the tweets left unread, None if no tweet was read
+        :param last_tweet_id: Most recent tweet id read, None if no tweet was read
+        :return: True if the user will be retried, False if given up, None if the worker lost it
+        """
+        # No longer renewed
+        with self._claimed_lock:
+            self._claimed.discard(screen_name)
+        # end with
+
+        self.db.execute(u"BEGIN IMMEDIATE")
+        try:
+            row = self.db.execute(
+                u"SELECT retries FROM frontier WHERE screen_name = ? AND (? IS NULL OR worker = ?)",
+                (screen_name, worker, worker)
+            ).fetchone()
+
+            # Lease lost, the user is another worker's
+            if row is None:
+                self.db.execute(u"ROLLBACK")
+                return None
+            # end if
+
+            retries = row[0] + 1
+            retry = retries < self._max_retries
+            self.db.execute(
+                u"UPDATE frontier SET state = ?, retries = ?, error = ?, worker = NULL, lease_expires = NULL, "
+                u"max_id = coalesce(?, max_id), last_tweet_id = coalesce(?, last_tweet_id), updated_at = ?, "
+                u"position = (SELECT MAX(position) + 1 FROM frontier) WHERE screen_name = ?",
+                (
+                    PENDING if retry else FAILED,
+                    retries,
+                    u"{}".format(error),
+                    max_id,
+                    last_tweet_id,
+                    time.time(),
+                    screen_name
+                )
+            )
+            self.db.execute(u"COMMIT")
+        except Exception:
+            self.db.execute(u"ROLLBACK")
+            raise
+        # end try
+        return retry
+    # end failed
+
+    # Run alone
+    def exclusively(self, function, *args, **kwargs):
+        """
+        Run a function while holding the write lock of the file, so that processes sharing the frontier run it one
+        at a time. Claims of other processes wait meanwhile.
+        :param function: Function
+        :param args: Arguments
+        :param kwargs: Keyword arguments
+        :return: Function result
+        """
+        # Lock, waiting as long as another process holds it
+        while True:
+            try:
+                self.db.execute(u"BEGIN IMMEDIATE")
+                break
+            except sqlite3.OperationalError as e:
+                if u"locked" not in u"{}".format(e):
+                    raise
+                # end if
+            # end try
+        # end while
+
+        # Run
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.db.execute(u"ROLLBACK")
+        # end try
+    # end exclusively
+
+    # Count users by state
+    def counts(self):
+        """
+        Number of users in each state
+        :return: Dictionary (state -> number of users)
+        """
+        return dict(self.db.execute(u"SELECT state, COUNT(*) FROM frontier GROUP BY state").fetchall())
+    # end counts
+
+    # Close
+    def close(self):
+        """
+        Close the database
+        :return:
+        """
+        self.db.close()
+    # end close
+
+# end CrawlFrontier
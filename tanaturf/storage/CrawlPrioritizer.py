@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : storage.CrawlPrioritizer.py
+# Description : Crawl priority of Twitter users from the graph around them.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Imports
+import math
+import time
+
+
+# Twitter epoch of snowflake ids (milliseconds)
+TWITTER_EPOCH = 1288834974657
+
+
+# Crawl prioritizer
+class CrawlPrioritizer(object):
+    """
+    Scores Twitter users for the crawl: users referred to by many known
+    users, by classified users, with many relationships, and not crawled
+    for a long time come first. Works on an adjacency held in memory.
+    """
+
+    # Constructor
+    def __init__(self, in_degree_weight=1.0, edge_weight=0.25, classe_weight=2.0, staleness_weight=1.0,
+                 staleness_scale=604800.0):
+        """
+        Constructor
+        :param in_degree_weight: Weight of the log in-degree from known users
+        :param edge_weight: Weight of the log number of relationships counted on the user
+        :param classe_weight: Weight of each classified user referring to the user
+        :param staleness_weight: Weight of the time since the last crawled tweet, capped at one scale
+        :param staleness_scale: Time after which a user is fully stale (seconds)
+        """
+        # Properties
+        self._in_degree_weight = in_degree_weight
+        self._edge_weight = edge_weight
+        self._classe_weight = classe_weight
+        self._staleness_weight = staleness_weight
+        self._staleness_scale = staleness_scale
+    # end __init__
+
+    #################################
+    # PUBLIC
+    #################################
+
+    # Score users
+    def score(self, users, labels, edges, classes, now=None):
+        """
+        Score users
+        :param users: List of UserRecord
+        :param labels: Dictionary of node labels (node id -> label)
+        :param edges: List of (source id, target id), one per relationship
+        :param classes: Dictionary of user classes (node id -> classe), classified users only
+        :param now: Current time (seconds), now by default
+        :return: Dictionary (node id -> score)
+        """
+        # Now
+        now = now if now is not None else time.time()
+
+        # Referrers of each user
+        in_degree = dict()
+        classed_referrers = dict()
+        for source, target in edges:
+            # Only references between users
+            if labels.get(source) != "TwitterUser" or labels.get(target) != "TwitterUser" or source == target:
+                continue
+            # end if
+
+            # Count
+            in_degree[target] = in_degree.get(target, 0) + 1
+            if source in classes:
+                classed_referrers.setdefault(target, set()).add(source)
+            # end if
+        # end for
+
+        # Scores
+        scores = dict()
+        for user in users:
+            # Relationships counted on the user
+            n_edges = user.retweet_out + user.tweeted_out + user.quoted_out + user.hashtaged_out
+
+            # Score
+            scores[user.id] = (
+                self._in_degree_weight * math.log1p(in_degree.get(user.id, 0)) +
+                self._edge_weight * math.log1p(n_edges) +
+                self._classe_weight * len(classed_referrers.get(user.id, ())) +
+                self._staleness_weight * self._staleness(user.last_tweet_id, now)
+            )
+        # end for
+
+        return scores
+    # end score
+
+    #################################
+    # PRIVATE
+    #################################
+
+    # Staleness of a user
+    def _staleness(self, last_tweet_id, now):
+        """
+        Time since the last crawled tweet, from its snowflake id, relative to the scale
+        :param last_tweet_id: Last crawled tweet id, -1 or 0 if never crawled
+        :param now: Current time (seconds)
+        :return: Staleness between 0 and 1
+        """
+        # Never crawled
+        if last_tweet_id is None or last_tweet_id <= 0:
+            return 1.0
+        # end if
+
+        # Tweet time
+        tweeted_at = ((last_tweet_id >> 22) + TWITTER_EPOCH) / 1000.0
+
+        return min(max(now - tweeted_at, 0.0) / self._staleness_scale, 1.0)
+    # end _staleness
+
+# end CrawlPrioritizer
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : storage.GraphPruner.py
+# Description : Iterative minimum in-degree pruning of the graph.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+# Graph pruner
+class GraphPruner(object):
+    """
+    Removes, round after round, the nodes whose in-degree is below the
+    minimum of their label, until no node is left to remove (as in a
+    k-core decomposition). As in the original lone wolf queries, nodes
+    nobody referred to before pruning, such as freshly seeded users, are
+    kept, while nodes orphaned by the removal of their neighbours are
+    removed. Works on an adjacency held in memory.
+    """
+
+    # Constructor
+    def __init__(self, min_inputs, keep_sources=()):
+        """
+        Constructor
+        :param min_inputs: Minimum in-degree of each label (label -> minimum), other labels are never removed
+        :param keep_sources: Labels whose nodes are kept as long as they have outgoing relationships
+        """
+        # Properties
+        self._min_inputs = dict(min_inputs)
+        self._keep_sources = set(keep_sources)
+    # end __init__
+
+    #################################
+    # PUBLIC
+    #################################
+
+    # Prune a graph
+    def prune(self, labels, edges, protected=()):
+        """
+        Prune a graph
+        :param labels: Dictionary of node labels (node id -> label)
+        :param edges: List of (source id, target id), one per relationship
+        :param protected: Node ids never removed (classified users, ...)
+        :return: List of removed node ids in removal order, list of number of nodes removed at each round
+        """
+        # Degrees and adjacency
+        in_degree = dict([(node_id, 0) for node_id in labels])
+        out_degree = dict([(node_id, 0) for node_id in labels])
+        sources = dict()
+        targets = dict()
+        for source, target in edges:
+            # Only nodes of the graph
+            if source not in labels or target not in labels:
+                continue
+            # end if
+
+            # Count
+            out_degree[source] += 1
+            in_degree[target] += 1
+            targets.setdefault(source, list()).append(target)
+            sources.setdefault(target, list()).append(source)
+        # end for
+
+        # Pruning state, nodes without incoming relationships from the start are never removed
+        protected = set(protected)
+        protected.update([node_id for node_id in labels if in_degree[node_id] == 0])
+        removed = set()
+        removed_ids = list()
+        rounds = list()
+
+        # First round candidates
+        current = [
+            node_id for node_id in labels
+            if node_id not in protected and self._failing(labels[node_id], in_degree[node_id], out_degree[node_id])
+        ]
+
+        # Until convergence
+        while len(current) > 0:
+            # Remove the whole round
+            removed.update(current)
+            removed_ids.extend(current)
+            rounds.append(len(current))
+
+            # Update degrees of the remaining neighbours
+            candidates = set()
+            for node_id in current:
+                for target in targets.get(node_id, []):
+                    if target not in removed:
+                        in_degree[target] -= 1
+                        candidates.add(target)
+                    # end if
+                # end for
+                for source in sources.get(node_id, []):
+                    if source not in removed:
+                        out_degree[source] -= 1
+                        candidates.add(source)
+                    # end if
+                # end for
+            # end for
+
+            # Next round
+            current = [
+                node_id for node_id in candidates
+                if node_id not in protected and self._failing(labels[node_id], in_degree[node_id], out_degree[node_id])
+            ]
+        # end while
+
+        return removed_ids, rounds
+    # end prune
+
+    #################################
+    # PRIVATE
+    #################################
+
+    # Node must be removed
+    def _failing(self, label, in_degree, out_degree):
+        """
+        Node must be removed
+        :param label: Node label
+        :param in_degree: Current in-degree
+        :param out_degree: Current out-degree
+        :return: True if the node must be removed
+        """
+        # Never removed
+        if label not in self._min_inputs:
+            return False
+        # end if
+
+        # Sources are kept
+        if label in self._keep_sources and out_degree > 0:
+            return False
+        # end if
+
+        return in_degree < self._min_inputs[label]
+    # end _failing
+
+# end GraphPruner
@@ -0,0 +1,717 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : storage.GraphStorage.py
+# Description : Interface of the graph storage backends.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Imports
+import tld.exceptions
+from tld import get_tld
+import tanaturf.tools.settings
+from .CrawlPrioritizer import CrawlPrioritizer
+from .GraphPruner import GraphPruner
+
+
+# Graph storage
+class GraphStorage(object):
+    """
+    Graph storage backend. Keeps the key -> node identity maps, which are
+    filled as nodes are looked up or created, and streams node lists page
+    by page. Backends implement the storage primitives.
+    """
+
+    # Constructor
+    def __init__(self, page_size=1000):
+        """
+        Constructor
+        :param page_size: Number of nodes per page when streaming node lists
+        """
+        # Page size
+        self._page_size = page_size
+
+        # Identity maps (key -> node)
+        self._user_index = dict()
+        self._website_index = dict()
+        self._hashtag_index = dict()
+    # end __init__
+
+    #################################
+    # PROPERTIES
+    #################################
+
+    # Twitter users
+    @property
+    def users(self):
+        """
+        Twitter users, streamed page by page
+        :return:
+        """
+        return self.iter_nodes("TwitterUser")
+    # end users
+
+    # Web sites
+    @property
+    def sites(self):
+        """
+        Web sites, streamed page by page
+        :return:
+        """
+        return self.iter_nodes("Website")
+    # end sites
+
+    # Hashtags
+    @property
+    def hashtags(self):
+        """
+        Hashtags, streamed page by page
+        :return:
+        """
+        return self.iter_nodes("Hashtag")
+    # end hashtags
+
+    # Number of twitter users
+    @property
+    def n_user_node(self):
+        """
+        Number of twitter users
+        :return:
+        """
+        return self._count_nodes("TwitterUser")
+    # end n_twitter_user
+
+    # Number of website nodes
+    @property
+    def n_website_node(self):
+        """
+        Number of website nodes
+        :return:
+        """
+        return self._count_nodes("Website")
+    # end n_website_node
+
+    #################################
+    # PUBLIC
+    #################################
+
+    # Iterate over pages of nodes
+    def iter_node_pages(self, label, page_size=None):
+        """
+        Iterate over pages of nodes, ordered by id. Only nodes existing when
+        the iteration starts are returned, not the ones created meanwhile.
+        :param label: Node label
+        :param page_size: Number of nodes per page
+        :return: Iterator of node lists
+        """
+        # Page size
+        if page_size is None:
+            page_size = self._page_size
+        # end if
+
+        # Last node of the snapshot
+        last_id = self._max_node_id(label)
+
+        # Cursor
+        after = -1
+
+        # For each page
+        while last_id is not None and after < last_id:
+            # Page
+            page = [node for node in self._load_page(label, after, page_size) if node.id <= last_id]
+
+            # Done
+            if len(page) == 0:
+                break
+            # end if
+
+            # Next page (before the caller can reorder this one)
+            after = page[-1].id
+
+            yield page
+        # end while
+    # end iter_node_pages
+
+    # Iterate over nodes
+    def iter_nodes(self, label, page_size=None):
+        """
+        Iterate over nodes, one page in memory at a time
+        :param label: Node label
+        :param page_size: Number of nodes per page
+        :return: Iterator of nodes
+        """
+        for page in self.iter_node_pages(label, page_size):
+            for node in page:
+                yield node
+            # end for
+        # end for
+    # end iter_nodes
+
+    # Twitter user id index
+    def user_id_index(self):
+        """
+        Index of the Twitter users by Twitter user id
+        :return: Dictionary (Twitter user id -> user node), list of user nodes without Twitter user id
+        """
+        # Index and users without id
+        index = dict()
+        missing = list()
+
+        # For each user
+        for user in self.users:
+            if user.user_id is not None:
+                index[user.user_id] = user
+            else:
+                missing.append(user)
+            # end if
+        # end for
+
+        return index, missing
+    # end user_id_index
+
+    # Clear identity maps
+    def clear_identity_maps(self):
+        """
+        Forget known nodes, after nodes were deleted
+        :return:
+        """
+        self._user_index = dict()
+        self._website_index = dict()
+        self._hashtag_index = dict()
+    # end clear_identity_maps
+
+    # Add user node
+    def add_user_node(self, screen_name, followers_count, statuses_count, url, localisation, last_tweet_id=-1, classe="",
+                      user_id=None):
+        """
+        Add Twitter user
+        :param screen_name:
+        :param followers_count:
+        :param statuses_count:
+        :param url:
+        :param user_id: Twitter user id
+        :return:
+        """
+        # Banned
+        if screen_name in tanaturf.tools.settings.forbidden_nodes:
+            return None
+        # end if
+
+        # Get user node
+        user_node = self.get_user_node(screen_name=screen_name)
+
+        # Create if does not exists
+        if user_node is None:
+            print(u"New user node for {}".format(screen_name))
+            # Create user
+            user_node = self._create_node(
+                "TwitterUser",
+                screen_name=screen_name,
+                Label=screen_name,
+                followers_count=followers_count,
+                statuses_count=statuses_count,
+                url=url,
+                localisation=localisation,
+                retweeted_in=0,
+                retweeted_out=0,
+                quoted_in=0,
+                quoted_out=0,
+                hashtaged_out=0,
+                followed=0,
+                following=0,
+                tweeted_out=0,
+                last_tweet_id=last_tweet_id,
+                classe=classe,
+                user_id=user_id
+            )
+
+            # Add to index
+            self._user_index[screen_name] = user_node
+
+            # Add website
+            website_node = self.add_web_site(url)
+
+            # Link user and website
+            if website_node is not None:
+                self.tweeted_relationship(user_node, website_node)
+            # end if
+        elif user_id is not None and user_node.user_id is None:
+            # Remember Twitter user id
+            self.set_node_properties(user_node, user_id=user_id)
+        # end if
+
+        return user_node
+    # end add_user_node
+
+    # Get user node
+    def get_user_node(self, screen_name):
+        """
+        Get a twitter user, from the identity map if already seen
+        :param screen_name:
+        :return:
+        """
+        return self._get_node("TwitterUser", screen_name, self._user_index)
+    # end get_twitter_user
+
+    # Add web site
+    def add_web_site(self, url):
+        """
+        Add web site
+        :param domain_name:
+        :param country:
+        :return:
+        """
+        # Try to get the domain name and suffix
+        try:
+            domain_name = unicode(get_tld(url, as_object=True))
+            tld_code = get_tld(url, as_object=True).suffix
+        except tld.exceptions.TldBadUrl as e:
+            return
+        except tld.exceptions.TldDomainNotFound as e:
+            return
+        except AttributeError as e:
+            return
+        # end try
+
+        # Not banned
+        if domain_name not in tanaturf.tools.settings.forbidden_nodes:
+            # Get website node
+            website_node = self.get_website_node(domain_name=domain_name)
+
+            # Add if does not exists
+            if website_node is None:
+                print(u"New web site node {}/{}".format(domain_name, tld_code))
+                website_node = self._create_node(
+                    "Website",
+                    domain_name=domain_name,
+                    Label=domain_name,
+                    tld_code=tld_code,
+                    tweeted_in=0
+                )
+                self._website_index[domain_name] = website_node
+            # end if
+
+            return website_node
+        else:
+            print(u"Website {} is banned".format(domain_name))
+        # end if
+    # end add_web_site
+
+    # Get a web site
+    def get_website_node(self, domain_name):
+        """
+        Get a web site, from the identity map if already seen
+        :param domain_name:
+        :return:
+        """
+        return self._get_node("Website", domain_name, self._website_index)
+    # end get_website
+
+    # Add hashtag node
+    def add_hashtag_node(self, hashtag_text, last_tweet_id=-1):
+        """
+        Add a hashtag node
+        :param hashtag:
+        :param last_tweet_id:
+        :return:
+        """
+        # Get hashtag node
+        hashtag_node = self.get_hashtag_node(hashtag_text=hashtag_text)
+
+        # Create if does not exists
+        if hashtag_node is None:
+            print(u"New hashtag node for {}".format(hashtag_text))
+            # Create user
+            hashtag_node = self._create_node(
+                "Hashtag",
+                hashtag_text=hashtag_text,
+                Label=hashtag_text,
+                hashtaged_in=0,
+                linked_in=0,
+                linked_out=0,
+                last_tweet_id=last_tweet_id
+            )
+
+            # Add to index
+            self._hashtag_index[hashtag_text] = hashtag_node
+        # end if
+
+        return hashtag_node
+    # end add_user_node
+
+    # Get hashtag node
+    def get_hashtag_node(self, hashtag_text):
+        """
+        Get a hashtag node, from the identity map if already seen
+        :param hashtag:
+        :return:
+        """
+        return self._get_node("Hashtag", hashtag_text, self._hashtag_index)
+    # end get_hashtag_node
+
+    # Add a retweet relationship
+    def retweet_relationship(self, user1, user2):
+        """
+        Add a retweet relationship
+        :param user1:
+        :param user2:
+        :return:
+        """
+        self._count_relationship("RETWEETED", user1, user2)
+    # end retweet_relationship
+
+    # Add a tweeted relationship
+    def tweeted_relationship(self, user1, site):
+        """
+        Add a tweeted relationship
+        :param user1:
+        :param site:
+        :return:
+        """
+        self._count_relationship("TWEETED", user1, site)
+    # end tweeted_relationship
+
+    # Add a quoted relationship
+    def quoted_relationship(self, user1, user2):
+        """
+        Add a quoted relationship
+        :param user1:
+        :param user2:
+        :return:
+        """
+        self._count_relationship("QUOTED", user1, user2)
+    # end quoted_relationship
+
+    # Add a hashtaged relationship
+    def hashtaged_relationship(self, user, hashtag):
+        """
+        Add a hashtaged relationship
+        :param user:
+        :param hashtag:
+        :return:
+        """
+        self._count_relationship("HASHTAGED", user, hashtag)
+    # end hashtaged_relationship
+
+    # Add a linked relationship
+    def linked_relationship(self, hashtag1, hashtag2):
+        """
+        Add a linked relationship
+        :param hashtag1:
+        :param hashtag2:
+        :return:
+        """
+        self._count_relationship("LINKED", hashtag1, hashtag2)
+    # end linked_relationship
+
+    # Add a follow relationship
+    def follow_relationship(self, user1, user2):
+        """
+        Add a follow relationship
+        :param user1:
+        :param user2:
+        :return:
+        """
+        raise NotImplementedError(u"follow_relationship not implemented")
+    # end follow_relationship
+
+    # Remove a follow relationship
+    def remove_follow_relationship(self, user1, user2):
+        """
+        Remove a follow relationship
+        :param user1:
+        :param user2:
+        :return:
+        """
+        raise NotImplementedError(u"remove_follow_relationship not implemented")
+    # end remove_follow_relationship
+
+    # Set node properties
+    def set_node_properties(self, node, **properties):
+        """
+        Set node properties
+        :param node: Node
+        :param properties: Properties to set
+        :return:
+        """
+        raise NotImplementedError(u"set_node_properties not implemented")
+    # end set_node_properties
+
+    # Move the last tweet id of a user forward
+    def advance_last_tweet_id(self, user, last_tweet_id=-1):
+        """
+        Set the last tweet id of a user unless another process already stored a more recent one, in one statement,
+        the record gets the stored id. The default only reads it.
+        :param user: User record
+        :param last_tweet_id: Most recent tweet id read
+        :return: Stored last tweet id
+        """
+        raise NotImplementedError(u"advance_last_tweet_id not implemented")
+    # end advance_last_tweet_id
+
+    # Create and verify the schema
+    def ensure_schema(self, batch_size=1000):
+        """
+        Create and verify the unique keys and indexes, merging existing duplicate nodes
+        :param batch_size: Number of duplicate groups merged per statement
+        :return: Dictionary of number of merged duplicate nodes per label
+        """
+        raise NotImplementedError(u"ensure_schema not implemented")
+    # end ensure_schema
+
+    # Flush pending writes
+    def flush(self):
+        """
+        Write pending relationships to the storage
+        :return: Number of relationships written
+        """
+        raise NotImplementedError(u"flush not implemented")
+    # end flush
+
+    # Compute weights
+    def compute_weights(self, dry_run=False, batch_size=10000, incremental=True):
+        """
+        Compute weights (count / out degree)
+        :param dry_run: Only return weight statistics, do not write
+        :param batch_size: Number of source nodes per batch
+        :param incremental: Only recompute the outgoing relationships of nodes whose counters changed
+        :return: Dictionary of statistics per relationship type
+        """
+        raise NotImplementedError(u"compute_weights not implemented")
+    # end compute_weights
+
+    # Clean lone wolves
+    def clean_lone_wolves(self, min_inputs=2, min_website_inputs=1, min_hashtag_inputs=1, batch_size=1000,
+                          dry_run=False, keep_classified=False):
+        """
+        Clean love wolves, pruning iteratively until no node is left to remove
+        :param min_inputs: Minimum in-degree of Twitter users without outgoing relationships
+        :param min_website_inputs: Minimum in-degree of web sites
+        :param min_hashtag_inputs: Minimum in-degree of hashtags
+        :param batch_size: Number of nodes deleted per transaction
+        :param dry_run: Only report the nodes to remove, do not delete
+        :param keep_classified: Never remove classified users
+        :return: List of number of nodes removed at each round
+        """
+        # Pruner
+        pruner = GraphPruner(
+            {"TwitterUser": min_inputs, "Website": min_website_inputs, "Hashtag": min_hashtag_inputs},
+            keep_sources=["TwitterUser"]
+        )
+
+        # Adjacency
+        labels, edges = self._load_adjacency()
+        print(u"Loaded {} nodes and {} relationships".format(len(labels), len(edges)))
+
+        # Classified users kept
+        protected = self._load_classes() if keep_classified else dict()
+        if keep_classified:
+            print(u"{} classified users kept".format(len(protected)))
+        # end if
+
+        # Prune
+        removed_ids, rounds = pruner.prune(labels, edges, protected=protected)
+        for round_index, n_removed in enumerate(rounds):
+            print(u"Round {} : {} node(s) removed".format(round_index + 1, n_removed))
+        # end for
+        print(u"{} node(s) to remove in {} round(s)".format(len(removed_ids), len(rounds)))
+
+        # Delete by batch
+        if not dry_run:
+            for start in range(0, len(removed_ids), batch_size):
+                self._delete_nodes(removed_ids[start:start + batch_size])
+                print(u"Deleted {}/{} nodes".format(min(start + batch_size, len(removed_ids)), len(removed_ids)))
+            # end for
+
+            # Deleted nodes may be known
+            self.clear_identity_maps()
+        # end if
+
+        return rounds
+    # end clean_lone_wolves
+
+    # Crawl priorities
+    def crawl_priorities(self, users, prioritizer=None):
+        """
+        Score users for the crawl from the graph around them
+        :param users: List of user records
+        :param prioritizer: CrawlPrioritizer, default weights if None
+        :return: Dictionary (node id -> score)
+        """
+        # Adjacency and classes
+        labels, edges = self._load_adjacency()
+        classes = self._load_classes()
+        print(u"Loaded {} nodes, {} relationships and {} classified users".format(
+            len(labels),
+            len(edges),
+            len(classes)
+        ))
+
+        # Score
+        prioritizer = prioritizer if prioritizer is not None else CrawlPrioritizer()
+        return prioritizer.score(users, labels, edges, classes)
+    # end crawl_priorities
+
+    # Print statement statistics
+    def print_query_statistics(self):
+        """
+        Print call counts and latency of the storage statements
+        :return:
+        """
+        pass
+    # end print_query_statistics
+
+    #################################
+    # PRIVATE
+    #################################
+
+    # Get a node from an identity map or from the storage
+    def _get_node(self, label, key, index):
+        """
+        Get a node from an identity map or from the storage
+        :param label: Node label
+        :param key: Node key
+        :param index: Identity map of the label
+        :return: The node, None if not found
+        """
+        # Already known
+        if key in index:
+            return index[key]
+        # end if
+
+        # Query
+        node = self._find_node(label, key)
+
+        # Found
+        if node is not None:
+            index[key] = node
+        # end if
+
+        return node
+    # end _get_node
+
+    # Load a page of nodes
+    def _load_page(self, label, after, limit):
+        """
+        Load a page of nodes
+        :param label: Node label
+        :param after: Only nodes with an id greater than this one
+        :param limit: Maximum number of nodes
+        :return: List of nodes, ordered by id
+        """
+        raise NotImplementedError(u"_load_page not implemented")
+    # end _load_page
+
+    # Highest node id of a label
+    def _max_node_id(self, label):
+        """
+        Highest node id of a label
+        :param label: Node label
+        :return: Node id, None if there is no node
+        """
+        raise NotImplementedError(u"_max_node_id not implemented")
+    # end _max_node_id
+
+    # Count nodes of a label
+    def _count_nodes(self, label):
+        """
+        Count nodes of a label
+        :param label: Node label
+        :return: Number of nodes
+        """
+        raise NotImplementedError(u"_count_nodes not implemented")
+    # end _count_nodes
+
+    # Find a node by key
+    def _find_node(self, label, key):
+        """
+        Find a node by key
+        :param label: Node label
+        :param key: Node key
+        :return: The node, None if not found
+        """
+        raise NotImplementedError(u"_find_node not implemented")
+    # end _find_node
+
+    # Create a node
+    def _create_node(self, label, **properties):
+        """
+        Create a node
+        :param label: Node label
+        :param properties: Node properties
+        :return: The new node
+        """
+        raise NotImplementedError(u"_create_node not implemented")
+    # end _create_node
+
+    # Load the adjacency of the graph
+    def _load_adjacency(self):
+        """
+        Load the adjacency of the graph
+        :return: Dictionary of node labels (node id -> label), list of (source id, target id)
+        """
+        raise NotImplementedError(u"_load_adjacency not implemented")
+    # end _load_adjacency
+
+    # Load user classes
+    def _load_classes(self):
+        """
+        Load the class of classified users
+        :return: Dictionary (node id -> classe)
+        """
+        raise NotImplementedError(u"_load_classes not implemented")
+    # end _load_classes
+
+    # Delete nodes
+    def _delete_nodes(self, node_ids):
+        """
+        Delete nodes and their relationships in one transaction
+        :param node_ids: List of node ids
+        :return:
+        """
+        raise NotImplementedError(u"_delete_nodes not implemented")
+    # end _delete_nodes
+
+    # Count a relationship event
+    def _count_relationship(self, relation_type, source, target):
+        """
+        Count a relationship event, in the storage and on the source record
+        :param relation_type: Relationship type
+        :param source: Source node record
+        :param target: Target node record
+        :return:
+        """
+        # Storage
+        self._add_relationship(relation_type, source, target)
+
+        # Source counter
+        source.increment(tanaturf.tools.settings.counted_relationships[relation_type][2])
+    # end _count_relationship
+
+    # Add a counted relationship event
+    def _add_relationship(self, relation_type, source, target):
+        """
+        Add a counted relationship event
+        :param relation_type: Relationship type
+        :param source: Source node
+        :param target: Target node
+        :return:
+        """
+        raise NotImplementedError(u"_add_relationship not implemented")
+    # end _add_relationship
+
+# end GraphStorage
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : storage.NodeRecord.py
+# Description : Compact in-memory node records.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+# Node record
+class NodeRecord(object):
+    """
+    Node id and hot properties of a node, held in slots. Records are
+    plain values: reading them never goes to the storage.
+    """
+
+    # Slots
+    __slots__ = ('id',)
+
+    # Label
+    label = None
+
+    # Hot properties and their default value
+    fields = ()
+
+    # Constructor
+    def __init__(self, node_id, **properties):
+        """
+        Constructor
+        :param node_id: Node id
+        :param properties: Property values, missing ones get their default
+        """
+        self.id = node_id
+        for name, default in self.fields:
+            value = properties.get(name)
+            setattr(self, name, default if value is None else value)
+        # end for
+    # end __init__
+
+    #################################
+    # PUBLIC
+    #################################
+
+    # Get a property
+    def get(self, name, default=None):
+        """
+        Get a property
+        :param name: Property name
+        :param default: Default value
+        :return:
+        """
+        return getattr(self, name, default)
+    # end get
+
+    # Update hot properties
+    def update(self, properties):
+        """
+        Update hot properties, others are ignored
+        :param properties: Dictionary of properties
+        :return:
+        """
+        for name, _ in self.fields:
+            if name in properties:
+                setattr(self, name, properties[name])
+            # end if
+        # end for
+    # end update
+
+    # Increment a counter
+    def increment(self, name, value=1):
+        """
+        Increment a counter if it is a hot property
+        :param name: Counter name
+        :param value: Increment
+        :return:
+        """
+        if hasattr(self, name):
+            setattr(self, name, getattr(self, name) + value)
+        # end if
+    # end increment
+
+    #################################
+    # OVERRIDE
+    #################################
+
+    # Representation
+    def __repr__(self):
+        """
+        Representation
+        :return:
+        """
+        return u"{}({}, {})".format(self.__class__.__name__, self.id, getattr(self, self.fields[0][0]))
+    # end __repr__
+
+# end NodeRecord
+
+
+# Twitter user record
+class UserRecord(NodeRecord):
+    """
+    Twitter user record
+    """
+
+    # Slots
+    __slots__ = ('screen_name', 'user_id', 'last_tweet_id', 'followers_count', 'statuses_count', 'retweet_out',
+                 'tweeted_out', 'quoted_out', 'hashtaged_out')
+
+    # Label
+    label = "TwitterUser"
+
+    # Hot properties
+    fields = (
+        ('screen_name', None),
+        ('user_id', None),
+        ('last_tweet_id', -1),
+        ('followers_count', 0),
+        ('statuses_count', 0),
+        ('retweet_out', 0),
+        ('tweeted_out', 0),
+        ('quoted_out', 0),
+        ('hashtaged_out', 0)
+    )
+
+# end UserRecord
+
+
+# Website record
+class WebsiteRecord(NodeRecord):
+    """
+    Website record
+    """
+
+    # Slots
+    __slots__ = ('domain_name',)
+
+    # Label
+    label = "Website"
+
+    # Hot properties
+    fields = (
+        ('domain_name', None),
+    )
+
+# end WebsiteRecord
+
+
+# Hashtag record
+class HashtagRecord(NodeRecord):
+    """
+    Hashtag record
+    """
+
+    # Slots
+    __slots__ = ('hashtag_text', 'last_tweet_id', 'linked_out')
+
+    # Label
+    label = "Hashtag"
+
+    # Hot properties
+    fields = (
+        ('hashtag_text', None),
+        ('last_tweet_id', -1),
+        ('linked_out', 0)
+    )
+
+# end HashtagRecord
+
+
+# Record class of each label
+RECORDS = dict([(record.label, record) for record in [UserRecord, WebsiteRecord, HashtagRecord]])
@@ -0,0 +1,429 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : storage.SQLiteConnector.py
+# Description : Embedded SQLite graph storage.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Imports
+import sqlite3
+import tanaturf.tools.settings
+from .GraphStorage import GraphStorage
+from .NodeRecord import RECORDS
+
+
+# Schema
+SCHEMA = [
+    u"CREATE TABLE IF NOT EXISTS nodes (id INTEGER PRIMARY KEY, label TEXT NOT NULL, key TEXT NOT NULL)",
+    u"CREATE UNIQUE INDEX IF NOT EXISTS nodes_label_key ON nodes (label, key)",
+    u"CREATE TABLE IF NOT EXISTS properties (node_id INTEGER NOT NULL, name TEXT NOT NULL, value, "
+    u"PRIMARY KEY (node_id, name)) WITHOUT ROWID",
+    u"CREATE TABLE IF NOT EXISTS relationships (type TEXT NOT NULL, source INTEGER NOT NULL, target INTEGER NOT NULL, "
+    u"count INTEGER NOT NULL DEFAULT 0, weight REAL, PRIMARY KEY (type, source, target)) WITHOUT ROWID",
+    u"CREATE INDEX IF NOT EXISTS relationships_source ON relationships (source)",
+    u"CREATE INDEX IF NOT EXISTS relationships_target ON relationships (target)",
+    u"CREATE TABLE IF NOT EXISTS dirty (node_id INTEGER PRIMARY KEY)"
+]
+
+# Divider of a relationship weight (property of the source node)
+DIVIDER_EXPRESSION = u"(SELECT p.value FROM properties p WHERE p.node_id = {table}.source AND p.name = ?)"
+
+
+# SQLite connector
+class SQLiteConnector(GraphStorage):
+    """
+    Embedded SQLite graph storage, for single-machine crawls, benchmarks
+    and runs without a Neo4j server
+    """
+
+    # Constructor
+    def __init__(self, path, page_size=1000):
+        """
+        Constructor
+        :param path: Path to the database file (":memory:" for an in-memory database)
+        :param page_size: Number of nodes per page when streaming node lists
+        """
+        # Identity maps
+        super(SQLiteConnector, self).__init__(page_size=page_size)
+
+        # DB
+        self.db = sqlite3.connect(path)
+
+        # Create schema
+        for statement in SCHEMA:
+            self.db.execute(statement)
+        # end for
+        self.db.commit()
+    # end __init__
+
+    #################################
+    # PUBLIC
+    #################################
+
+    # Add a follow relationship
+    def follow_relationship(self, user1, user2):
+        """
+        Add a follow relationship
+        :param user1:
+        :param user2:
+        :return:
+        """
+        # Create if not exists
+        cursor = self.db.execute(
+            u"INSERT OR IGNORE INTO relationships (type, source, target, count) VALUES ('FOLLOW', ?, ?, 1)",
+            (user1.id, user2.id)
+        )
+
+        # New relationship, weights of user1 are stale
+        if cursor.rowcount > 0:
+            print(u"New FOLLOW relationship between {} and {}".format(user1.screen_name, user2.screen_name))
+            self.db.execute(u"INSERT OR IGNORE INTO dirty (node_id) VALUES (?)", (user1.id,))
+        # end if
+    # end follow_relationship
+
+    # Remove a follow relationship
+    def remove_follow_relationship(self, user1, user2):
+        """
+        Remove a follow relationship
+        :param user1:
+        :param user2:
+        :return:
+        """
+        # Delete if exists
+        cursor = self.db.execute(
+            u"DELETE FROM relationships WHERE type = 'FOLLOW' AND source = ? AND target = ?",
+            (user1.id, user2.id)
+        )
+
+        # Log
+        if cursor.rowcount > 0:
+            print(u"Removed FOLLOW relationship between {} and {}".format(user1.screen_name, user2.screen_name))
+        # end if
+    # end remove_follow_relationship
+
+    # Set node properties
+    def set_node_properties(self, node, **properties):
+        """
+        Set node properties
+        :param node: Node record
+        :param properties: Properties to set
+        :return:
+        """
+        # Write
+        self.db.executemany(
+            u"INSERT OR REPLACE INTO properties (node_id, name, value) VALUES (?, ?, ?)",
+            [(node.id, name, value) for name, value in properties.items()]
+        )
+
+        # Update record
+        node.update(properties)
+    # end set_node_properties
+
+    # Move the last tweet id of a user forward
+    def advance_last_tweet_id(self, user, last_tweet_id=-1):
+        """
+        Set the last tweet id of a user unless a more recent one is stored, the record gets the stored id
+        :param user: User record
+        :param last_tweet_id: Most recent tweet id read, -1 to only read it
+        :return: Stored last tweet id
+        """
+        # Write
+        self.db.execute(
+            u"INSERT OR IGNORE INTO properties (node_id, name, value) VALUES (?, 'last_tweet_id', ?)",
+            (user.id, last_tweet_id)
+        )
+        self.db.execute(
+            u"UPDATE properties SET value = MAX(value, ?) WHERE node_id = ? AND name = 'last_tweet_id'",
+            (last_tweet_id, user.id)
+        )
+
+        # Update record
+        user.last_tweet_id = self.db.execute(
+            u"SELECT value FROM properties WHERE node_id = ? AND name = 'last_tweet_id'",
+            (user.id,)
+        ).fetchone()[0]
+        return user.last_tweet_id
+    # end advance_last_tweet_id
+
+    # Create and verify the schema
+    def ensure_schema(self, batch_size=1000):
+        """
+        Create and verify the schema, keys are already unique in the nodes table
+        :param batch_size: Number of duplicate groups merged per statement
+        :return: Dictionary of number of merged duplicate nodes per label
+        """
+        return dict()
+    # end ensure_schema
+
+    # Flush pending writes
+    def flush(self):
+        """
+        Commit pending writes
+        :return:
+        """
+        self.db.commit()
+    # end flush
+
+    # Compute weights
+    def compute_weights(self, dry_run=False, batch_size=10000, incremental=True):
+        """
+        Compute weights (count / out degree)
+        :param dry_run: Only return weight statistics, do not write
+        :param batch_size: Unused, SQLite updates each type in one statement
+        :param incremental: Only recompute the outgoing relationships of nodes whose counters changed
+        :return: Dictionary of statistics per relationship type
+        """
+        # Write pending changes first
+        self.flush()
+
+        # Source selection
+        selection = u" AND {table}.source IN (SELECT node_id FROM dirty)" if incremental else u""
+
+        # Statistics
+        statistics = dict()
+
+        # For each type
+        for relation_type, (_, _, divider) in tanaturf.tools.settings.weighted_relationships.items():
+            # Statistics (division by zero gives NULL)
+            count, weight_min, weight_max, weight_mean = self.db.execute(
+                u"SELECT count(weight), min(weight), max(weight), avg(weight) FROM "
+                u"(SELECT CAST(r.count AS REAL) / {} AS weight FROM relationships r WHERE r.type = ?{})".format(
+                    DIVIDER_EXPRESSION.format(table=u"r"),
+                    selection.format(table=u"r")
+                ),
+                (divider, relation_type)
+            ).fetchone()
+            statistics[relation_type] = {'count': count, 'min': weight_min, 'max': weight_max, 'mean': weight_mean}
+
+            # Write
+            if not dry_run:
+                self.db.execute(
+                    u"UPDATE relationships SET weight = CAST(count AS REAL) / {0} WHERE type = ?{1} AND {0} > 0".format(
+                        DIVIDER_EXPRESSION.format(table=u"relationships"),
+                        selection.format(table=u"relationships")
+                    ),
+                    (divider, relation_type, divider)
+                )
+            # end if
+
+            # Progress
+            print(u"{} weights : {} relationships".format(relation_type, count))
+        # end for
+
+        # Everything is up to date
+        if not dry_run:
+            self.db.execute(u"DELETE FROM dirty")
+            self.db.commit()
+        # end if
+
+        return statistics
+    # end compute_weights
+
+    #################################
+    # PRIVATE
+    #################################
+
+    # Load a page of nodes
+    def _load_page(self, label, after, limit):
+        """
+        Load a page of nodes
+        :param label: Node label
+        :param after: Only nodes with an id greater than this one
+        :param limit: Maximum number of nodes
+        :return: List of node records, ordered by id
+        """
+        # Node ids
+        node_ids = [
+            row[0] for row in
+            self.db.execute(u"SELECT id FROM nodes WHERE label = ? AND id > ? ORDER BY id LIMIT ?", (label, after, limit))
+        ]
+
+        # Properties of each node
+        properties = dict([(node_id, dict()) for node_id in node_ids])
+        if len(node_ids) > 0:
+            for node_id, name, value in self.db.execute(
+                    u"SELECT node_id, name, value FROM properties WHERE node_id BETWEEN ? AND ?",
+                    (node_ids[0], node_ids[-1])):
+                if node_id in properties:
+                    properties[node_id][name] = value
+                # end if
+            # end for
+        # end if
+
+        return [RECORDS[label](node_id, **properties[node_id]) for node_id in node_ids]
+    # end _load_page
+
+    # Highest node id of a label
+    def _max_node_id(self, label):
+        """
+        Highest node id of a label
+        :param label: Node label
+        :return: Node id, None if there is no node
+        """
+        return self.db.execute(u"SELECT max(id) FROM nodes WHERE label = ?", (label,)).fetchone()[0]
+    # end _max_node_id
+
+    # Count nodes of a label
+    def _count_nodes(self, label):
+        """
+        Count nodes of a label
+        :param label: Node label
+        :return: Number of nodes
+        """
+        return self.db.execute(u"SELECT count(*) FROM nodes WHERE label = ?", (label,)).fetchone()[0]
+    # end _count_nodes
+
+    # Find a node by key
+    def _find_node(self, label, key):
+        """
+        Find a node by key
+        :param label: Node label
+        :param key: Node key
+        :return: The node, None if not found
+        """
+        # Node id
+        row = self.db.execute(u"SELECT id FROM nodes WHERE label = ? AND key = ?", (label, key)).fetchone()
+
+        # Not found
+        if row is None:
+            return None
+        # end if
+
+        # Properties
+        properties = dict(self.db.execute(u"SELECT name, value FROM properties WHERE node_id = ?", (row[0],)))
+
+        return RECORDS[label](row[0], **properties)
+    # end _find_node
+
+    # Create a node
+    def _create_node(self, label, **properties):
+        """
+        Create a node
+        :param label: Node label
+        :param properties: Node properties
+        :return: The new node
+        """
+        # Key
+        key = properties[tanaturf.tools.settings.node_keys[label]]
+
+        # Node
+        cursor = self.db.execute(u"INSERT OR IGNORE INTO nodes (label, key) VALUES (?, ?)", (label, key))
+
+        # Created meanwhile by another run
+        if cursor.rowcount == 0:
+            return self._find_node(label, key)
+        # end if
+        node = RECORDS[label](cursor.lastrowid)
+
+        # Properties
+        self.set_node_properties(node, **properties)
+
+        return node
+    # end _create_node
+
+    # Add a counted relationship event
+    def _add_relationship(self, relation_type, source, target):
+        """
+        Add a counted relationship event
+        :param relation_type: Relationship type
+        :param source: Source node
+        :param target: Target node
+        :return:
+        """
+        # Counters
+        _, _, out_property, in_property = tanaturf.tools.settings.counted_relationships[relation_type]
+
+        # Relationship count
+        self.db.execute(
+            u"INSERT OR IGNORE INTO relationships (type, source, target, count) VALUES (?, ?, ?, 0)",
+            (relation_type, source.id, target.id)
+        )
+        self.db.execute(
+            u"UPDATE relationships SET count = count + 1 WHERE type = ? AND source = ? AND target = ?",
+            (relation_type, source.id, target.id)
+        )
+
+        # Node counters
+        self._increment(source, out_property)
+        self._increment(target, in_property)
+
+        # Weights of the source are stale
+        self.db.execute(u"INSERT OR IGNORE INTO dirty (node_id) VALUES (?)", (source.id,))
+    # end _add_relationship
+
+    # Increment a node counter
+    def _increment(self, node, name):
+        """
+        Increment a node counter
+        :param node: Node
+        :param name: Counter name
+        :return:
+        """
+        # Counter
+        self.db.execute(
+            u"INSERT OR IGNORE INTO properties (node_id, name, value) VALUES (?, ?, 0)",
+            (node.id, name)
+        )
+        self.db.execute(
+            u"UPDATE properties SET value = value + 1 WHERE node_id = ? AND name = ?",
+            (node.id, name)
+        )
+    # end _increment
+
+    # Load the adjacency of the graph
+    def _load_adjacency(self):
+        """
+        Load the adjacency of the graph
+        :return: Dictionary of node labels (node id -> label), list of (source id, target id)
+        """
+        labels = dict(self.db.execute(u"SELECT id, label FROM nodes"))
+        edges = self.db.execute(u"SELECT source, target FROM relationships").fetchall()
+        return labels, edges
+    # end _load_adjacency
+
+    # Load user classes
+    def _load_classes(self):
+        """
+        Load the class of classified users
+        :return: Dictionary (node id -> classe)
+        """
+        return dict(self.db.execute(u"SELECT node_id, value FROM properties WHERE name = 'classe' AND value != ''"))
+    # end _load_classes
+
+    # Delete nodes
+    def _delete_nodes(self, node_ids):
+        """
+        Delete nodes and their relationships in one transaction
+        :param node_ids: List of node ids
+        :return:
+        """
+        # Parameters
+        params = [(node_id,) for node_id in node_ids]
+
+        # Delete nodes, relationships and properties
+        self.db.executemany(u"DELETE FROM relationships WHERE source = ?", params)
+        self.db.executemany(u"DELETE FROM relationships WHERE target = ?", params)
+        self.db.executemany(u"DELETE FROM properties WHERE node_id = ?", params)
+        self.db.executemany(u"DELETE FROM dirty WHERE node_id = ?", params)
+        self.db.executemany(u"DELETE FROM nodes WHERE id = ?", params)
+
+        # Commit
+        self.db.commit()
+    # end _delete_nodes
+
+# end SQLiteConnector
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : storage.SnapshotStore.py
+# Description : On-disk snapshots of sorted Twitter user id arrays.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Imports
+import os
+from array import array
+
+
+# 64 bits integers
+try:
+    TYPECODE = 'q'
+    array(TYPECODE)
+except ValueError:
+    TYPECODE = 'l'
+# end try
+
+
+# Snapshot store
+class SnapshotStore(object):
+    """
+    Sorted arrays of 64 bits ids, one binary file per snapshot name,
+    such as the follower ids of a user at the last crawl.
+    """
+
+    # Constructor
+    def __init__(self, directory):
+        """
+        Constructor
+        :param directory: Directory of the snapshot files
+        """
+        # Properties
+        self._directory = directory
+
+        # Create directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # end if
+    # end __init__
+
+    #################################
+    # PUBLIC
+    #################################
+
+    # Load a snapshot
+    def load(self, name):
+        """
+        Load a snapshot
+        :param name: Snapshot name
+        :return: Sorted array of ids, empty if there is no snapshot
+        """
+        # Ids
+        ids = array(TYPECODE)
+
+        # Read
+        path = self._path(name)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                ids.fromfile(f, os.path.getsize(path) // ids.itemsize)
+            # end with
+        # end if
+
+        return ids
+    # end load
+
+    # Save a snapshot
+    def save(self, name, ids):
+        """
+        Save a snapshot, replacing the previous one at once
+        :param name: Snapshot name
+        :param ids: Iterable of ids
+        :return:
+        """
+        # Write to a temporary file
+        path = self._path(name)
+        with open(path + ".tmp", 'wb') as f:
+            array(TYPECODE, sorted(ids)).tofile(f)
+        # end with
+
+        # Replace
+        os.rename(path + ".tmp", path)
+    # end save
+
+    # Snapshot exists
+    def exists(self, name):
+        """
+        Snapshot exists
+        :param name: Snapshot name
+        :return:
+        """
+        return os.path.exists(self._path(name))
+    # end exists
+
+    #################################
+    # PRIVATE
+    #################################
+
+    # Path of a snapshot
+    def _path(self, name):
+        """
+        Path of a snapshot
+        :param name: Snapshot name
+        :return: File path
+        """
+        return os.path.join(self._directory, u"{}.ids".format(name))
+    # end _path
+
+# end SnapshotStore
+
+
+# Difference between two sorted id arrays
+def diff_sorted(old, new):
+    """
+    Difference between two sorted id arrays, in one merge pass
+    :param old: Sorted ids of the previous snapshot
+    :param new: Sorted ids of the current snapshot
+    :return: Lists of added, removed and kept ids
+    """
+    # Lists
+    added = list()
+    removed = list()
+    kept = list()
+
+    # Merge
+    i, j = 0, 0
+    while i < len(old) and j < len(new):
+        if old[i] == new[j]:
+            kept.append(new[j])
+            i += 1
+            j += 1
+        elif old[i] < new[j]:
+            removed.append(old[i])
+            i += 1
+        else:
+            added.append(new[j])
+            j += 1
+        # end if
+    # end while
+
+    # Tails
+    removed.extend(old[i:])
+    added.extend(new[j:])
+
+    return added, removed, kept
+# end diff_sorted
@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : storage.__init__.py
+# Description : Graph storage backends.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Import
+from .CrawlFrontier import CrawlFrontier
+from .CrawlPrioritizer import CrawlPrioritizer
+from .NodeRecord import NodeRecord, UserRecord, WebsiteRecord, HashtagRecord, RECORDS
+from .GraphPruner import GraphPruner
+from .GraphStorage import GraphStorage
+from .SQLiteConnector import SQLiteConnector
+from .SnapshotStore import SnapshotStore, diff_sorted
+
+# All
+__all__ = ['CrawlFrontier', 'CrawlPrioritizer', 'NodeRecord', 'UserRecord', 'WebsiteRecord', 'HashtagRecord',
+           'RECORDS', 'GraphPruner', 'GraphStorage', 'SQLiteConnector', 'SnapshotStore', 'diff_sorted']
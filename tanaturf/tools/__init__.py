@@ -21,8 +21,9 @@
 #
 
 # Import
-from functions import root_file, get_user_info, get_extended_URL
-from settings import forbidden_nodes
+from functions import root_file, credentials_file, get_user_info, get_extended_URL, shuffled_stream, shuffled_pages
+from settings import forbidden_nodes, counted_relationships, weighted_relationships, node_keys, weights_dirty_label
 
 # All
-__all__ = ['root_file', 'get_user_info', 'get_extended_URL', 'forbidden_nodes']
+__all__ = ['root_file', 'credentials_file', 'get_user_info', 'get_extended_URL', 'shuffled_stream', 'shuffled_pages',
+           'forbidden_nodes', 'counted_relationships', 'weighted_relationships', 'node_keys', 'weights_dirty_label']
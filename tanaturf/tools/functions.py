@@ -23,6 +23,7 @@
 # Imports
 import codecs
 import requests
+from random import shuffle
 
 
 # Read root file
@@ -47,6 +48,34 @@ def root_file(file_path):
 # end root_file
 
 
+# Read credentials file
+def credentials_file(file_path):
+    """
+    Read credentials file, one set of four tokens per line
+    (auth token 1, auth token 2, access token 1, access token 2)
+    :param file_path:
+    :return: List of tuples of tokens
+    """
+    # Open file
+    f = codecs.open(file_path, encoding='utf-8')
+
+    # Credentials
+    credentials = list()
+
+    # For each line
+    for line in f:
+        tokens = line.replace(u",", u" ").split()
+        if len(tokens) == 4:
+            credentials.append(tuple(tokens))
+        elif len(tokens) > 0:
+            raise ValueError(u"Expected four tokens per line in {}".format(file_path))
+        # end if
+    # end for
+
+    return credentials
+# end credentials_file
+
+
 # Get user info
 def get_user_info(user):
     """
@@ -82,3 +111,36 @@ def get_extended_URL(tiny_url):
     resp = session.head(tiny_url, allow_redirects=True)
     return resp.url
 # end get_extended_url
+
+
+# Shuffle a stream of pages
+def shuffled_stream(pages):
+    """
+    Iterate over a stream of pages, each page in random order
+    :param pages: Iterator of lists
+    :return: Iterator of elements
+    """
+    for page in pages:
+        shuffle(page)
+        for element in page:
+            yield element
+        # end for
+    # end for
+# end shuffled_stream
+
+
+# Shuffle all the pages together
+def shuffled_pages(pages, page_size=100):
+    """
+    Shuffle the elements of every page together, so that any element can come first, and cut them in pages again.
+    Every element is held in memory.
+    :param pages: Iterator of lists
+    :param page_size: Number of elements per page
+    :return: Iterator of lists
+    """
+    elements = [element for page in pages for element in page]
+    shuffle(elements)
+    for index in range(0, len(elements), page_size):
+        yield elements[index:index + page_size]
+    # end for
+# end shuffled_pages
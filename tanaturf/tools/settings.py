@@ -27,3 +27,29 @@ forbidden_nodes = [
     "facebook.com", "e-monsite.com", "apple.com", "pscp.tv", "twitter.com", "instagram.com", "amzn.to", "Twitter",
     "TwitterSupport", "wikipedia.org", "archives.org", "Starbucks", "about.me", "wordpress.com"
 ]
+
+# Counted relationship types (source label, target label, out counter, in counter)
+counted_relationships = {
+    "RETWEETED": ("TwitterUser", "TwitterUser", "retweet_out", "retweeted_in"),
+    "TWEETED": ("TwitterUser", "Website", "tweeted_out", "tweeted_in"),
+    "QUOTED": ("TwitterUser", "TwitterUser", "quoted_out", "quoted_in"),
+    "HASHTAGED": ("TwitterUser", "Hashtag", "hashtaged_out", "hashtaged_in"),
+    "LINKED": ("Hashtag", "Hashtag", "linked_out", "linked_in")
+}
+
+# Weighted relationship types (source label, target label, divider property)
+weighted_relationships = dict(
+    [(relation_type, (source_label, target_label, out_property))
+     for relation_type, (source_label, target_label, out_property, _) in counted_relationships.items()]
+)
+weighted_relationships["FOLLOW"] = ("TwitterUser", "TwitterUser", "followers_count")
+
+# Node labels and their key property
+node_keys = {
+    "TwitterUser": "screen_name",
+    "Website": "domain_name",
+    "Hashtag": "hashtag_text"
+}
+
+# Label of the nodes whose outgoing weights must be recomputed
+weights_dirty_label = "WeightsDirty"
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : twitter.ArchiveConnector.py
+# Description : Offline stand-in of the Twitter connector replaying archived timeline pages.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Imports
+import multiprocessing
+import tweepy
+from .TweetArchive import read_segment
+
+
+# Archive connector
+class ArchiveConnector(object):
+    """
+    Replays the pages of a TweetArchive without calling Twitter. Users are
+    resolved from the profile cache only, retweeter lists are not archived
+    and are skipped. A tweet archived in several overlapping pages is only
+    replayed once.
+    """
+
+    # Constructor
+    def __init__(self, archive, profile_cache=None, workers=None):
+        """
+        Constructor
+        :param archive: TweetArchive
+        :param profile_cache: ProfileCache parsing tweepy users, None to resolve no user
+        :param workers: Number of processes reading segments (number of CPUs by default)
+        """
+        # Properties
+        self._archive = archive
+        self._profile_cache = profile_cache
+        self._workers = workers
+        self._api = tweepy.API()
+    # end __init__
+
+    #################################
+    # PUBLIC
+    #################################
+
+    # Archived pages
+    def pages(self):
+        """
+        Archived pages, segments are decompressed and parsed in worker processes. Tweets within the id range of a
+        page of the same user already replayed are left out, as a page holds every tweet of its range.
+        :return: Iterator of (screen name, max tweet id, list of tweets)
+        """
+        # Id ranges replayed (screen name -> list of (min id, max id))
+        replayed = dict()
+
+        pool = multiprocessing.Pool(self._workers)
+        try:
+            for segment_pages in pool.imap_unordered(read_segment, self._archive.segments()):
+                for screen_name, min_id, max_id, tweets in segment_pages:
+                    # Tweets not replayed yet
+                    ranges = replayed.setdefault(screen_name, list())
+                    tweets = [tweet for tweet in tweets if not covered(ranges, tweet['id'])]
+                    cover(ranges, min_id, max_id)
+
+                    yield screen_name, max_id, [tweepy.models.Status.parse(self._api, tweet) for tweet in tweets]
+                # end for
+            # end for
+        finally:
+            pool.terminate()
+        # end try
+    # end pages
+
+    # Get the user
+    def get_user(self, screen_name=None, user_id=None):
+        """
+        Get the user from the profile cache
+        :param screen_name: Screen name
+        :param user_id: User id, used if given
+        :return: The Twitter user object, None if not cached
+        """
+        if self._profile_cache is None:
+            return None
+        # end if
+        return self._profile_cache.get(screen_name=screen_name, user_id=user_id)
+    # end get_user
+
+    # Request a user
+    def hydrate_user(self, callback, screen_name=None, user_id=None):
+        """
+        Resolve a user from the profile cache
+        :param callback: Function called with the Twitter user object, or None if not cached
+        :param screen_name: Screen name
+        :param user_id: User id, used if given
+        :return:
+        """
+        callback(self.get_user(screen_name=screen_name, user_id=user_id))
+    # end hydrate_user
+
+    # Resolve pending users
+    def flush_hydration(self):
+        """
+        Users are resolved at once
+        :return:
+        """
+        pass
+    # end flush_hydration
+
+    # Request retweeter ids
+    def request_retweeter_ids(self, tweet, callback):
+        """
+        Retweeters are not archived
+        :param tweet: Tweet
+        :param callback: Function called with the retweeter ids
+        :return:
+        """
+        pass
+    # end request_retweeter_ids
+
+    # Dispatch deferred calls
+    def dispatch(self):
+        """
+        No deferred call
+        :return:
+        """
+        return 0
+    # end dispatch
+
+    # Dispatch all deferred calls
+    def drain(self):
+        """
+        No deferred call
+        :return:
+        """
+        return 0
+    # end drain
+
+# end ArchiveConnector
+
+
+# Id in ranges
+def covered(ranges, tweet_id):
+    """
+    Tweet id within one of the ranges
+    :param ranges: List of disjoint (min id, max id)
+    :param tweet_id: Tweet id
+    :return: True if covered
+    """
+    return any([low <= tweet_id <= high for low, high in ranges])
+# end covered
+
+
+# Add a range
+def cover(ranges, low, high):
+    """
+    Add a range, merged with the ranges it overlaps
+    :param ranges: List of disjoint (min id, max id), updated
+    :param low: Min id
+    :param high: Max id
+    :return:
+    """
+    overlapping = [(a, b) for a, b in ranges if a <= high and b >= low]
+    ranges[:] = sorted(
+        [(a, b) for a, b in ranges if a > high or b < low] +
+        [(min([low] + [a for a, b in overlapping]), max([high] + [b for a, b in overlapping]))]
+    )
+# end cover
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : twitter.DepthController.py
+# Description : Per-user timeline depth decided from the yield of the pages already read.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Imports
+import math
+import threading
+
+
+# Depth controller
+class DepthController(object):
+    """
+    Decides, page after page, whether the next page of a timeline is worth
+    fetching. The writer records the new interactions each page produced;
+    the fetcher reading the timeline waits for that record and goes on only
+    if the page yielded enough new interactions per tweet. The bar rises
+    with the tweet rate of the user (prolific accounts must yield more) and
+    with the share of the page budget already spent.
+    """
+
+    # Constructor
+    def __init__(self, min_yield=0.05, min_pages=1, max_pages=-1, page_budget=-1, rate_scale=20.0):
+        """
+        Constructor
+        :param min_yield: New interactions per tweet of the last page needed to read the next one
+        :param min_pages: Number of pages always read
+        :param max_pages: Maximum number of pages per user (-1 for no limit)
+        :param page_budget: Number of pages for the whole crawl (-1 for no limit)
+        :param rate_scale: Tweets per day above which the bar rises
+        """
+        # Properties
+        self._min_yield = min_yield
+        self._min_pages = min_pages
+        self._max_pages = max_pages
+        self._page_budget = page_budget
+        self._rate_scale = rate_scale
+
+        # Recorded pages (key -> (number of pages, new interactions per tweet, tweets per day) of the last page)
+        self._records = dict()
+
+        # Timelines whose fetcher waits for a record
+        self._waiting = set()
+
+        # Pages read in the crawl
+        self.pages = 0
+
+        # Condition on records
+        self._condition = threading.Condition()
+    # end __init__
+
+    #################################
+    # PUBLIC
+    #################################
+
+    # Record a page
+    def record(self, key, n_tweets, n_new, tweets_per_day):
+        """
+        Record the yield of a page, called by the writer
+        :param key: Timeline key (screen name)
+        :param n_tweets: Number of tweets of the page
+        :param n_new: Number of interactions first seen in this page
+        :param tweets_per_day: Tweet rate over the page
+        :return:
+        """
+        with self._condition:
+            n_pages = self._records.get(key, (0, 0.0, 0.0))[0] + 1
+            self._records[key] = (n_pages, float(n_new) / max(n_tweets, 1), tweets_per_day)
+            self.pages += 1
+            self._condition.notify_all()
+        # end with
+    # end record
+
+    # Next page is worth fetching
+    def next_page(self, key, n_pages):
+        """
+        Decide whether to fetch the next page, waiting for the record of the last one, called by a fetcher. The
+        writer records every page, however late, so there is no timeout; a forgotten timeline stops.
+        :param key: Timeline key (screen name)
+        :param n_pages: Number of pages already fetched
+        :return: True to fetch the next page
+        """
+        # Bounds
+        if n_pages < self._min_pages:
+            return True
+        elif self._max_pages != -1 and n_pages >= self._max_pages:
+            return False
+        elif self._page_budget != -1 and self.pages >= self._page_budget:
+            return False
+        # end if
+
+        # Wait for the writer, until the page is recorded or the timeline forgotten
+        with self._condition:
+            self._waiting.add(key)
+            while self._records.get(key, (0, 0.0, 0.0))[0] < n_pages and key in self._waiting:
+                self._condition.wait(1.0)
+            # end while
+            forgotten = key not in self._waiting
+            self._waiting.discard(key)
+            recorded_pages, page_yield, tweets_per_day = self._records.get(key, (0, 0.0, 0.0))
+        # end with
+
+        # Timeline dropped by the writer
+        if forgotten:
+            return False
+        # end if
+
+        return page_yield >= self._threshold(tweets_per_day)
+    # end next_page
+
+    # Read pages
+    def pages_of(self, key, pages):
+        """
+        Pages of a timeline, stopping when the next page is not worth fetching
+        :param key: Timeline key (screen name)
+        :param pages: Page iterator
+        :return: Page iterator
+        """
+        for page_index, page in enumerate(pages):
+            yield page
+            if not self.next_page(key, page_index + 1):
+                break
+            # end if
+        # end for
+    # end pages_of
+
+    # Forget a timeline
+    def forget(self, key):
+        """
+        Forget the records of a timeline once done
+        :param key: Timeline key (screen name)
+        :return:
+        """
+        with self._condition:
+            self._records.pop(key, None)
+            self._waiting.discard(key)
+            self._condition.notify_all()
+        # end with
+    # end forget
+
+    #################################
+    # PRIVATE
+    #################################
+
+    # Yield needed to go on
+    def _threshold(self, tweets_per_day):
+        """
+        New interactions per tweet needed to read the next page
+        :param tweets_per_day: Tweet rate of the user
+        :return:
+        """
+        # Prolific users
+        rate_factor = 1.0 + math.log1p(max(tweets_per_day, 0.0) / self._rate_scale)
+
+        # Budget spent
+        budget_factor = 1.0 + (float(self.pages) / self._page_budget if self._page_budget > 0 else 0.0)
+
+        return self._min_yield * rate_factor * budget_factor
+    # end _threshold
+
+# end DepthController
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : twitter.PageFetcher.py
+# Description : Pool of threads reading Twitter page iterators concurrently.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Imports
+import threading
+import time
+import Queue
+
+
+# Page fetcher
+class PageFetcher(object):
+    """
+    Fetcher threads reading the page iterators of a stream of items
+    (timelines, follower ids, ...) and pushing the pages to a bounded
+    queue. The calling thread reads the items and the pages, so that only
+    the fetchers wait on Twitter and only the caller writes to the graph.
+    Rate limits are shared through the thread-safe TokenPool.
+    """
+
+    # Constructor
+    def __init__(self, workers=4, queue_size=16):
+        """
+        Constructor
+        :param workers: Number of fetcher threads, each has at most one call in flight
+        :param queue_size: Number of fetched pages waiting for the caller above which fetchers wait
+        """
+        # Properties
+        self._workers = workers
+
+        # Items to fetch, and fetched pages
+        self._work_queue = Queue.Queue()
+        self._page_queue = Queue.Queue(maxsize=queue_size)
+
+        # Fetchers
+        self._fetchers = list()
+        for worker_index in range(workers):
+            fetcher = threading.Thread(target=self._fetch)
+            fetcher.daemon = True
+            fetcher.start()
+            self._fetchers.append(fetcher)
+        # end for
+    # end __init__
+
+    #################################
+    # PUBLIC
+    #################################
+
+    # Stream pages
+    def stream(self, items, request, max_in_flight=None, wait=1.0):
+        """
+        Fetch the pages of each item, keeping every fetcher busy
+        :param items: Iterable of items, read in the calling thread, None when no item is ready yet
+        :param request: Function returning the page iterator of an item, called in a fetcher
+        :param max_in_flight: Number of items fetched at once (twice the workers by default)
+        :param wait: Time before asking for an item again when none is ready and none is fetched (seconds)
+        :return: Iterator of (item, page, error), page is None at the end of an item, with the error if it failed
+        """
+        # Items being fetched
+        max_in_flight = max_in_flight if max_in_flight is not None else 2 * self._workers
+        items = iter(items)
+        in_flight = 0
+        exhausted = False
+
+        while True:
+            # Submit items
+            while not exhausted and in_flight < max_in_flight:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                # end try
+
+                # Not ready, pages first
+                if item is None:
+                    break
+                # end if
+
+                self._work_queue.put((item, request))
+                in_flight += 1
+            # end while
+
+            # Done, or no item ready yet and no page to wait for
+            if in_flight == 0 and exhausted:
+                break
+            elif in_flight == 0:
+                time.sleep(wait)
+                continue
+            # end if
+
+            # Next page
+            item, page, error = self._page_queue.get()
+            if page is None:
+                in_flight -= 1
+            # end if
+            yield item, page, error
+        # end while
+    # end stream
+
+    # Stop
+    def close(self):
+        """
+        Stop the fetchers
+        :return:
+        """
+        for fetcher in self._fetchers:
+            self._work_queue.put(None)
+        # end for
+        for fetcher in self._fetchers:
+            fetcher.join()
+        # end for
+    # end close
+
+    #################################
+    # PRIVATE
+    #################################
+
+    # Fetcher loop
+    def _fetch(self):
+        """
+        Fetcher loop, reads the pages of the items of the work queue until it gets None
+        :return:
+        """
+        while True:
+            # Next item
+            work = self._work_queue.get()
+            if work is None:
+                break
+            # end if
+            item, request = work
+
+            # Pages, waits while the caller is behind, the end of the item is always sent so that the caller
+            # never waits for a fetcher that died
+            try:
+                for page in request(item):
+                    self._page_queue.put((item, page, None))
+                # end for
+                self._page_queue.put((item, None, None))
+            except Exception as e:
+                self._page_queue.put((item, None, e))
+            # end try
+        # end while
+    # end _fetch
+
+# end PageFetcher
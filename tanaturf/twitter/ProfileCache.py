@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : twitter.ProfileCache.py
+# Description : Persistent cache of Twitter user profiles.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Imports
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+
+
+# Schema
+SCHEMA = u"""
+CREATE TABLE IF NOT EXISTS profiles (
+    user_id INTEGER PRIMARY KEY,
+    screen_name TEXT NOT NULL,
+    data TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS profiles_screen_name ON profiles (screen_name);
+"""
+
+
+# Profile cache
+class ProfileCache(object):
+    """
+    Twitter user profiles stored in a SQLite file, keyed by user id and
+    screen name, fronted by an in-memory LRU. Profiles older than the TTL
+    are stale and must be fetched again.
+    """
+
+    # Constructor
+    def __init__(self, path, ttl=604800.0, size=10000, parse=None):
+        """
+        Constructor
+        :param path: Path to the database file
+        :param ttl: Time after which a profile is stale (seconds)
+        :param size: Number of profiles kept in memory
+        :param parse: Function building a user object from its JSON dictionary (dictionary by default)
+        """
+        # Properties
+        self._ttl = ttl
+        self._size = size
+        self._parse = parse if parse is not None else lambda data: data
+
+        # In-memory LRU (key -> (fetched at, user))
+        self._lru = OrderedDict()
+
+        # Hits and misses
+        self.hits = 0
+        self.misses = 0
+
+        # DB
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+    # end __init__
+
+    #################################
+    # PUBLIC
+    #################################
+
+    # Get a profile
+    def get(self, screen_name=None, user_id=None):
+        """
+        Get a fresh profile
+        :param screen_name: Screen name
+        :param user_id: User id, used if given
+        :return: The user, None if unknown or stale
+        """
+        # Key
+        key = self._key(screen_name, user_id)
+
+        # In memory
+        if key in self._lru:
+            fetched_at, user = self._lru.pop(key)
+            if self._fresh(fetched_at):
+                self._lru[key] = (fetched_at, user)
+                self.hits += 1
+                return user
+            # end if
+        # end if
+
+        # On disk
+        if user_id is not None:
+            row = self.db.execute(u"SELECT data, fetched_at FROM profiles WHERE user_id = ?", (user_id,)).fetchone()
+        else:
+            row = self.db.execute(
+                u"SELECT data, fetched_at FROM profiles WHERE screen_name = ? ORDER BY fetched_at DESC LIMIT 1",
+                (screen_name.lower(),)
+            ).fetchone()
+        # end if
+
+        # Fresh on disk
+        if row is not None and self._fresh(row[1]):
+            user = self._parse(json.loads(row[0]))
+            self._remember(key, row[1], user)
+            self.hits += 1
+            return user
+        # end if
+
+        # Miss
+        self.misses += 1
+        return None
+    # end get
+
+    # Add a profile
+    def put(self, user, data, commit=True):
+        """
+        Add or refresh a profile
+        :param user: User object
+        :param data: JSON dictionary of the user, with id and screen_name
+        :param commit: Commit to disk now
+        :return:
+        """
+        # Now
+        fetched_at = time.time()
+
+        # On disk
+        self.db.execute(
+            u"INSERT OR REPLACE INTO profiles (user_id, screen_name, data, fetched_at) VALUES (?, ?, ?, ?)",
+            (data['id'], data['screen_name'].lower(), json.dumps(data), fetched_at)
+        )
+        if commit:
+            self.db.commit()
+        # end if
+
+        # In memory, under both keys
+        self._remember(self._key(None, data['id']), fetched_at, user)
+        self._remember(self._key(data['screen_name'], None), fetched_at, user)
+    # end put
+
+    # Commit
+    def commit(self):
+        """
+        Commit profiles to disk
+        :return:
+        """
+        self.db.commit()
+    # end commit
+
+    # Close
+    def close(self):
+        """
+        Close the database
+        :return:
+        """
+        self.db.close()
+    # end close
+
+    #################################
+    # PRIVATE
+    #################################
+
+    # Cache key
+    def _key(self, screen_name, user_id):
+        """
+        Cache key
+        :param screen_name: Screen name
+        :param user_id: User id, used if given
+        :return: Key
+        """
+        if user_id is not None:
+            return u"#{}".format(user_id)
+        else:
+            return screen_name.lower()
+        # end if
+    # end _key
+
+    # Profile is fresh
+    def _fresh(self, fetched_at):
+        """
+        Profile is fresh
+        :param fetched_at: Fetch time
+        :return: True if fetched within the TTL
+        """
+        return time.time() - fetched_at < self._ttl
+    # end _fresh
+
+    # Keep a profile in memory
+    def _remember(self, key, fetched_at, user):
+        """
+        Keep a profile in memory, dropping the least recently used ones
+        :param key: Cache key
+        :param fetched_at: Fetch time
+        :param user: User object
+        :return:
+        """
+        self._lru.pop(key, None)
+        self._lru[key] = (fetched_at, user)
+        while len(self._lru) > self._size:
+            self._lru.popitem(last=False)
+        # end while
+    # end _remember
+
+# end ProfileCache
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : twitter.RequestScheduler.py
+# Description : Per-endpoint queues of Twitter calls dispatched by remaining budget.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Imports
+import time
+from collections import deque
+import tweepy
+
+
+# Request scheduler
+class RequestScheduler(object):
+    """
+    One queue of deferred calls per endpoint. Calls are dispatched only
+    for endpoints with remaining budget, so that a drained endpoint waits
+    for its window while work for the other endpoints keeps flowing. A
+    failed call goes back to the end of its queue until it failed too
+    many times.
+    """
+
+    # Constructor
+    def __init__(self, pool, max_pending=1000, max_retries=3):
+        """
+        Constructor
+        :param pool: TokenPool
+        :param max_pending: Number of queued calls of an endpoint above which submitting waits for its budget
+        :param max_retries: Number of failures after which a call is given up
+        """
+        # Properties
+        self._pool = pool
+        self._max_pending = max_pending
+        self._max_retries = max_retries
+
+        # Queues (endpoint -> deque of (callback, args, kwargs, number of failures))
+        self._queues = dict()
+
+        # Calls given up
+        self.n_failed = 0
+    # end __init__
+
+    #################################
+    # PROPERTIES
+    #################################
+
+    # Number of queued calls
+    @property
+    def pending(self):
+        """
+        Number of queued calls
+        :return:
+        """
+        return sum([len(queue) for queue in self._queues.values()])
+    # end pending
+
+    #################################
+    # PUBLIC
+    #################################
+
+    # Queue a call
+    def submit(self, endpoint, callback, *args, **kwargs):
+        """
+        Queue a call, the callback is called with its result once dispatched
+        :param endpoint: Name of the tweepy.API method
+        :param callback: Function called with the result
+        :param args: Arguments
+        :param kwargs: Keyword arguments
+        :return:
+        """
+        # Queue
+        queue = self._queues.setdefault(endpoint, deque())
+        queue.append((callback, args, kwargs, 0))
+
+        # Too many pending calls, wait for this endpoint
+        while len(queue) > self._max_pending:
+            self._execute(endpoint)
+        # end while
+
+        # Calls with budget
+        self.dispatch()
+    # end submit
+
+    # Dispatch calls with budget
+    def dispatch(self):
+        """
+        Dispatch queued calls, one endpoint after the other, as long as their endpoint has budget
+        :return: Number of dispatched calls
+        """
+        n_calls = 0
+        progress = True
+        while progress:
+            progress = False
+            for endpoint, queue in list(self._queues.items()):
+                if len(queue) > 0 and self._pool.available(endpoint):
+                    self._execute(endpoint)
+                    n_calls += 1
+                    progress = True
+                # end if
+            # end for
+        # end while
+        return n_calls
+    # end dispatch
+
+    # Dispatch all calls
+    def drain(self):
+        """
+        Dispatch all queued calls, waiting for the next window when no endpoint has budget
+        :return: Number of dispatched calls
+        """
+        n_calls = 0
+        while self.pending > 0:
+            # Calls with budget
+            n_calls += self.dispatch()
+
+            # Wait for the first endpoint to get budget
+            if self.pending > 0:
+                delay = min([
+                    self._pool.next_reset(endpoint) for endpoint, queue in self._queues.items() if len(queue) > 0
+                ]) - time.time() + 1
+                print(u"{} calls waiting for rate limits, sleeping {:.0f}s".format(self.pending, delay))
+                time.sleep(max(delay, 0))
+            # end if
+        # end while
+        return n_calls
+    # end drain
+
+    #################################
+    # PRIVATE
+    #################################
+
+    # Run the next call of an endpoint
+    def _execute(self, endpoint):
+        """
+        Run the next call of an endpoint, a failed call is queued again unless the error is final
+        :param endpoint: Name of the tweepy.API method
+        :return:
+        """
+        # Next call
+        callback, args, kwargs, n_failures = self._queues[endpoint].popleft()
+
+        # Call
+        try:
+            result = self._pool.call(endpoint, *args, **kwargs)
+        except tweepy.error.TweepError as e:
+            print(u"Tweepy error on {} {}".format(endpoint, e))
+
+            # Retried later, unless the resource is missing or protected or the call failed too many times
+            status = e.response.status_code if getattr(e, 'response', None) is not None else None
+            if n_failures + 1 < self._max_retries and status not in (401, 403, 404):
+                self._queues[endpoint].append((callback, args, kwargs, n_failures + 1))
+            else:
+                print(u"Giving up {} call {}".format(endpoint, args if len(args) > 0 else kwargs))
+                self.n_failed += 1
+            # end if
+            return
+        # end try
+
+        # Result
+        callback(result)
+    # end _execute
+
+# end RequestScheduler
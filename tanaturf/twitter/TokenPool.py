@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : twitter.TokenPool.py
+# Description : Pool of Twitter credentials with rate-limit-aware rotation.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Imports
+import threading
+import time
+import tweepy
+
+
+# Token pool
+class TokenPool(object):
+    """
+    One tweepy.API per credential set and per thread. Tracks the remaining
+    calls of each endpoint for each token from the rate-limit response
+    headers, routes each call to the token with the most headroom, and
+    sleeps only when every token is exhausted for the endpoint.
+    """
+
+    # Constructor
+    def __init__(self, credentials, retry_delay=3):
+        """
+        Constructor
+        :param credentials: List of (auth token 1, auth token 2, access token 1, access token 2)
+        :param retry_delay: Delay between retries of failed calls (seconds)
+        """
+        # Properties
+        self._retry_delay = retry_delay
+
+        # Auths
+        self._auths = list()
+        for auth_token1, auth_token2, access_token1, access_token2 in credentials:
+            auth = tweepy.OAuthHandler(auth_token1, auth_token2)
+            auth.set_access_token(access_token1, access_token2)
+            self._auths.append(auth)
+        # end for
+
+        # APIs of each thread, the rate-limit headers are read from the last response of the API
+        self._local = threading.local()
+        self._apis = self._thread_apis()
+
+        # Rate limits (endpoint -> list of [remaining, reset time] per token, None if unknown)
+        self._limits = dict()
+
+        # Number of calls
+        self._calls = 0
+
+        # Lock on rate limits
+        self._lock = threading.Lock()
+    # end __init__
+
+    #################################
+    # PROPERTIES
+    #################################
+
+    # First API
+    @property
+    def api(self):
+        """
+        First API, to parse models
+        :return:
+        """
+        return self._apis[0]
+    # end api
+
+    # Number of tokens
+    @property
+    def size(self):
+        """
+        Number of tokens
+        :return:
+        """
+        return len(self._apis)
+    # end size
+
+    # Number of calls
+    @property
+    def calls(self):
+        """
+        Number of calls made, on all tokens
+        :return:
+        """
+        return self._calls
+    # end calls
+
+    #################################
+    # PUBLIC
+    #################################
+
+    # Call an endpoint
+    def call(self, endpoint, *args, **kwargs):
+        """
+        Call an endpoint with the token having the most headroom
+        :param endpoint: Name of the tweepy.API method
+        :param args: Arguments
+        :param kwargs: Keyword arguments
+        :return: Call result
+        """
+        while True:
+            # Token
+            token = self._acquire(endpoint)
+            api = self._thread_apis()[token]
+
+            # Call
+            try:
+                result = getattr(api, endpoint)(*args, **kwargs)
+            except tweepy.error.TweepError as e:
+                # Rate limited, try another token
+                if getattr(e, 'response', None) is not None and e.response.status_code == 429:
+                    self._update(endpoint, token, e.response, exhausted=True)
+                    continue
+                # end if
+                raise
+            # end try
+
+            # Remember limits
+            self._update(endpoint, token, api.last_response)
+
+            return result
+        # end while
+    # end call
+
+    # Method of an endpoint
+    def method(self, endpoint):
+        """
+        Function calling an endpoint through the pool, usable with tweepy.Cursor
+        :param endpoint: Name of the tweepy.API method
+        :return: Function
+        """
+        # Call through the pool
+        def pooled(*args, **kwargs):
+            return self.call(endpoint, *args, **kwargs)
+        # end pooled
+
+        # Cursor needs the pagination mode of the method
+        bound = getattr(self._apis[0], endpoint)
+        if hasattr(bound, 'pagination_mode'):
+            pooled.pagination_mode = bound.pagination_mode
+        # end if
+
+        return pooled
+    # end method
+
+    # Endpoint has budget
+    def available(self, endpoint):
+        """
+        Endpoint has budget on at least one token, so that a call would not sleep
+        :param endpoint: Name of the tweepy.API method
+        :return:
+        """
+        now = time.time()
+        with self._lock:
+            return any([
+                limit is None or limit[0] > 0 or limit[1] <= now
+                for limit in self._limits.get(endpoint, [None])
+            ])
+        # end with
+    # end available
+
+    # Next window reset
+    def next_reset(self, endpoint):
+        """
+        Time at which the first token gets budget again for an endpoint
+        :param endpoint: Name of the tweepy.API method
+        :return: Time, now if a token already has budget
+        """
+        if self.available(endpoint):
+            return time.time()
+        # end if
+        with self._lock:
+            return min([limit[1] for limit in self._limits[endpoint]])
+        # end with
+    # end next_reset
+
+    # Remaining calls
+    def remaining(self, endpoint):
+        """
+        Remaining calls of an endpoint on each token
+        :param endpoint: Name of the tweepy.API method
+        :return: List of remaining calls (None if unknown)
+        """
+        with self._lock:
+            return [
+                limit[0] if limit is not None else None
+                for limit in self._limits.get(endpoint, [None] * len(self._apis))
+            ]
+        # end with
+    # end remaining
+
+    #################################
+    # PRIVATE
+    #################################
+
+    # APIs of the current thread
+    def _thread_apis(self):
+        """
+        APIs of the current thread, one per token, so that last_response is the response of the call of this thread
+        :return: List of tweepy.API
+        """
+        apis = getattr(self._local, 'apis', None)
+        if apis is None:
+            apis = [
+                tweepy.API(auth, retry_delay=self._retry_delay, wait_on_rate_limit=False)
+                for auth in self._auths
+            ]
+            self._local.apis = apis
+        # end if
+        return apis
+    # end _thread_apis
+
+    # Choose a token
+    def _acquire(self, endpoint):
+        """
+        Choose the token with the most remaining calls, sleep if all are exhausted
+        :param endpoint: Name of the tweepy.API method
+        :return: Token index
+        """
+        while True:
+            with self._lock:
+                # Limits of the endpoint
+                limits = self._limits.setdefault(endpoint, [None] * len(self._apis))
+                now = time.time()
+
+                # Windows over
+                for token, limit in enumerate(limits):
+                    if limit is not None and limit[1] <= now:
+                        limits[token] = None
+                    # end if
+                # end for
+
+                # Unknown limits first, then most remaining calls
+                token = max(range(len(limits)), key=lambda t: float('inf') if limits[t] is None else limits[t][0])
+                if limits[token] is None or limits[token][0] > 0:
+                    if limits[token] is not None:
+                        limits[token][0] -= 1
+                    # end if
+                    self._calls += 1
+                    return token
+                # end if
+
+                # All exhausted
+                delay = min([limit[1] for limit in limits]) - now + 1
+            # end with
+
+            # Wait for the first window to end
+            print(u"Rate limit reached for {} on all {} tokens, sleeping {:.0f}s".format(
+                endpoint,
+                len(self._apis),
+                delay
+            ))
+            time.sleep(max(delay, 0))
+        # end while
+    # end _acquire
+
+    # Update limits from a response
+    def _update(self, endpoint, token, response, exhausted=False):
+        """
+        Update the limits of a token from the rate-limit headers of a response
+        :param endpoint: Name of the tweepy.API method
+        :param token: Token index
+        :param response: HTTP response
+        :param exhausted: The call was refused because of the rate limit
+        :return:
+        """
+        # Headers
+        headers = response.headers if response is not None else dict()
+        remaining = headers.get('x-rate-limit-remaining')
+        reset = headers.get('x-rate-limit-reset')
+
+        # Update
+        with self._lock:
+            limits = self._limits.setdefault(endpoint, [None] * len(self._apis))
+            if exhausted:
+                limits[token] = [0, float(reset) if reset is not None else time.time() + 900]
+            elif remaining is not None and reset is not None:
+                limits[token] = [int(remaining), float(reset)]
+            # end if
+        # end with
+    # end _update
+
+# end TokenPool
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : twitter.TweetArchive.py
+# Description : Append-only archive of raw timeline pages in compressed JSONL segments.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Imports
+import glob
+import gzip
+import json
+import os
+import re
+import threading
+
+
+# Tweet archive
+class TweetArchive(object):
+    """
+    Raw timeline pages, one JSON line per page with its user and tweet id
+    range, appended to gzip segments rotated by size. Processes sharing the
+    directory write their own segments, named after the worker.
+    """
+
+    # Constructor
+    def __init__(self, directory, segment_size=32 * 1024 * 1024, name=None):
+        """
+        Constructor
+        :param directory: Directory of the segments
+        :param segment_size: Uncompressed size after which a new segment is started (bytes)
+        :param name: Worker name put in the segment names, None for a single process
+        """
+        # Properties
+        self._directory = directory
+        self._segment_size = segment_size
+        self._name = name
+
+        # Create directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # end if
+
+        # Current segment, always a new one after the last of this writer, segments are never reopened
+        own = re.compile(r"^segment-{}(\d+)\.jsonl\.gz$".format(re.escape(name + u"-") if name is not None else u""))
+        matches = [own.match(os.path.basename(path)) for path in self.segments()]
+        self._segment_index = max([-1] + [int(match.group(1)) for match in matches if match is not None]) + 1
+        self._segment = None
+        self._segment_written = 0
+
+        # Lock on writes
+        self._lock = threading.Lock()
+    # end __init__
+
+    #################################
+    # PUBLIC
+    #################################
+
+    # Archive a page
+    def write_page(self, screen_name, page):
+        """
+        Append a timeline page
+        :param screen_name: Screen name of the timeline owner
+        :param page: List of tweets, with their raw JSON
+        :return:
+        """
+        # Empty page
+        if len(page) == 0:
+            return
+        # end if
+
+        # Record
+        ids = [tweet.id for tweet in page]
+        line = json.dumps({
+            'user': screen_name,
+            'min_id': min(ids),
+            'max_id': max(ids),
+            'tweets': [tweet._json for tweet in page]
+        }) + "\n"
+
+        # Write
+        with self._lock:
+            # Rotate
+            if self._segment is None or self._segment_written >= self._segment_size:
+                self._rotate()
+            # end if
+
+            # Append
+            self._segment.write(line.encode('utf-8') if not isinstance(line, bytes) else line)
+            self._segment_written += len(line)
+        # end with
+    # end write_page
+
+    # Segment paths
+    def segments(self):
+        """
+        Paths of the segments of every writer, oldest first for each writer
+        :return: List of paths
+        """
+        return sorted(glob.glob(os.path.join(self._directory, "segment-*.jsonl.gz")))
+    # end segments
+
+    # Close
+    def close(self):
+        """
+        Close the current segment
+        :return:
+        """
+        with self._lock:
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+            # end if
+        # end with
+    # end close
+
+    #################################
+    # PRIVATE
+    #################################
+
+    # Name of the current segment
+    def _segment_name(self):
+        """
+        Name of the current segment
+        :return:
+        """
+        if self._name is not None:
+            return u"segment-{}-{:06d}.jsonl.gz".format(self._name, self._segment_index)
+        # end if
+        return u"segment-{:06d}.jsonl.gz".format(self._segment_index)
+    # end _segment_name
+
+    # Start a new segment
+    def _rotate(self):
+        """
+        Close the current segment and start a new one
+        :return:
+        """
+        # Close
+        if self._segment is not None:
+            self._segment.close()
+            self._segment_index += 1
+        # end if
+
+        # Open
+        self._segment = gzip.open(os.path.join(self._directory, self._segment_name()), 'ab')
+        self._segment_written = 0
+    # end _rotate
+
+# end TweetArchive
+
+
+# Read a segment
+def read_segment(path):
+    """
+    Read the pages of a segment, usable in a worker process
+    :param path: Segment path
+    :return: List of (screen name, min tweet id, max tweet id, list of raw tweets)
+    """
+    pages = list()
+    with gzip.open(path, 'rb') as f:
+        try:
+            for line in f:
+                try:
+                    record = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    # Truncated last line of an interrupted run
+                    continue
+                # end try
+                pages.append((record['user'], record['min_id'], record['max_id'], record['tweets']))
+            # end for
+        except (IOError, EOFError):
+            # Segment left unclosed by an interrupted run, keep the pages read
+            pass
+        # end try
+    # end with
+    return pages
+# end read_segment
@@ -22,6 +22,10 @@
 
 import tweepy
 from tanaturf.patterns.singleton import singleton
+from .ProfileCache import ProfileCache
+from .RequestScheduler import RequestScheduler
+from .TokenPool import TokenPool
+from .UserHydrator import UserHydrator
 
 
 # Request limits reached.
@@ -41,39 +45,125 @@ class TwitterConnector(object):
     """
 
     # Constructor
-    def __init__(self, auth_token1, auth_token2, access_token1, access_token2):
+    def __init__(self, auth_token1, auth_token2, access_token1, access_token2, profile_cache=None, profile_ttl=604800.0,
+                 profile_cache_size=10000, credentials=None, archive=None):
         """
         Constructor
         :param auth_token1:
         :param auth_token2:
         :param access_token1:
         :param access_token2:
+        :param profile_cache: Path to the profile cache file, None to always ask the API
+        :param profile_ttl: Time after which a cached profile is fetched again (seconds)
+        :param profile_cache_size: Number of profiles kept in memory
+        :param credentials: Other (auth token 1, auth token 2, access token 1, access token 2) to spread calls on
+        :param archive: TweetArchive receiving the raw timeline pages, None to archive nothing
         """
-        # Auth to Twitter
-        auth = tweepy.OAuthHandler(auth_token1, auth_token2)
-        auth.set_access_token(access_token1, access_token2)
-        self._api = tweepy.API(auth, retry_delay=3, wait_on_rate_limit=True, wait_on_rate_limit_notify=True)
+        # Auth to Twitter, calls go to the token with the most remaining calls
+        self._pool = TokenPool(
+            [(auth_token1, auth_token2, access_token1, access_token2)] + list(credentials if credentials else [])
+        )
+        self._api = self._pool.api
         self._page = None
+
+        # Profile cache
+        if profile_cache is not None:
+            self._profile_cache = ProfileCache(
+                profile_cache,
+                ttl=profile_ttl,
+                size=profile_cache_size,
+                parse=lambda data: tweepy.models.User.parse(self._api, data)
+            )
+        else:
+            self._profile_cache = None
+        # end if
+
+        # Batched user lookups
+        self._hydrator = UserHydrator(self._lookup_users, profile_cache=self._profile_cache)
+
+        # Deferred calls, dispatched by endpoint budget
+        self._scheduler = RequestScheduler(self._pool)
+
+        # Raw timeline pages
+        self._archive = archive
     # end __init__
 
+    ###########################################
+    # Properties
+    ###########################################
+
+    # Number of API calls
+    @property
+    def n_calls(self):
+        """
+        Number of API calls made, on all tokens
+        :return:
+        """
+        return self._pool.calls
+    # end n_calls
+
     ###########################################
     # Public
     ###########################################
 
     # Get user timeline
-    def get_user_timeline(self, screen_name, n_pages=-1):
+    def get_user_timeline(self, screen_name, n_pages=-1, since_id=None, max_id=None):
         """
-        Get time line.
+        Get time line, 200 tweets per page with trimmed authors
         :param n_pages:
+        :param since_id: Only tweets more recent than this id
+        :param max_id: Only tweets older than or equal to this id
         :return:
         """
+        # Server-side bounds
+        bounds = dict()
+        if since_id is not None:
+            bounds['since_id'] = since_id
+        # end if
+        if max_id is not None:
+            bounds['max_id'] = max_id
+        # end if
+
+        # Cursor
+        cursor = tweepy.Cursor(
+            self._pool.method("user_timeline"),
+            screen_name=screen_name,
+            count=200,
+            trim_user=True,
+            **bounds
+        )
+
         if n_pages == -1:
-            return tweepy.Cursor(self._api.user_timeline, screen_name=screen_name).pages()
+            pages = cursor.pages()
         else:
-            return tweepy.Cursor(self._api.user_timeline, screen_name=screen_name).pages(limit=n_pages)
+            pages = cursor.pages(limit=n_pages)
+        # end if
+
+        # Archive pages as they are read
+        if self._archive is not None:
+            return self._archived_pages(screen_name, pages)
         # end if
+
+        return pages
     # end get_time_line
 
+    # Get latest status ids
+    def get_latest_status_ids(self, screen_names):
+        """
+        Id of the latest status of users, looked up by batch of 100
+        :param screen_names: List of screen names
+        :return: Dictionary (lower-case screen name -> status id, None if no status)
+        """
+        latest = dict()
+        for start in range(0, len(screen_names), 100):
+            for user in self._lookup_users([], screen_names[start:start + 100]):
+                status = getattr(user, 'status', None)
+                latest[user.screen_name.lower()] = status.id if status is not None else None
+            # end for
+        # end for
+        return latest
+    # end get_latest_status_ids
+
     # Ger search cursor
     def search_tweets(self, search, n_pages=-1):
         """
@@ -83,25 +173,66 @@ class TwitterConnector(object):
         :return:
         """
         if n_pages == -1:
-            return tweepy.Cursor(self._api.search, q=search).pages()
+            return tweepy.Cursor(self._pool.method("search"), q=search).pages()
         else:
-            return tweepy.Cursor(self._api.search, q=search).pages(limit=n_pages)
+            return tweepy.Cursor(self._pool.method("search"), q=search).pages(limit=n_pages)
         # end if
     # end search_tweets
 
     # Get the user
-    def get_user(self, screen_name=None):
+    def get_user(self, screen_name=None, user_id=None):
         """
-        Get the user
+        Get the user, from the profile cache if fresh
+        :param screen_name: Screen name
+        :param user_id: User id, used if given
         :return: The Twitter user object.
         """
-        if screen_name is None:
-            return self._api.get_user(self._config['user'])
+        # Cached
+        if self._profile_cache is not None:
+            user = self._profile_cache.get(screen_name=screen_name, user_id=user_id)
+            if user is not None:
+                return user
+            # end if
+        # end if
+
+        # Ask the API
+        if user_id is not None:
+            user = self._pool.call("get_user", user_id=user_id)
+        elif screen_name is None:
+            user = self._pool.call("get_user", self._config['user'])
         else:
-            return self._api.get_user(screen_name)
+            user = self._pool.call("get_user", screen_name)
+        # end if
+
+        # Cache
+        if self._profile_cache is not None:
+            self._profile_cache.put(user, user._json)
         # end if
+
+        return user
     # end get_user
 
+    # Request a user, resolved in batch
+    def hydrate_user(self, callback, screen_name=None, user_id=None):
+        """
+        Request a user, resolved with users/lookup by batch of 100
+        :param callback: Function called with the Twitter user object, or None if not found
+        :param screen_name: Screen name
+        :param user_id: User id, used if given
+        :return:
+        """
+        self._hydrator.request(callback, screen_name=screen_name, user_id=user_id)
+    # end hydrate_user
+
+    # Resolve pending users
+    def flush_hydration(self):
+        """
+        Resolve all pending users requested with hydrate_user
+        :return: Number of resolved requests
+        """
+        return self._hydrator.flush()
+    # end flush_hydration
+
     # Get followers
     def get_followers(self, twitter_user):
         """
@@ -109,9 +240,39 @@ class TwitterConnector(object):
         :param twitter_user:
         :return:
         """
-        return tweepy.Cursor(self._api.followers, id=twitter_user.id).pages()
+        return tweepy.Cursor(self._pool.method("followers"), id=twitter_user.id).pages()
     # end get_followers
 
+    # Get follower ids
+    def get_follower_ids(self, screen_name=None, user_id=None):
+        """
+        Get follower ids, 5000 per page
+        :param screen_name: Screen name
+        :param user_id: User id, used if given
+        :return: Iterator of pages of user ids
+        """
+        if user_id is not None:
+            return tweepy.Cursor(self._pool.method("followers_ids"), user_id=user_id, count=5000).pages()
+        else:
+            return tweepy.Cursor(self._pool.method("followers_ids"), screen_name=screen_name, count=5000).pages()
+        # end if
+    # end get_follower_ids
+
+    # Get friend ids
+    def get_friend_ids(self, screen_name=None, user_id=None):
+        """
+        Get friend ids, 5000 per page
+        :param screen_name: Screen name
+        :param user_id: User id, used if given
+        :return: Iterator of pages of user ids
+        """
+        if user_id is not None:
+            return tweepy.Cursor(self._pool.method("friends_ids"), user_id=user_id, count=5000).pages()
+        else:
+            return tweepy.Cursor(self._pool.method("friends_ids"), screen_name=screen_name, count=5000).pages()
+        # end if
+    # end get_friend_ids
+
     # Get following
     def get_following(self, twitter_user):
         """
@@ -119,7 +280,7 @@ class TwitterConnector(object):
         :param twitter_user:
         :return:
         """
-        return tweepy.Cursor(self._api.friends, id=twitter_user.id).pages()
+        return tweepy.Cursor(self._pool.method("friends"), id=twitter_user.id).pages()
     # end get_followers
 
     # Get retweets
@@ -129,9 +290,38 @@ class TwitterConnector(object):
         :param tweet_id:
         :return:
         """
-        return self._api.retweets(tweet.id)
+        return self._pool.call("retweets", tweet.id)
     # end get_retweets
 
+    # Request retweeter ids
+    def request_retweeter_ids(self, tweet, callback):
+        """
+        Queue a statuses/retweeters/ids call (up to 100 ids), run when it has budget
+        :param tweet:
+        :param callback: Function called with the list of retweeter ids
+        :return:
+        """
+        self._scheduler.submit("retweeters", callback, id=tweet.id)
+    # end request_retweeter_ids
+
+    # Dispatch deferred calls
+    def dispatch(self):
+        """
+        Run the deferred calls whose endpoint has budget, without waiting
+        :return: Number of calls
+        """
+        return self._scheduler.dispatch()
+    # end dispatch
+
+    # Run all deferred calls
+    def drain(self):
+        """
+        Run all deferred calls, waiting for rate-limit windows if needed
+        :return: Number of calls
+        """
+        return self._scheduler.drain()
+    # end drain
+
     ###########################################
     # Override
     ###########################################
@@ -140,4 +330,48 @@ class TwitterConnector(object):
     # Private
     ###########################################
 
+    # Archive timeline pages
+    def _archived_pages(self, screen_name, pages):
+        """
+        Write each timeline page to the archive before handing it over
+        :param screen_name: Screen name of the timeline owner
+        :param pages: Page iterator
+        :return: Page iterator
+        """
+        for page in pages:
+            self._archive.write_page(screen_name, page)
+            yield page
+        # end for
+    # end _archived_pages
+
+    # Look users up
+    def _lookup_users(self, user_ids, screen_names):
+        """
+        Look users up with one users/lookup call
+        :param user_ids: List of user ids
+        :param screen_names: List of screen names
+        :return: List of Twitter user objects found
+        """
+        # Lookup
+        try:
+            users = self._pool.call("lookup_users", user_ids=user_ids, screen_names=screen_names)
+        except tweepy.error.TweepError as e:
+            # None of them exists
+            if e.api_code == 17:
+                return list()
+            # end if
+            raise
+        # end try
+
+        # Cache
+        if self._profile_cache is not None:
+            for user in users:
+                self._profile_cache.put(user, user._json, commit=False)
+            # end for
+            self._profile_cache.commit()
+        # end if
+
+        return users
+    # end _lookup_users
+
 # end TwitterConnector
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : twitter.UserHydrator.py
+# Description : Batched resolution of Twitter user ids and screen names.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+# User hydrator
+class UserHydrator(object):
+    """
+    Accumulates user ids and screen names to resolve, and resolves them
+    with one lookup call per batch. Each request comes with a callback,
+    called with the user object, or None if the user does not exist.
+    """
+
+    # Constructor
+    def __init__(self, lookup, profile_cache=None, batch_size=100):
+        """
+        Constructor
+        :param lookup: Function (list of user ids, list of screen names) -> list of user objects
+        :param profile_cache: ProfileCache answering requests without lookup, None to always look up
+        :param batch_size: Number of users per lookup call
+        """
+        # Properties
+        self._lookup = lookup
+        self._profile_cache = profile_cache
+        self._batch_size = batch_size
+
+        # Pending callbacks (user id or lower-case screen name -> callbacks)
+        self._user_ids = dict()
+        self._screen_names = dict()
+
+        # Lookup calls
+        self.n_lookups = 0
+    # end __init__
+
+    #################################
+    # PROPERTIES
+    #################################
+
+    # Number of pending users
+    @property
+    def pending(self):
+        """
+        Number of pending users
+        :return:
+        """
+        return len(self._user_ids) + len(self._screen_names)
+    # end pending
+
+    #################################
+    # PUBLIC
+    #################################
+
+    # Request a user
+    def request(self, callback, screen_name=None, user_id=None):
+        """
+        Request a user, the callback is called when the batch is resolved
+        :param callback: Function called with the user object, or None if not found
+        :param screen_name: Screen name
+        :param user_id: User id, used if given
+        :return:
+        """
+        # Cached
+        if self._profile_cache is not None:
+            user = self._profile_cache.get(screen_name=screen_name, user_id=user_id)
+            if user is not None:
+                callback(user)
+                return
+            # end if
+        # end if
+
+        # Pending
+        if user_id is not None:
+            self._user_ids.setdefault(user_id, list()).append(callback)
+        else:
+            self._screen_names.setdefault(screen_name.lower(), list()).append(callback)
+        # end if
+
+        # Full batch
+        if self.pending >= self._batch_size:
+            self.flush()
+        # end if
+    # end request
+
+    # Resolve pending users
+    def flush(self):
+        """
+        Resolve all pending users
+        :return: Number of resolved requests
+        """
+        # Pending
+        user_ids, self._user_ids = self._user_ids, dict()
+        screen_names, self._screen_names = self._screen_names, dict()
+
+        # Requests in lookup order
+        requests = [(True, user_id) for user_id in user_ids] + [(False, name) for name in screen_names]
+
+        # For each batch
+        n_resolved = 0
+        for start in range(0, len(requests), self._batch_size):
+            # Batch
+            batch = requests[start:start + self._batch_size]
+
+            # Lookup, on error the users of this batch and the next ones are pending again
+            try:
+                users = self._lookup(
+                    [key for by_id, key in batch if by_id],
+                    [key for by_id, key in batch if not by_id]
+                )
+            except Exception:
+                self._requeue(requests[start:], user_ids, screen_names)
+                raise
+            # end try
+            self.n_lookups += 1
+
+            # Index results
+            by_ids = dict([(user.id, user) for user in users])
+            by_names = dict([(user.screen_name.lower(), user) for user in users])
+
+            # Call back
+            for by_id, key in batch:
+                if by_id:
+                    user, callbacks = by_ids.get(key), user_ids[key]
+                else:
+                    user, callbacks = by_names.get(key), screen_names[key]
+                # end if
+                for callback in callbacks:
+                    callback(user)
+                    n_resolved += 1
+                # end for
+            # end for
+        # end for
+
+        return n_resolved
+    # end flush
+
+    #################################
+    # PRIVATE
+    #################################
+
+    # Put requests back
+    def _requeue(self, requests, user_ids, screen_names):
+        """
+        Put unresolved requests back in the pending ones
+        :param requests: List of (by id, key)
+        :param user_ids: Callbacks of the requests by user id
+        :param screen_names: Callbacks of the requests by screen name
+        :return:
+        """
+        for by_id, key in requests:
+            if by_id:
+                self._user_ids.setdefault(key, list()).extend(user_ids[key])
+            else:
+                self._screen_names.setdefault(key, list()).extend(screen_names[key])
+            # end if
+        # end for
+    # end _requeue
+
+# end UserHydrator
@@ -21,4 +21,12 @@
 #
 
 # Import
+from .ArchiveConnector import ArchiveConnector
+from .DepthController import DepthController
+from .PageFetcher import PageFetcher
+from .ProfileCache import ProfileCache
+from .RequestScheduler import RequestScheduler
+from .TokenPool import TokenPool
+from .TweetArchive import TweetArchive
 from .TwitterConnector import TwitterConnector
+from .UserHydrator import UserHydrator
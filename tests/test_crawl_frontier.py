@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : tests.test_crawl_frontier.py
+# Description : CrawlFrontier states, retries and leases.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Imports
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from tanaturf.storage.CrawlFrontier import CrawlFrontier
+
+
+# CrawlFrontier tests
+class TestCrawlFrontier(unittest.TestCase):
+    """
+    Frontier in a temporary file
+    """
+
+    # Create the frontier
+    def setUp(self):
+        """
+        Create a frontier of three users
+        :return:
+        """
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "frontier.db")
+        self.frontier = CrawlFrontier(self.path, max_retries=2)
+        self.frontier.reset([u"alice", u"bob", u"carol"])
+    # end setUp
+
+    # Remove the frontier
+    def tearDown(self):
+        """
+        Close and remove the frontier
+        :return:
+        """
+        self.frontier.close()
+        shutil.rmtree(self.directory)
+    # end tearDown
+
+    # Crawl order
+    def test_claim_order(self):
+        """
+        Users are claimed once, in crawl order
+        """
+        self.assertEqual(self.frontier.claim(2), [u"alice", u"bob"])
+        self.assertEqual(self.frontier.claim(2), [u"carol"])
+        self.assertEqual(self.frontier.claim(2), [])
+        self.assertEqual(self.frontier.held(), 3)
+    # end test_claim_order
+
+    # Retries
+    def test_failed_retried(self):
+        """
+        A failed user goes back to the end of the frontier until it failed max_retries times
+        """
+        self.frontier.claim(3)
+        self.assertTrue(self.frontier.failed(u"alice", u"error"))
+        self.assertTrue(self.frontier.done(u"bob"))
+        self.assertTrue(self.frontier.done(u"carol"))
+        self.assertEqual(self.frontier.held(), 0)
+
+        # Retried
+        self.assertEqual(self.frontier.claim(3), [u"alice"])
+        self.assertFalse(self.frontier.failed(u"alice", u"error"))
+
+        # Given up
+        self.assertEqual(self.frontier.claim(3), [])
+        self.assertEqual(self.frontier.counts(), {u"done": 2, u"failed": 1})
+    # end test_failed_retried
+
+    # Resume
+    def test_resume(self):
+        """
+        Users left in progress by an interrupted crawl are put back in a new process
+        """
+        self.frontier.claim(2)
+        self.frontier.done(u"alice")
+        self.frontier.close()
+
+        self.frontier = CrawlFrontier(self.path, max_retries=2)
+        self.assertEqual(self.frontier.resume(), 1)
+        self.assertEqual(self.frontier.claim(3), [u"bob", u"carol"])
+    # end test_resume
+
+    # Shared reset
+    def test_reset_finished(self):
+        """
+        Workers only fill the frontier again once every user is done or failed
+        """
+        self.frontier.claim(3)
+        self.assertEqual(self.frontier.reset([u"dave"], only_if_finished=True), 3)
+        self.frontier.done(u"alice")
+        self.frontier.done(u"bob")
+        self.assertEqual(self.frontier.remaining, 1)
+
+        # Finished
+        self.frontier.failed(u"carol", u"error")
+        self.frontier.claim(1)
+        self.frontier.failed(u"carol", u"error")
+        self.assertEqual(self.frontier.remaining, 0)
+        self.assertEqual(self.frontier.reset([u"dave"], only_if_finished=True), 1)
+        self.assertEqual(self.frontier.claim(3), [u"dave"])
+    # end test_reset_finished
+
+    # Leases
+    def test_lease_expired(self):
+        """
+        Users of a worker that stopped renewing its lease go to another worker, the first one cannot mark them any more
+        """
+        self.assertEqual(self.frontier.claim(2, worker=u"w1", lease=-1.0), [u"alice", u"bob"])
+
+        # Taken over
+        self.assertEqual(self.frontier.claim(3, worker=u"w2", lease=60.0), [u"alice", u"bob", u"carol"])
+        self.assertEqual(self.frontier.held(u"w1"), 0)
+        self.assertEqual(self.frontier.held(u"w2"), 3)
+
+        # Late answers of the first worker
+        self.assertFalse(self.frontier.done(u"alice", worker=u"w1"))
+        self.assertIsNone(self.frontier.failed(u"bob", u"error", worker=u"w1"))
+        self.assertEqual(self.frontier.held(u"w2"), 3)
+
+        # The holder finishes them
+        self.assertTrue(self.frontier.done(u"alice", worker=u"w2"))
+        self.assertTrue(self.frontier.failed(u"bob", u"error", worker=u"w2"))
+        self.assertEqual(self.frontier.counts(), {u"done": 1, u"pending": 1, u"in_progress": 1})
+    # end test_lease_expired
+
+    # Heartbeats
+    def test_heartbeat(self):
+        """
+        Renewed leases keep the users of a worker
+        """
+        self.frontier.claim(2, worker=u"w1", lease=-1.0)
+        self.assertEqual(self.frontier.heartbeat(u"w1", 60.0), 2)
+        self.assertEqual(self.frontier.claim(3, worker=u"w2", lease=60.0), [u"carol"])
+        self.assertIsNotNone(self.frontier.next_expiry(u"w2"))
+    # end test_heartbeat
+
+    # Restarted worker
+    def test_release(self):
+        """
+        A worker restarted under the same name puts back the users its earlier run left, and only renews its own
+        """
+        crashed = CrawlFrontier(self.path)
+        self.assertEqual(crashed.claim(1, worker=u"w1", lease=0.1), [u"alice"])
+        crashed.close()
+
+        # Background heartbeats only renew the users claimed since the restart
+        self.assertEqual(self.frontier.claim(1, worker=u"w1", lease=-1.0), [u"bob"])
+        stop = self.frontier.keep_leases(u"w1", 60.0, interval=0.01)
+        time.sleep(0.3)
+        stop.set()
+        self.assertEqual(self.frontier.claim(3, worker=u"w2", lease=60.0), [u"alice", u"carol"])
+        self.assertTrue(self.frontier.failed(u"alice", u"error", worker=u"w2"))
+
+        # Left users put back, own users kept
+        crashed = CrawlFrontier(self.path)
+        crashed.claim(1, worker=u"w1", lease=60.0)
+        crashed.close()
+        self.assertEqual(self.frontier.release(u"w1"), 1)
+        self.assertEqual(self.frontier.held(u"w1"), 1)
+        self.assertEqual(self.frontier.claim(1, worker=u"w1", lease=60.0), [u"alice"])
+    # end test_release
+
+    # Exclusive run
+    def test_exclusively(self):
+        """
+        Other processes cannot claim while a function runs exclusively
+        """
+        other = CrawlFrontier(self.path)
+        other.db.execute(u"PRAGMA busy_timeout = 0")
+
+        def claim():
+            try:
+                return other.claim(1)
+            except Exception:
+                return None
+            # end try
+        # end claim
+
+        self.assertIsNone(self.frontier.exclusively(claim))
+        self.assertEqual(claim(), [u"alice"])
+        other.close()
+    # end test_exclusively
+
+# end TestCrawlFrontier
+
+
+# Main
+if __name__ == "__main__":
+    unittest.main()
+# end if
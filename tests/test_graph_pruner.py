@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : tests.test_graph_pruner.py
+# Description : Iterative pruning of the graph and batched deletion.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+# Imports
+import unittest
+from tanaturf.storage.GraphPruner import GraphPruner
+from tanaturf.storage.SQLiteConnector import SQLiteConnector
+
+
+# Two users and a chain of hashtags (10 to 15) needing two inputs each: 13 has one input and goes first, 12 and 14
+# fall below two inputs once 13 is gone, then 11 once 12 is gone, 15 keeps two inputs, 10 never had any
+LABELS = {
+    1: "TwitterUser",
+    2: "TwitterUser",
+    10: "Hashtag",
+    11: "Hashtag",
+    12: "Hashtag",
+    13: "Hashtag",
+    14: "Hashtag",
+    15: "Hashtag"
+}
+EDGES = [
+    (12, 11), (2, 11),
+    (1, 12), (13, 12),
+    (1, 13),
+    (12, 14), (13, 14),
+    (12, 15), (1, 15), (2, 15)
+]
+
+
+# GraphPruner tests
+class TestGraphPruner(unittest.TestCase):
+    """
+    Pruning rounds on an adjacency in memory
+    """
+
+    # Pruner
+    def setUp(self):
+        """
+        Hashtags need two inputs, users are kept as long as they refer to something
+        :return:
+        """
+        self.pruner = GraphPruner({"TwitterUser": 2, "Website": 1, "Hashtag": 2}, keep_sources=["TwitterUser"])
+    # end setUp
+
+    # Fixpoint
+    def test_rounds(self):
+        """
+        Nodes falling below the minimum once their neighbours are removed go in the next rounds
+        """
+        removed_ids, rounds = self.pruner.prune(LABELS, EDGES)
+        self.assertEqual(rounds, [1, 2, 1])
+        self.assertEqual(removed_ids[0], 13)
+        self.assertEqual(sorted(removed_ids[1:3]), [12, 14])
+        self.assertEqual(removed_ids[3], 11)
+    # end test_rounds
+
+    # Orphans
+    def test_orphans_removed(self):
+        """
+        A node whose inputs are all removed goes, nodes that never had any input stay
+        """
+        labels = dict(LABELS, **{20: "Website", 21: "Website"})
+        removed_ids, rounds = self.pruner.prune(labels, EDGES + [(13, 20)])
+        self.assertEqual(rounds, [1, 3, 1])
+        self.assertIn(20, removed_ids[1:4])
+        self.assertNotIn(21, removed_ids)
+        self.assertNotIn(10, removed_ids)
+    # end test_orphans_removed
+
+    # Sources
+    def test_sources_kept(self):
+        """
+        Users lose their inputs but are kept while they refer to remaining nodes, then go once they refer to nothing
+        """
+        labels = dict(LABELS, **{3: "TwitterUser"})
+        removed_ids, rounds = self.pruner.prune(labels, EDGES + [(1, 3), (3, 10)])
+        self.assertEqual(sorted(removed_ids[:2]), [10, 13])
+        self.assertIn(3, removed_ids[2:5])
+        self.assertNotIn(1, removed_ids)
+        self.assertNotIn(2, removed_ids)
+    # end test_sources_kept
+
+    # Protected nodes
+    def test_protected(self):
+        """
+        Protected nodes stop the chain
+        """
+        removed_ids, rounds = self.pruner.prune(LABELS, EDGES, protected=[13])
+        self.assertEqual(removed_ids, [])
+        self.assertEqual(rounds, [])
+    # end test_protected
+
+# end TestGraphPruner
+
+
+# Cleaning tests
+class TestCleanLoneWolves(unittest.TestCase):
+    """
+    Pruning of a SQLite graph, deleted by batch
+    """
+
+    # Graph
+    def setUp(self):
+        """
+        The graph above, and a classified user retweeted once, only referring to a hashtag nobody else refers to
+        :return:
+        """
+        self.storage = SQLiteConnector(":memory:")
+        users = [
+            self.storage.add_user_node(u"user{}".format(index), 100, 1000, None, u"fr", classe=classe)
+            for index, classe in enumerate([u"", u"", u"classified"])
+        ]
+        self.hashtags = dict([(index, self.storage.add_hashtag_node(u"#tag{}".format(index))) for index in range(6)])
+
+        # Graph above
+        nodes = {1: users[0], 2: users[1]}
+        nodes.update([(10 + index, hashtag) for index, hashtag in self.hashtags.items()])
+        for source, target in EDGES:
+            self.storage.hashtaged_relationship(nodes[source], nodes[target])
+        # end for
+
+        # Classified user
+        self.storage.retweet_relationship(users[0], users[2])
+        self.storage.hashtaged_relationship(users[2], self.hashtags[0])
+        self.storage.flush()
+    # end setUp
+
+    # Number of relationships to a node
+    def inputs(self, node):
+        """
+        Number of relationships to a node
+        :param node: Node record
+        :return:
+        """
+        return self.storage.db.execute(u"SELECT count(*) FROM relationships WHERE target = ?", (node.id,)).fetchone()[0]
+    # end inputs
+
+    # Batched delete
+    def test_batched_delete(self):
+        """
+        Every round is deleted, one node per transaction, with its relationships
+        """
+        rounds = self.storage.clean_lone_wolves(2, 2, 2, batch_size=1)
+        self.assertEqual(rounds, [2, 3, 1])
+        for index in [0, 1, 2, 3, 4]:
+            self.assertIsNone(self.storage.get_hashtag_node(u"#tag{}".format(index)))
+        # end for
+        self.assertIsNone(self.storage.get_user_node(u"user2"))
+        self.assertIsNotNone(self.storage.get_user_node(u"user0"))
+        self.assertEqual(self.inputs(self.hashtags[5]), 2)
+        self.assertEqual(self.storage.db.execute(u"SELECT count(*) FROM relationships").fetchone()[0], 2)
+    # end test_batched_delete
+
+    # Dry run
+    def test_dry_run(self):
+        """
+        Nothing is deleted in a dry run
+        """
+        self.assertEqual(self.storage.clean_lone_wolves(2, 2, 2, dry_run=True), [2, 3, 1])
+        self.assertIsNotNone(self.storage.get_hashtag_node(u"#tag3"))
+        self.assertEqual(self.inputs(self.hashtags[3]), 1)
+    # end test_dry_run
+
+    # Classified users
+    def test_keep_classified(self):
+        """
+        Classified users are only kept when asked
+        """
+        self.assertEqual(self.storage.clean_lone_wolves(2, 2, 2, keep_classified=True), [2, 2, 1])
+        self.assertIsNotNone(self.storage.get_user_node(u"user2"))
+    # end test_keep_classified
+
+# end TestCleanLoneWolves
+
+
+# Main
+if __name__ == "__main__":
+    unittest.main()
+# end if
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : tests.test_interactions.py
+# Description : Crawl of timelines into a SQLite graph, with failures and retries.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Imports
+import os
+import shutil
+import tempfile
+import unittest
+import tweepy.error
+from tanaturf.interactions import compute_interactions
+from tanaturf.storage.CrawlFrontier import CrawlFrontier
+from tanaturf.storage.SQLiteConnector import SQLiteConnector
+
+
+# Tweet with hashtags
+class Tweet(object):
+    """
+    Tweet with one hashtag
+    """
+
+    # Constructor
+    def __init__(self, tweet_id, hashtag):
+        """
+        Constructor
+        :param tweet_id: Tweet id
+        :param hashtag: Hashtag text
+        """
+        self.id = tweet_id
+        self.retweet_count = 0
+        self.entities = {'urls': [], 'user_mentions': [], 'hashtags': [{'text': hashtag}]}
+    # end __init__
+
+# end Tweet
+
+
+# Twitter connector stand-in
+class Twitter(object):
+    """
+    Timelines read two tweets per page, the first read of a timeline can fail after some pages
+    """
+
+    # Constructor
+    def __init__(self, timelines, failures=None):
+        """
+        Constructor
+        :param timelines: Dictionary (screen name -> list of tweets, most recent first)
+        :param failures: Dictionary (screen name -> list of numbers of pages read before each failure)
+        """
+        self.timelines = timelines
+        self.failures = failures if failures is not None else dict()
+        self.requests = list()
+        self.n_calls = 0
+    # end __init__
+
+    # Latest statuses
+    def get_latest_status_ids(self, screen_names):
+        """
+        Latest status id of each user
+        :param screen_names: Screen names
+        :return: Dictionary (lowercase screen name -> status id)
+        """
+        return dict([(screen_name.lower(), self.timelines[screen_name][0].id) for screen_name in screen_names])
+    # end get_latest_status_ids
+
+    # Timeline pages
+    def get_user_timeline(self, screen_name, n_pages=-1, since_id=None, max_id=None):
+        """
+        Timeline pages between the bounds
+        :param screen_name: Screen name
+        :param n_pages: Ignored, every page is read
+        :param since_id: Only tweets more recent than this id
+        :param max_id: Only tweets older than or equal to this id
+        :return: Page iterator
+        """
+        self.requests.append((screen_name, since_id, max_id))
+        tweets = [
+            tweet for tweet in self.timelines[screen_name]
+            if (since_id is None or tweet.id > since_id) and (max_id is None or tweet.id <= max_id)
+        ]
+        failures = self.failures.get(screen_name, list())
+        n_pages = failures.pop(0) if len(failures) > 0 else None
+
+        # Pages
+        for index in range(0, len(tweets), 2):
+            if n_pages is not None and index / 2 == n_pages:
+                raise tweepy.error.TweepError(u"Over capacity")
+            # end if
+            yield tweets[index:index + 2]
+        # end for
+    # end get_user_timeline
+
+    # Deferred calls
+    def dispatch(self):
+        pass
+    # end dispatch
+
+    # Deferred calls left
+    def drain(self):
+        pass
+    # end drain
+
+    # Mentioned users
+    def flush_hydration(self):
+        pass
+    # end flush_hydration
+
+# end Twitter
+
+
+# Crawl tests
+class TestComputeInteractions(unittest.TestCase):
+    """
+    Crawl of a user whose timeline fails halfway
+    """
+
+    # Storage and frontier
+    def setUp(self):
+        """
+        A graph with one user, five tweets with a hashtag each
+        :return:
+        """
+        self.directory = tempfile.mkdtemp()
+        self.storage = SQLiteConnector(":memory:")
+        self.alice = self.storage.add_user_node(u"alice", 100, 1000, None, u"fr")
+        self.frontier = CrawlFrontier(os.path.join(self.directory, "frontier.db"), max_retries=2)
+        self.timelines = {u"alice": [Tweet(105 - index, u"tag{}".format(index)) for index in range(5)]}
+    # end setUp
+
+    # Remove the frontier
+    def tearDown(self):
+        """
+        Close and remove the frontier
+        :return:
+        """
+        self.frontier.close()
+        shutil.rmtree(self.directory)
+    # end tearDown
+
+    # Crawl
+    def crawl(self, twitter):
+        """
+        Crawl the user, hashtags only
+        :param twitter: Twitter connector
+        :return: Dictionary (hashtag -> HASHTAGED count)
+        """
+        compute_interactions(self.storage, twitter, 0, 0, hashtags=True, root_users=[self.alice],
+                             frontier=self.frontier)
+        return dict(self.storage.db.execute(
+            u"SELECT nodes.key, relationships.count FROM relationships JOIN nodes ON nodes.id = relationships.target "
+            u"WHERE relationships.type = 'HASHTAGED'"
+        ).fetchall())
+    # end crawl
+
+    # Retry
+    def test_retry_halfway(self):
+        """
+        A timeline failing after its first page is retried from the first tweet left unread, every tweet is counted
+        once and the limit is only moved once the whole timeline is read
+        """
+        twitter = Twitter(self.timelines, {u"alice": [1]})
+        counts = self.crawl(twitter)
+        self.assertEqual(twitter.requests, [(u"alice", None, None), (u"alice", None, 103)])
+        self.assertEqual(counts, dict([(u"#tag{}".format(index), 1) for index in range(5)]))
+        self.assertEqual(self.storage.get_user_node(u"alice").last_tweet_id, 105)
+        self.assertEqual(self.frontier.counts(), {u"done": 1})
+        self.assertEqual(self.frontier.cursor(u"alice"), (None, None))
+    # end test_retry_halfway
+
+    # Failed retries
+    def test_retry_failed_again(self):
+        """
+        The cursor moves along the failed retries, the limit is written when the user is given up
+        """
+        twitter = Twitter(self.timelines, {u"alice": [1, 1]})
+        counts = self.crawl(twitter)
+        self.assertEqual(twitter.requests, [(u"alice", None, None), (u"alice", None, 103)])
+        self.assertEqual(counts, dict([(u"#tag{}".format(index), 1) for index in range(4)]))
+        self.assertEqual(self.storage.get_user_node(u"alice").last_tweet_id, 105)
+        self.assertEqual(self.frontier.counts(), {u"failed": 1})
+        self.assertEqual(self.frontier.cursor(u"alice"), (101, 105))
+    # end test_retry_failed_again
+
+# end TestComputeInteractions
+
+
+# Main
+if __name__ == "__main__":
+    unittest.main()
+# end if
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : tests.test_page_fetcher.py
+# Description : PageFetcher against a local HTTP server.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Imports
+import BaseHTTPServer
+import SocketServer
+import json
+import threading
+import time
+import unittest
+import urllib2
+from tanaturf.twitter.PageFetcher import PageFetcher
+
+
+# Pages of each item
+N_PAGES = 3
+
+# Time each request takes (seconds)
+DELAY = 0.05
+
+
+# Threaded HTTP server
+class PageServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Local stand-in of the API, counting the requests in flight
+    """
+
+    # Handler threads do not block the exit
+    daemon_threads = True
+
+    # Constructor
+    def __init__(self):
+        """
+        Constructor
+        """
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), PageHandler)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+    # end __init__
+
+# end PageServer
+
+
+# Page handler
+class PageHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Answers /<item>/<page> with the page as JSON, /fail-<n>/<page> fails from page n
+    """
+
+    # GET
+    def do_GET(self):
+        """
+        Serve a page
+        :return:
+        """
+        # Count
+        with self.server.lock:
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+        # end with
+
+        try:
+            time.sleep(DELAY)
+            item, page = self.path.strip('/').split('/')
+
+            # Failing item
+            if item.startswith('fail-') and int(page) >= int(item.split('-')[1]):
+                self.send_error(500)
+                return
+            # end if
+
+            # Page
+            body = json.dumps({'item': item, 'page': int(page)})
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+            # end with
+        # end try
+    # end do_GET
+
+    # Quiet
+    def log_message(self, format, *args):
+        """
+        No access log
+        :return:
+        """
+        pass
+    # end log_message
+
+# end PageHandler
+
+
+# PageFetcher tests
+class TestPageFetcher(unittest.TestCase):
+    """
+    Streams pages of items read over HTTP by the fetcher threads
+    """
+
+    # Start the server
+    def setUp(self):
+        """
+        Start the server and the fetchers
+        :return:
+        """
+        self.server = PageServer()
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+        self.fetcher = PageFetcher(workers=4, queue_size=2)
+    # end setUp
+
+    # Stop the server
+    def tearDown(self):
+        """
+        Stop the fetchers and the server
+        :return:
+        """
+        self.fetcher.close()
+        self.server.shutdown()
+        self.server.server_close()
+    # end tearDown
+
+    # Pages of an item
+    def request(self, item):
+        """
+        Page iterator of an item
+        :param item: Item name
+        :return:
+        """
+        for page in range(N_PAGES):
+            url = "http://127.0.0.1:{}/{}/{}".format(self.server.server_address[1], item, page)
+            yield json.loads(urllib2.urlopen(url, timeout=10).read())
+        # end for
+    # end request
+
+    # Stream items
+    def stream(self, items, request=None, **kwargs):
+        """
+        Stream items, pages and errors grouped by item
+        :param items: Iterable of items
+        :param request: Page iterator function, self.request by default
+        :param kwargs: Other arguments of PageFetcher.stream
+        :return: Dictionary (item -> list of pages), dictionary (item -> error), list of (item, page, error)
+        """
+        pages, errors, events = dict(), dict(), list()
+        for item, page, error in self.fetcher.stream(items, request if request is not None else self.request, **kwargs):
+            events.append((item, page, error))
+            if page is not None:
+                pages.setdefault(item, list()).append(page['page'])
+            else:
+                self.assertNotIn(item, errors)
+                errors[item] = error
+            # end if
+        # end for
+        return pages, errors, events
+    # end stream
+
+    # Pages in order
+    def test_stream_order(self):
+        """
+        Every page of every item arrives, in page order, before the end of its item, with several requests in flight
+        """
+        items = ["user{}".format(index) for index in range(12)]
+        pages, errors, events = self.stream(items)
+
+        # All items ended once without error
+        self.assertEqual(sorted(errors.keys()), sorted(items))
+        self.assertTrue(all([error is None for error in errors.values()]))
+
+        # Pages in order
+        for item in items:
+            self.assertEqual(pages[item], range(N_PAGES))
+        # end for
+
+        # Nothing after the end of an item
+        for index, (item, page, error) in enumerate(events):
+            if page is None:
+                self.assertNotIn(item, [later[0] for later in events[index + 1:]])
+            # end if
+        # end for
+
+        # Fetchers ran concurrently, one request each at most
+        self.assertGreater(self.server.max_in_flight, 1)
+        self.assertLessEqual(self.server.max_in_flight, 4)
+    # end test_stream_order
+
+    # Items not ready yet
+    def test_stream_waiting_items(self):
+        """
+        None items let the stream go on with pages while no item is ready
+        """
+        def items():
+            for index in range(5):
+                yield None
+                yield "user{}".format(index)
+            # end for
+        # end items
+
+        pages, errors, events = self.stream(items())
+        self.assertEqual(sorted(errors.keys()), ["user{}".format(index) for index in range(5)])
+        self.assertNotIn(None, [event[0] for event in events])
+    # end test_stream_waiting_items
+
+    # Nothing ready and nothing fetched
+    def test_stream_wait(self):
+        """
+        The stream waits before asking again for an item when none is ready and no page is expected
+        """
+        asked = list()
+
+        def items():
+            for index in range(3):
+                asked.append(time.time())
+                yield None
+            # end for
+            asked.append(time.time())
+            yield "user0"
+        # end items
+
+        pages, errors, events = self.stream(items(), wait=0.1)
+        self.assertEqual(pages["user0"], range(N_PAGES))
+        self.assertEqual(len(asked), 4)
+        self.assertGreaterEqual(asked[-1] - asked[0], 0.3 - 0.01)
+    # end test_stream_wait
+
+    # HTTP errors
+    def test_stream_error(self):
+        """
+        A failed request ends its item with the error, after the pages read, other items go on
+        """
+        pages, errors, events = self.stream(["user0", "fail-1", "user1"])
+        self.assertIsInstance(errors["fail-1"], urllib2.HTTPError)
+        self.assertEqual(errors["fail-1"].code, 500)
+        self.assertEqual(pages["fail-1"], [0])
+        self.assertIsNone(errors["user0"])
+        self.assertIsNone(errors["user1"])
+        self.assertEqual(pages["user1"], range(N_PAGES))
+    # end test_stream_error
+
+    # Any error
+    def test_stream_unexpected_error(self):
+        """
+        An error of any type in a page iterator ends its item instead of killing the fetcher
+        """
+        def request(item):
+            if item.startswith("broken"):
+                raise ValueError(item)
+            # end if
+            return self.request(item)
+        # end request
+
+        # More broken items than fetchers
+        items = ["broken{}".format(index) for index in range(6)] + ["user0", "user1"]
+        pages, errors, events = self.stream(items, request)
+        for index in range(6):
+            self.assertIsInstance(errors["broken{}".format(index)], ValueError)
+        # end for
+        self.assertEqual(pages["user1"], range(N_PAGES))
+    # end test_stream_unexpected_error
+
+    # Close
+    def test_close(self):
+        """
+        Close stops every fetcher thread
+        """
+        self.stream(["user0", "user1"])
+        fetchers = list(self.fetcher._fetchers)
+        self.fetcher.close()
+        self.assertTrue(all([not fetcher.is_alive() for fetcher in fetchers]))
+        self.fetcher = PageFetcher(workers=1)
+    # end test_close
+
+# end TestPageFetcher
+
+
+# Main
+if __name__ == "__main__":
+    unittest.main()
+# end if
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : tests.test_request_scheduler.py
+# Description : RequestScheduler budgets and retries.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Imports
+import time
+import unittest
+import tweepy.error
+from tanaturf.twitter.RequestScheduler import RequestScheduler
+
+
+# HTTP response of an error
+class Response(object):
+    """
+    Status code of a failed call
+    """
+
+    # Constructor
+    def __init__(self, status_code):
+        """
+        Constructor
+        :param status_code: HTTP status
+        """
+        self.status_code = status_code
+    # end __init__
+
+# end Response
+
+
+# Token pool stand-in
+class Pool(object):
+    """
+    Budget per endpoint, calls answer with their argument or fail a number of times first
+    """
+
+    # Constructor
+    def __init__(self, budgets, failures=None):
+        """
+        Constructor
+        :param budgets: Dictionary (endpoint -> number of calls)
+        :param failures: Dictionary (argument -> list of errors raised by its first calls)
+        """
+        self.budgets = dict(budgets)
+        self.failures = failures if failures is not None else dict()
+        self.calls = list()
+    # end __init__
+
+    # Call an endpoint
+    def call(self, endpoint, argument):
+        """
+        Call an endpoint
+        :param endpoint: Endpoint
+        :param argument: Argument, returned
+        :return:
+        """
+        self.budgets[endpoint] -= 1
+        self.calls.append((endpoint, argument))
+        if len(self.failures.get(argument, [])) > 0:
+            raise self.failures[argument].pop(0)
+        # end if
+        return argument
+    # end call
+
+    # Endpoint has budget
+    def available(self, endpoint):
+        """
+        Endpoint has budget
+        :param endpoint: Endpoint
+        :return:
+        """
+        return self.budgets[endpoint] > 0
+    # end available
+
+    # Next window
+    def next_reset(self, endpoint):
+        """
+        Budget comes back at once
+        :param endpoint: Endpoint
+        :return:
+        """
+        self.budgets[endpoint] = 10
+        return time.time() - 1
+    # end next_reset
+
+# end Pool
+
+
+# RequestScheduler tests
+class TestRequestScheduler(unittest.TestCase):
+    """
+    Deferred calls of two endpoints
+    """
+
+    # Budgets
+    def test_budget(self):
+        """
+        Calls of an endpoint without budget wait, the other endpoint goes on, drain runs them all
+        """
+        pool = Pool({"retweeters": 1, "lookup": 5})
+        scheduler = RequestScheduler(pool)
+        results = list()
+        for index in range(3):
+            scheduler.submit("retweeters", results.append, "r{}".format(index))
+            scheduler.submit("lookup", results.append, "l{}".format(index))
+        # end for
+        self.assertEqual(results, ["r0", "l0", "l1", "l2"])
+        self.assertEqual(scheduler.pending, 2)
+
+        scheduler.drain()
+        self.assertEqual(results[4:], ["r1", "r2"])
+    # end test_budget
+
+    # Retries
+    def test_retry(self):
+        """
+        A failed call is tried again after the others, until it failed too many times, final errors are not retried
+        """
+        pool = Pool({"retweeters": 20}, {
+            "flaky": [tweepy.error.TweepError(u"Over capacity", Response(503))],
+            "down": [tweepy.error.TweepError(u"Over capacity", Response(503)) for index in range(3)],
+            "missing": [tweepy.error.TweepError(u"Not found", Response(404))]
+        })
+        scheduler = RequestScheduler(pool, max_retries=3)
+        results = list()
+        for argument in ["flaky", "down", "missing", "fine"]:
+            scheduler.submit("retweeters", results.append, argument)
+        # end for
+
+        self.assertEqual(sorted(results), ["fine", "flaky"])
+        self.assertEqual(scheduler.pending, 0)
+        self.assertEqual(scheduler.n_failed, 2)
+        self.assertEqual([call[1] for call in pool.calls].count("down"), 3)
+        self.assertEqual([call[1] for call in pool.calls].count("missing"), 1)
+    # end test_retry
+
+# end TestRequestScheduler
+
+
+# Main
+if __name__ == "__main__":
+    unittest.main()
+# end if
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : tests.test_sqlite_connector.py
+# Description : Embedded SQLite graph storage.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Imports
+import os
+import shutil
+import tempfile
+import unittest
+from tanaturf.storage.SQLiteConnector import SQLiteConnector
+
+
+# SQLiteConnector tests
+class TestSQLiteConnector(unittest.TestCase):
+    """
+    Storage in a temporary file
+    """
+
+    # Create the storage
+    def setUp(self):
+        """
+        Create a storage with two users
+        :return:
+        """
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "graph.db")
+        self.storage = SQLiteConnector(self.path, page_size=2)
+        self.alice = self.add_user(u"alice", 200)
+        self.bob = self.add_user(u"bob", 400)
+    # end setUp
+
+    # Remove the storage
+    def tearDown(self):
+        """
+        Close and remove the storage
+        :return:
+        """
+        self.storage.db.close()
+        shutil.rmtree(self.directory)
+    # end tearDown
+
+    # Add a user
+    def add_user(self, screen_name, followers_count=100):
+        """
+        Add a user
+        :param screen_name: Screen name
+        :param followers_count: Number of followers
+        :return: User record
+        """
+        return self.storage.add_user_node(screen_name, followers_count, 1000, None, u"fr", user_id=len(screen_name))
+    # end add_user
+
+    # Reopen the storage
+    def reopen(self):
+        """
+        Open the file again, without identity maps
+        :return:
+        """
+        self.storage.flush()
+        self.storage.db.close()
+        self.storage = SQLiteConnector(self.path, page_size=2)
+    # end reopen
+
+    # Relationship count
+    def count(self, relation_type, source, target):
+        """
+        Count of a relationship
+        :param relation_type: Relationship type
+        :param source: Source record
+        :param target: Target record
+        :return: Count, None if there is no such relationship
+        """
+        row = self.storage.db.execute(
+            u"SELECT count FROM relationships WHERE type = ? AND source = ? AND target = ?",
+            (relation_type, source.id, target.id)
+        ).fetchone()
+        return row[0] if row is not None else None
+    # end count
+
+    # Node property
+    def property(self, node, name):
+        """
+        Stored property of a node
+        :param node: Node record
+        :param name: Property name
+        :return:
+        """
+        row = self.storage.db.execute(
+            u"SELECT value FROM properties WHERE node_id = ? AND name = ?",
+            (node.id, name)
+        ).fetchone()
+        return row[0] if row is not None else None
+    # end property
+
+    # Nodes
+    def test_nodes(self):
+        """
+        Nodes are created once per key, found again from the identity map or the file, and streamed by id
+        """
+        # Same node
+        self.assertIs(self.storage.get_user_node(u"alice"), self.alice)
+        self.assertEqual(self.add_user(u"alice").id, self.alice.id)
+        self.assertIsNone(self.storage.get_user_node(u"carol"))
+        self.assertEqual(self.storage.n_user_node, 2)
+
+        # Other labels do not share keys
+        hashtag = self.storage.add_hashtag_node(u"alice")
+        self.assertNotEqual(hashtag.id, self.alice.id)
+
+        # From the file
+        self.reopen()
+        alice = self.storage.get_user_node(u"alice")
+        self.assertEqual((alice.id, alice.followers_count, alice.user_id), (self.alice.id, 200, 5))
+
+        # Pages, only nodes existing when the iteration starts
+        self.add_user(u"carol")
+        pages = self.storage.iter_node_pages("TwitterUser")
+        first = next(pages)
+        self.add_user(u"dave")
+        self.assertEqual([user.screen_name for user in first], [u"alice", u"bob"])
+        self.assertEqual([[user.screen_name for user in page] for page in pages], [[u"carol"]])
+    # end test_nodes
+
+    # Properties
+    def test_properties(self):
+        """
+        Properties are stored one row each, hot ones are also set on the record
+        """
+        self.storage.set_node_properties(self.alice, last_tweet_id=42, classe=u"classified")
+        self.assertEqual(self.alice.last_tweet_id, 42)
+        self.assertEqual(self.property(self.alice, u"classe"), u"classified")
+
+        # Replaced
+        self.storage.set_node_properties(self.alice, last_tweet_id=43)
+        self.reopen()
+        self.assertEqual(self.storage.get_user_node(u"alice").last_tweet_id, 43)
+        self.assertEqual(self.storage._load_classes(), {self.alice.id: u"classified"})
+    # end test_properties
+
+    # Last tweet id
+    def test_advance_last_tweet_id(self):
+        """
+        The last tweet id only moves forward, records of other processes read the stored one
+        """
+        self.assertEqual(self.storage.advance_last_tweet_id(self.alice), -1)
+        self.assertEqual(self.storage.advance_last_tweet_id(self.alice, 42), 42)
+        self.storage.flush()
+
+        # Another process holding an older record
+        other = SQLiteConnector(self.path)
+        alice = other.get_user_node(u"alice")
+        self.assertEqual(other.advance_last_tweet_id(alice, 40), 42)
+        self.assertEqual(alice.last_tweet_id, 42)
+        other.db.close()
+    # end test_advance_last_tweet_id
+
+    # FOLLOW relationships
+    def test_follow(self):
+        """
+        FOLLOW relationships are created once, mark the follower stale, and are removed
+        """
+        self.storage.follow_relationship(self.alice, self.bob)
+        self.storage.follow_relationship(self.alice, self.bob)
+        self.assertEqual(self.count(u"FOLLOW", self.alice, self.bob), 1)
+        self.assertEqual(self.storage.db.execute(u"SELECT node_id FROM dirty").fetchall(), [(self.alice.id,)])
+
+        # Removed
+        self.storage.remove_follow_relationship(self.alice, self.bob)
+        self.storage.remove_follow_relationship(self.alice, self.bob)
+        self.assertIsNone(self.count(u"FOLLOW", self.alice, self.bob))
+    # end test_follow
+
+    # Counters
+    def test_counters(self):
+        """
+        Relationship events add up on the relationship and on the counters of both ends, kept after a flush
+        """
+        for index in range(3):
+            self.storage.retweet_relationship(self.alice, self.bob)
+        # end for
+        self.storage.quoted_relationship(self.bob, self.alice)
+        self.reopen()
+
+        self.assertEqual(self.count(u"RETWEETED", self.alice, self.bob), 3)
+        self.assertEqual(self.count(u"QUOTED", self.bob, self.alice), 1)
+        self.assertEqual(self.property(self.alice, u"retweet_out"), 3)
+        self.assertEqual(self.property(self.bob, u"retweeted_in"), 3)
+        self.assertEqual(self.property(self.alice, u"quoted_in"), 1)
+        self.assertEqual(self.storage.get_user_node(u"alice").retweet_out, 3)
+    # end test_counters
+
+    # Weights
+    def test_weights(self):
+        """
+        Weights are counts divided by the divider of the source, only for stale sources unless asked otherwise
+        """
+        carol = self.add_user(u"carol")
+        self.storage.retweet_relationship(self.alice, self.bob)
+        self.storage.retweet_relationship(self.alice, self.bob)
+        self.storage.retweet_relationship(self.alice, carol)
+        self.storage.retweet_relationship(self.alice, carol)
+        self.storage.follow_relationship(self.bob, self.alice)
+
+        # Dry run
+        statistics = self.storage.compute_weights(dry_run=True)
+        self.assertEqual(statistics[u"RETWEETED"], {'count': 2, 'min': 0.5, 'max': 0.5, 'mean': 0.5})
+        self.assertEqual(statistics[u"FOLLOW"]['max'], 1.0 / 400)
+        self.assertIsNone(self.storage.db.execute(u"SELECT weight FROM relationships WHERE type = 'RETWEETED'")
+                          .fetchone()[0])
+
+        # Write
+        self.storage.compute_weights()
+        self.assertEqual(
+            self.storage.db.execute(u"SELECT weight FROM relationships WHERE type = 'RETWEETED'").fetchall(),
+            [(0.5,), (0.5,)]
+        )
+
+        # Incremental, only alice is stale
+        self.storage.retweet_relationship(self.alice, self.bob)
+        statistics = self.storage.compute_weights()
+        self.assertEqual(statistics[u"RETWEETED"]['count'], 2)
+        self.assertEqual(statistics[u"FOLLOW"]['count'], 0)
+        self.assertEqual(self.storage.compute_weights(incremental=False)[u"FOLLOW"]['count'], 1)
+        self.assertEqual(statistics[u"RETWEETED"]['max'], 0.6)
+    # end test_weights
+
+    # Delete
+    def test_delete(self):
+        """
+        Deleted nodes go with their properties and relationships
+        """
+        self.storage.retweet_relationship(self.alice, self.bob)
+        self.storage.follow_relationship(self.bob, self.alice)
+        self.storage._delete_nodes([self.bob.id])
+        self.storage.clear_identity_maps()
+
+        self.assertIsNone(self.storage.get_user_node(u"bob"))
+        self.assertEqual(self.storage.db.execute(u"SELECT count(*) FROM relationships").fetchone()[0], 0)
+        self.assertIsNone(self.property(self.bob, u"screen_name"))
+        self.assertEqual(self.storage._load_adjacency(), ({self.alice.id: u"TwitterUser"}, []))
+    # end test_delete
+
+# end TestSQLiteConnector
+
+
+# Main
+if __name__ == "__main__":
+    unittest.main()
+# end if
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File : tests.test_tools.py
+# Description : Shuffled streams of pages.
+# Date : 21.05.2018 14:43:00
+#
+# This file is part of the Tanaturf.
+# The Tanaturf is a set of free software:
+# you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tanaturf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with Tanaturf.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Imports
+import random
+import unittest
+from tanaturf.tools.functions import shuffled_pages
+
+
+# Tools tests
+class TestTools(unittest.TestCase):
+    """
+    Shuffled pages
+    """
+
+    # Shuffled pages
+    def test_shuffled_pages(self):
+        """
+        Every element comes once, in pages of the given size, and elements of later pages can come first
+        """
+        random.seed(0)
+        firsts = set()
+        for run in range(20):
+            pages = list(shuffled_pages(iter([[0, 1], [2, 3], [4, 5], [6]]), page_size=3))
+            self.assertEqual([len(page) for page in pages], [3, 3, 1])
+            self.assertEqual(sorted([element for page in pages for element in page]), range(7))
+            firsts.add(pages[0][0])
+        # end for
+        self.assertTrue(len(firsts - set([0, 1])) > 0)
+    # end test_shuffled_pages
+
+# end TestTools
+
+
+# Main
+if __name__ == "__main__":
+    unittest.main()
+# end if